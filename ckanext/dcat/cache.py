@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+import os
+import logging
+import hashlib
+import tempfile
+import threading
+import importlib
+from collections import OrderedDict
+
+from ckantoolkit import config, asint
+
+log = logging.getLogger(__name__)
+
+SERIALIZATION_CACHE_CONFIG = 'ckanext.dcat.serialization_cache'
+SERIALIZATION_CACHE_MAX_SIZE_CONFIG = 'ckanext.dcat.serialization_cache.max_size'
+SERIALIZATION_CACHE_MAX_ITEMS_CONFIG = 'ckanext.dcat.serialization_cache.max_items'
+SERIALIZATION_CACHE_PATH_CONFIG = 'ckanext.dcat.serialization_cache.path'
+
+DEFAULT_MAX_SIZE_MB = 100
+DEFAULT_MAX_ITEMS = 1000
+
+
+class SerializationCache(object):
+    '''
+    Base class for the RDF serialization caches
+
+    Keys are tuples where the first item is the dataset id, e.g.
+    ``(dataset_id, metadata_modified, profiles, format)``, and values are
+    the serialized strings.
+
+    Custom backends can be used by extending this class and setting the
+    ``ckanext.dcat.serialization_cache`` config option to its import path
+    (eg ``ckanext.myext.cache:MyCache``).
+    '''
+
+    def get(self, key):
+        '''
+        Returns the cached value for the given key, or None if not found
+        '''
+        raise NotImplementedError
+
+    def set(self, key, value):
+        '''
+        Stores the value for the given key, evicting other entries if
+        necessary
+        '''
+        raise NotImplementedError
+
+    def invalidate(self, dataset_id):
+        '''
+        Removes all cached entries for the given dataset id
+        '''
+        raise NotImplementedError
+
+    def clear(self):
+        '''
+        Removes all cached entries
+        '''
+        raise NotImplementedError
+
+
+class MemorySerializationCache(SerializationCache):
+    '''
+    In-process LRU cache, bounded by number of entries and total size
+    '''
+
+    def __init__(self, max_size=None, max_items=None):
+        self.max_size = max_size
+        self.max_items = max_items
+        self._entries = OrderedDict()
+        self._keys_by_dataset = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        size = len(value.encode('utf-8'))
+        if self.max_size and size > self.max_size:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size)
+            self._keys_by_dataset.setdefault(key[0], set()).add(key)
+            self._size += size
+
+            while self._entries and (
+                    (self.max_items and len(self._entries) > self.max_items)
+                    or (self.max_size and self._size > self.max_size)):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, dataset_id):
+        with self._lock:
+            for key in list(self._keys_by_dataset.get(dataset_id, [])):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_dataset.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry[1]
+        dataset_keys = self._keys_by_dataset.get(key[0])
+        if dataset_keys is not None:
+            dataset_keys.discard(key)
+            if not dataset_keys:
+                del self._keys_by_dataset[key[0]]
+
+
+class DiskSerializationCache(SerializationCache):
+    '''
+    Cache stored on the local file system, bounded by total size
+
+    Entries for each dataset are stored in their own directory so they can
+    be invalidated at once. The least recently used files are removed first
+    when the size limit is reached. The cache directory can be shared by
+    different processes.
+    '''
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+        self._size = None
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def _dataset_dir(self, dataset_id):
+        return os.path.join(
+            self.path, hashlib.sha1(dataset_id.encode('utf-8')).hexdigest())
+
+    def _entry_path(self, key):
+        name = hashlib.sha1(repr(key[1:]).encode('utf-8')).hexdigest()
+        return os.path.join(self._dataset_dir(key[0]), name)
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+            # Touch the file, the modification time is used to evict the
+            # least recently used entries
+            os.utime(path)
+        except (IOError, OSError):
+            return None
+        return value
+
+    def set(self, key, value):
+        data = value.encode('utf-8')
+        if self.max_size and len(data) > self.max_size:
+            return
+
+        path = self._entry_path(key)
+        dataset_dir = os.path.dirname(path)
+        try:
+            if not os.path.isdir(dataset_dir):
+                os.makedirs(dataset_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=dataset_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except (IOError, OSError) as e:
+            log.warning('Could not write serialization cache entry: %s', e)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._current_size()
+            else:
+                self._size += len(data)
+            if self.max_size and self._size > self.max_size:
+                self._evict()
+
+    def invalidate(self, dataset_id):
+        self._remove_dir(self._dataset_dir(dataset_id))
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            self._remove_dir(os.path.join(self.path, name))
+        with self._lock:
+            self._size = 0
+
+    def _files(self):
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat
+
+    def _current_size(self):
+        return sum(stat.st_size for path, stat in self._files())
+
+    def _evict(self):
+        # Other processes may have written to the same directory, so get the
+        # actual state from disk
+        files = sorted(self._files(), key=lambda f: f[1].st_mtime)
+        size = sum(stat.st_size for path, stat in files)
+        for path, stat in files:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= stat.st_size
+        self._size = size
+
+    def _remove_dir(self, path):
+        if not os.path.isdir(path):
+            return
+        removed = 0
+        for name in os.listdir(path):
+            file_path = os.path.join(path, name)
+            try:
+                size = os.path.getsize(file_path)
+                os.remove(file_path)
+            except OSError:
+                continue
+            removed += size
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+        with self._lock:
+            if self._size is not None:
+                self._size = max(self._size - removed, 0)
+
+
+_caches = {}
+
+
+def get_serialization_cache():
+    '''
+    Returns the serialization cache configured via
+    ``ckanext.dcat.serialization_cache``, or None if caching is disabled
+
+    Supported values are ``memory``, ``disk`` or the import path to a
+    custom ``SerializationCache`` class (eg ``ckanext.myext.cache:MyCache``).
+    The same instance is returned as long as the configuration doesn't
+    change.
+    '''
+    backend = config.get(SERIALIZATION_CACHE_CONFIG)
+    if not backend:
+        return None
+
+    max_size = 1024 * 1024 * asint(
+        config.get(SERIALIZATION_CACHE_MAX_SIZE_CONFIG, DEFAULT_MAX_SIZE_MB))
+    max_items = asint(
+        config.get(SERIALIZATION_CACHE_MAX_ITEMS_CONFIG, DEFAULT_MAX_ITEMS))
+    path = config.get(SERIALIZATION_CACHE_PATH_CONFIG)
+    if not path:
+        storage_path = config.get('ckan.storage_path') or tempfile.gettempdir()
+        path = os.path.join(storage_path, 'dcat_serialization_cache')
+
+    settings = (backend, max_size, max_items, path)
+    if settings not in _caches:
+        if backend == 'memory':
+            cache = MemorySerializationCache(
+                max_size=max_size, max_items=max_items)
+        elif backend == 'disk':
+            cache = DiskSerializationCache(path, max_size=max_size)
+        else:
+            module_name, _, class_name = backend.partition(':')
+            cache_class = getattr(
+                importlib.import_module(module_name), class_name)
+            cache = cache_class()
+        _caches[settings] = cache
+
+    return _caches[settings]
+
+
+def invalidate_dataset(dataset_id):
+    '''
+    Removes all cached serializations for the given dataset, if caching is
+    enabled
+    '''
+    cache = get_serialization_cache()
+    if cache and dataset_id:
+        cache.invalidate(dataset_id)
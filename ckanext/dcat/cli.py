@@ -65,7 +65,23 @@ def _get_profiles(profiles):
 @click.option(
     "-m", "--compat_mode", is_flag=True, help="Compatibility mode (deprecated)"
 )
-def consume(input, output, format, profiles, pretty, compat_mode):
+@click.option(
+    "-j",
+    "--processes",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of worker processes used to parse the datasets in parallel",
+)
+@click.option(
+    "-d",
+    "--disk-store-threshold",
+    type=click.IntRange(min=0),
+    help="Number of triples above which the graph is stored in a temporary "
+    "database on disk rather than in memory. If not provided will be read "
+    "from config",
+)
+def consume(input, output, format, profiles, pretty, compat_mode, processes,
+            disk_store_threshold):
     """
     Parses DCAT RDF graphs into CKAN dataset JSON objects.
 
@@ -81,10 +97,12 @@ def consume(input, output, format, profiles, pretty, compat_mode):
 
     profiles = _get_profiles(profiles)
 
-    parser = RDFParser(profiles=profiles, compatibility_mode=compat_mode)
+    parser = RDFParser(profiles=profiles, compatibility_mode=compat_mode,
+                       disk_store_threshold=disk_store_threshold)
     parser.parse(contents, _format=format)
 
-    ckan_datasets = [d for d in parser.datasets()]
+    ckan_datasets = [d for d in parser.datasets(processes=processes)]
+    parser.close()
 
     indent = 4 if pretty else None
     out = json.dumps(ckan_datasets, indent=indent)
@@ -141,5 +159,33 @@ def produce(input, output, format, profiles, compat_mode):
     output.write(out)
 
 
+@dcat.command()
+@click.option(
+    "--dry-run", is_flag=True, help="List the unused files without removing them"
+)
+def purge_payloads(dry_run):
+    """
+    Removes the unused harvest object contents stored in
+    ckanext.dcat.payload_store_path.
+
+    Files referenced by current harvest objects or by the objects of
+    unfinished jobs are kept (requires ckanext-harvest).
+    """
+    from ckanext.dcat.harvesters.base import purge_payload_blobs
+
+    try:
+        removed = purge_payload_blobs(dry_run=dry_run)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    for path in removed:
+        click.echo(path)
+    click.secho(
+        "{0} {1} unused files".format(
+            "Found" if dry_run else "Removed", len(removed)),
+        fg="green",
+    )
+
+
 def get_commands():
     return [dcat]
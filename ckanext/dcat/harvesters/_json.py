@@ -1,6 +1,9 @@
 from builtins import str
+import codecs
+import io
 import json
 import logging
+import re
 from hashlib import sha1
 import traceback
 import uuid
@@ -17,6 +20,205 @@ from ckanext.dcat.harvesters.base import DCATHarvester
 
 log = logging.getLogger(__name__)
 
+JSON_WHITESPACE = ' \t\n\r'
+JSON_STRUCTURE_RE = re.compile(r'["\[\]{}]')
+JSON_STRING_RE = re.compile(r'["\\]')
+JSON_SCALAR_END_RE = re.compile(r'[,\]}\s]')
+
+
+class JSONDatasetsReader(object):
+    '''
+    Incremental reader for DCAT JSON documents
+
+    Walks the datasets of a document (either a top-level list or the
+    ``dataset`` list of a top-level object) one at a time, returning the
+    raw text of each one as found in the source. Only the dataset being
+    read and a chunk of the file are kept in memory.
+    '''
+
+    def __init__(self, content, chunk_size=1024 * 512):
+        if isinstance(content, str):
+            content = io.StringIO(content)
+        elif isinstance(content, bytes):
+            content = io.BytesIO(content)
+        self._file = content
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        char = self._peek()
+        if char == '[':
+            self._pos += 1
+            for value in self._iter_array():
+                yield value
+        elif char == '{':
+            self._pos += 1
+            for value in self._iter_object():
+                yield value
+        else:
+            raise ValueError('Wrong JSON object')
+
+        if self._peek():
+            raise ValueError('Extra data after the JSON document')
+
+    def _iter_object(self):
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                raise ValueError('Expecting property name enclosed in '
+                                 'double quotes')
+            key = json.loads(self._read_value())
+            self._expect(':')
+            if key == 'dataset':
+                char = self._peek()
+                if char == '[':
+                    self._pos += 1
+                    for value in self._iter_array():
+                        yield value
+                elif json.loads(self._read_value()) is not None:
+                    raise ValueError('Wrong JSON object')
+            else:
+                self._read_value(capture=False)
+            if self._expect(',}') == '}':
+                return
+
+    def _iter_array(self):
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._read_value()
+            if self._expect(',]') == ']':
+                return
+
+    def _read_chunk(self, keep_from):
+        '''
+        Appends the next chunk of the file to the buffer, dropping the
+        characters before ``keep_from``
+
+        Returns False if the end of the file was reached.
+        '''
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if isinstance(chunk, bytes):
+            text = self._decoder.decode(chunk, final=not chunk)
+        else:
+            text = chunk
+        if not chunk:
+            self._eof = True
+        self._buffer = self._buffer[keep_from:] + text
+        self._pos -= keep_from
+        return bool(chunk)
+
+    def _peek(self):
+        '''
+        Skips whitespace and returns the next character, or an empty string
+        at the end of the document
+        '''
+        while True:
+            buf = self._buffer
+            while self._pos < len(buf):
+                char = buf[self._pos]
+                if char not in JSON_WHITESPACE:
+                    return char
+                self._pos += 1
+            if not self._read_chunk(self._pos):
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError('Expecting one of {0!r} at character {1!r}'
+                             .format(chars, char))
+        self._pos += 1
+        return char
+
+    def _read_value(self, capture=True):
+        '''
+        Reads the next JSON value and returns its raw text
+
+        If ``capture`` is False the value is skipped without keeping it in
+        memory and None is returned.
+        '''
+        char = self._peek()
+        if not char:
+            raise ValueError('Unexpected end of JSON document')
+        if char in '[{':
+            end = self._scan(self._pos, depth=0, in_string=False,
+                             capture=capture)
+        elif char == '"':
+            end = self._scan(self._pos + 1, depth=0, in_string=True,
+                             capture=capture)
+        else:
+            end = self._scan_scalar(self._pos)
+
+        value = self._buffer[self._pos:end] if capture else None
+        self._pos = end
+        return value
+
+    def _scan_scalar(self, index):
+        while True:
+            match = JSON_SCALAR_END_RE.search(self._buffer, index)
+            if match:
+                return match.start()
+            keep_from = self._pos
+            index = len(self._buffer)
+            if not self._read_chunk(keep_from):
+                return len(self._buffer)
+            index -= keep_from
+
+    def _scan(self, index, depth, in_string, capture):
+        '''
+        Returns the buffer position where the container or string that
+        starts at the current position ends
+        '''
+        while True:
+            buf = self._buffer
+            while index < len(buf):
+                if in_string:
+                    match = JSON_STRING_RE.search(buf, index)
+                    if not match:
+                        index = len(buf)
+                        break
+                    if match.group() == '\\':
+                        # Skip the escaped character
+                        index = match.end() + 1
+                        continue
+                    index = match.end()
+                    in_string = False
+                    if depth == 0:
+                        return index
+                else:
+                    match = JSON_STRUCTURE_RE.search(buf, index)
+                    if not match:
+                        index = len(buf)
+                        break
+                    char = match.group()
+                    index = match.end()
+                    if char == '"':
+                        in_string = True
+                    elif char in '[{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return index
+
+            # Read more data, dropping what is already scanned if the value
+            # is not being captured
+            keep_from = self._pos
+            if not capture:
+                keep_from = min(index, len(buf))
+            if not self._read_chunk(keep_from):
+                raise ValueError('Unexpected end of JSON document')
+            index -= keep_from
+
 
 class DCATJSONHarvester(DCATHarvester):
 
@@ -29,32 +231,29 @@ class DCATJSONHarvester(DCATHarvester):
         }
 
     def _get_guids_and_datasets(self, content):
+        '''
+        Yields the identifier and raw JSON text of each dataset in the
+        document
 
-        doc = json.loads(content)
-
-        if isinstance(doc, list):
-            # Assume a list of datasets
-            datasets = doc
-        elif isinstance(doc, dict):
-            datasets = doc.get('dataset', [])
-        else:
-            raise ValueError('Wrong JSON object')
+        ``content`` can be a string or a file-like object, which is read
+        incrementally so the whole document is never loaded in memory.
+        '''
 
-        for dataset in datasets:
+        for as_string in JSONDatasetsReader(content, self.CHUNK_SIZE):
 
-            as_string = json.dumps(dataset)
+            dataset = json.loads(as_string)
 
             # Get identifier
             guid = dataset.get('identifier')
             if not guid:
                 # This is bad, any ideas welcomed
-                guid = sha1(as_string).hexdigest()
+                guid = sha1(as_string.encode('utf-8')).hexdigest()
 
             yield guid, as_string
 
     def _get_package_dict(self, harvest_object):
 
-        content = harvest_object.content
+        content = self._get_object_content(harvest_object)
 
         dcat_dict = json.loads(content)
 
@@ -80,106 +279,185 @@ class DCATJSONHarvester(DCATHarvester):
         guids_in_db = list(guid_to_package_id.keys())
         guids_in_source = []
 
+        skip_unchanged = self._skip_unchanged_datasets()
+        current_fingerprints = {}
+        if skip_unchanged:
+            current_fingerprints = self._get_current_fingerprints(harvest_job)
+
         # Get file contents
         url = harvest_job.source.url
 
-        previous_guids = []
-        page = 1
-        while True:
-
-            try:
-                content, content_type = \
-                    self._get_content_and_type(url, harvest_job, page)
-            except requests.exceptions.HTTPError as error:
-                if error.response.status_code == 404:
-                    if page > 1:
-                        # Server returned a 404 after the first page, no more
-                        # records
-                        log.debug('404 after first page, no more pages')
-                        break
+        source_config = {}
+        if harvest_job.source.config:
+            source_config = json.loads(harvest_job.source.config)
+        prefetcher = self._get_page_prefetcher(harvest_job, source_config)
+        finished = False
+        try:
+            previous_guids = []
+            page = 1
+            while True:
+
+                try:
+                    if prefetcher is not None and page > 2:
+                        # The second page had different datasets, so the
+                        # source is paginated. Download the following pages
+                        # in the background
+                        for next_page in range(page, page + prefetcher.concurrency):
+                            if next_page not in prefetcher:
+                                prefetcher.schedule(
+                                    next_page, url, next_page,
+                                    page_state=self._get_page_state(
+                                        self._get_page_url(url, next_page),
+                                        harvest_job))
+                        _, page_state, content_file, content_type = \
+                            prefetcher.get(page)
                     else:
-                        # Proper 404
-                        msg = 'Could not get content. Server responded with ' \
-                            '404 Not Found'
-                        self._save_gather_error(msg, harvest_job)
-                        return None
-                else:
-                    # This should never happen. Raising just in case.
-                    raise
-
-            if not content:
-                return None
-
-            try:
-
-                batch_guids = []
-                for guid, as_string in self._get_guids_and_datasets(content):
-
-                    log.debug('Got identifier: {0}'
-                              .format(guid.encode('utf8')))
-                    batch_guids.append(guid)
-
-                    if guid not in previous_guids:
-
-                        if guid in guids_in_db:
-                            # Dataset needs to be udpated
-                            obj = HarvestObject(
-                                guid=guid, job=harvest_job,
-                                package_id=guid_to_package_id[guid],
-                                content=as_string,
-                                extras=[HarvestObjectExtra(key='status',
-                                                           value='change')])
+                        page_state = self._get_page_state(
+                            self._get_page_url(url, page), harvest_job)
+                        content_file, content_type = \
+                            self._get_content_file_and_type(
+                                url, harvest_job, page, page_state=page_state)
+                except requests.exceptions.HTTPError as error:
+                    if error.response.status_code == 404:
+                        if page > 1:
+                            # Server returned a 404 after the first page, no more
+                            # records
+                            log.debug('404 after first page, no more pages')
+                            break
                         else:
-                            # Dataset needs to be created
-                            obj = HarvestObject(
-                                guid=guid, job=harvest_job,
-                                content=as_string,
-                                extras=[HarvestObjectExtra(key='status',
-                                                           value='new')])
-                        obj.save()
-                        ids.append(obj.id)
-
-                if len(batch_guids) > 0:
+                            # Proper 404
+                            msg = 'Could not get content. Server responded with ' \
+                                '404 Not Found'
+                            self._save_gather_error(msg, harvest_job)
+                            return None
+                    else:
+                        # This should never happen. Raising just in case.
+                        raise
+
+                if page_state and page_state['not_modified']:
+                    # The page has not changed since the last job, keep the
+                    # datasets found in it
+                    log.debug('Page %s not modified, skipping %d datasets',
+                              page_state['url'], len(page_state['guids']))
+                    batch_guids = page_state['guids']
+                    if not batch_guids:
+                        break
                     guids_in_source.extend(set(batch_guids)
                                            - set(previous_guids))
-                else:
-                    log.debug('Empty document, no more records')
-                    # Empty document, no more ids
-                    break
+                    if sorted(previous_guids) == sorted(batch_guids):
+                        break
+                    page = page + 1
+                    previous_guids = batch_guids
+                    continue
+
+                if content_file is None:
+                    return None
+                if not content_file.read(1):
+                    content_file.close()
+                    return None
+                content_file.seek(0)
+
+                try:
+
+                    batch_guids = []
+                    # The file is parsed incrementally, one dataset at a time
+                    for guid, as_string in \
+                            self._get_guids_and_datasets(content_file):
+
+                        log.debug('Got identifier: {0}'
+                                  .format(guid.encode('utf8')))
+                        batch_guids.append(guid)
+
+                        if guid not in previous_guids:
+
+                            extras = self._get_page_state_extras(page_state)
+                            if skip_unchanged:
+                                fingerprint = self._get_dataset_fingerprint(
+                                    json.loads(as_string))
+                                if self._is_dataset_unchanged(
+                                        guid, fingerprint,
+                                        self._get_page_state_url(page_state),
+                                        current_fingerprints):
+                                    log.debug('Dataset {0} not changed, skipping'
+                                              .format(guid))
+                                    continue
+                                extras.append(HarvestObjectExtra(
+                                    key='fingerprint', value=fingerprint))
+
+                            if guid in guids_in_db:
+                                # Dataset needs to be udpated
+                                obj = HarvestObject(
+                                    guid=guid, job=harvest_job,
+                                    package_id=guid_to_package_id[guid],
+                                    content=self._encode_payload(as_string),
+                                    extras=[HarvestObjectExtra(key='status',
+                                                               value='change')]
+                                    + extras)
+                            else:
+                                # Dataset needs to be created
+                                obj = HarvestObject(
+                                    guid=guid, job=harvest_job,
+                                    content=self._encode_payload(as_string),
+                                    extras=[HarvestObjectExtra(key='status',
+                                                               value='new')]
+                                    + extras)
+                            obj.save()
+                            ids.append(obj.id)
+
+                    if len(batch_guids) > 0:
+                        guids_in_source.extend(set(batch_guids)
+                                               - set(previous_guids))
+                    else:
+                        log.debug('Empty document, no more records')
+                        # Empty document, no more ids
+                        break
 
-            except ValueError as e:
-                msg = 'Error parsing file: {0}'.format(str(e))
-                self._save_gather_error(msg, harvest_job)
-                return None
+                except ValueError as e:
+                    msg = 'Error parsing file: {0}'.format(str(e))
+                    self._save_gather_error(msg, harvest_job)
+                    return None
+                finally:
+                    content_file.close()
 
-            if sorted(previous_guids) == sorted(batch_guids):
-                # Server does not support pagination or no more pages
-                log.debug('Same content, no more pages')
-                break
+                if sorted(previous_guids) == sorted(batch_guids):
+                    # Server does not support pagination or no more pages
+                    log.debug('Same content, no more pages')
+                    break
 
-            page = page + 1
+                page = page + 1
 
-            previous_guids = batch_guids
+                previous_guids = batch_guids
 
-        # Check datasets that need to be deleted
-        guids_to_delete = set(guids_in_db) - set(guids_in_source)
-        for guid in guids_to_delete:
-            obj = HarvestObject(
-                guid=guid, job=harvest_job,
-                package_id=guid_to_package_id[guid],
-                extras=[HarvestObjectExtra(key='status', value='delete')])
-            ids.append(obj.id)
-            model.Session.query(HarvestObject).\
-                filter_by(guid=guid).\
-                update({'current': False}, False)
-            obj.save()
+            # Check datasets that need to be deleted
+            guids_to_delete = set(guids_in_db) - set(guids_in_source)
+            ids.extend(self._save_harvest_objects_for_deletion(
+                guids_to_delete, guid_to_package_id, harvest_job))
 
-        return ids
+            finished = True
+            return ids
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+            if not finished and ids:
+                # The objects are saved while the document is read, remove
+                # them if the gather stage failed, as they would be left
+                # behind without being imported
+                log.info('Removing %d harvest objects saved before the '
+                         'gather stage of job %s failed', len(ids),
+                         harvest_job.id)
+                model.Session.rollback()
+                self._delete_harvest_objects(ids)
 
     def fetch_stage(self, harvest_object):
         return True
 
     def import_stage(self, harvest_object):
+        try:
+            return self._import_object(harvest_object)
+        finally:
+            self._end_object_import(harvest_object)
+
+    def _import_object(self, harvest_object):
         log.debug('In DCATJSONHarvester import_stage')
         if not harvest_object:
             log.error('No harvest object received')
@@ -208,11 +486,12 @@ class DCATJSONHarvester(DCATHarvester):
                 harvest_object, 'Import')
             return False
 
+        # Lookups for all the objects of the job, loaded once
+        import_index = self._get_import_index(harvest_object)
+
         # Get the last harvested object (if any)
-        previous_object = model.Session.query(HarvestObject) \
-            .filter(HarvestObject.guid == harvest_object.guid) \
-            .filter(HarvestObject.current == True) \
-            .first()
+        previous_object = self._get_previous_object(harvest_object,
+                                                    import_index)
 
         # Flag previous object as not current anymore
         if previous_object and not self.force_import:
@@ -230,7 +509,8 @@ class DCATJSONHarvester(DCATHarvester):
         # copy across resource ids from the existing dataset, otherwise they'll
         # be recreated with new ids
         if status == 'change':
-            existing_dataset = self._get_existing_dataset(harvest_object.guid)
+            existing_dataset = self._get_existing_dataset(harvest_object.guid,
+                                                          import_index)
             if existing_dataset:
                 copy_across_resource_ids(existing_dataset, package_dict)
 
@@ -241,17 +521,17 @@ class DCATJSONHarvester(DCATHarvester):
                                                 harvest_object)
         # Unless already set by an extension, get the owner organization (if
         # any) from the harvest source dataset
+        import_context = self._get_import_context(harvest_object)
         if not package_dict.get('owner_org'):
-            source_dataset = model.Package.get(harvest_object.source.id)
-            if source_dataset.owner_org:
-                package_dict['owner_org'] = source_dataset.owner_org
+            if import_context.source_owner_org:
+                package_dict['owner_org'] = import_context.source_owner_org
 
         # Flag this object as the current one
         harvest_object.current = True
         harvest_object.add()
 
         context = {
-            'user': self._get_user_name(),
+            'user': import_context.user_name,
             'return_id_only': True,
             'ignore_auth': True,
         }
@@ -283,17 +563,21 @@ class DCATJSONHarvester(DCATHarvester):
                 action = 'package_create' if status == 'new' else 'package_update'
                 message_status = 'Created' if status == 'new' else 'Updated'
 
-                package_id = p.toolkit.get_action(action)(context, package_dict)
+                package_id = p.toolkit.get_action(action)(
+                    context, package_dict)
+                self._add_pending_search_commit(import_context, package_id)
                 log.info('%s dataset with id %s', message_status, package_id)
 
         except Exception as e:
-            dataset = json.loads(harvest_object.content)
+            dataset = json.loads(self._get_object_content(harvest_object))
             dataset_name = dataset.get('name', '')
 
             self._save_object_error('Error importing dataset %s: %r / %s' % (dataset_name, e, traceback.format_exc()), harvest_object, 'Import')
             return False
 
         finally:
+            if import_index is not None:
+                import_index.discard(harvest_object.guid)
             model.Session.commit()
 
         return True
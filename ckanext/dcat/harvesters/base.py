@@ -1,33 +1,516 @@
 import os
+import re
+import json
+import lzma
+import zlib
+import base64
+import binascii
+import hashlib
 import logging
+import datetime
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import rdflib
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import aliased
 
 from ckan import plugins as p
 from ckan import model
+import ckan.lib.plugins as lib_plugins
+from ckan.lib import search
 
 from ckantoolkit import config
 import ckan.plugins.toolkit as toolkit
 
 from ckanext.harvest.harvesters import HarvesterBase
-from ckanext.harvest.model import HarvestObject
+from ckanext.harvest.model import HarvestJob, HarvestObject, HarvestObjectExtra
 
 from ckanext.dcat.interfaces import IDCATRDFHarvester
+from ckanext.dcat.processors import RDFParser
 
 
 log = logging.getLogger(__name__)
 
+# Identifiers of blank nodes generated by rdflib, which are different every
+# time a graph is parsed
+BNODE_ID_RE = re.compile(r'\b[nN][0-9a-f]{32}(?:b\d+)?\b')
+
+# Numeric page parameter in paginated urls
+PAGE_PARAM_RE = re.compile(r'([?&]page=)(\d+)(?=&|#|$)')
+
+# Prefix of the harvest object contents encoded by the harvesters (see
+# DCATHarvester._encode_payload)
+PAYLOAD_PREFIX_RE = re.compile(r'^dcat-(zlib|lzma|blob):')
+
+PAYLOAD_ENCODINGS = {
+    'none': (lambda data: data, lambda data: data),
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+class PagePrefetcher(object):
+    '''
+    Downloads pages of a harvest source in background threads, so they are
+    ready when the gather stage gets to them
+
+    Pages are identified by a key (eg their url or page number), and at
+    most ``concurrency`` of them can be scheduled at the same time. Their
+    results are collected with ``get()``, which saves any download error in
+    the calling thread. Scheduled pages that are not collected are discarded
+    when calling ``discard()`` or ``close()``.
+
+    Each download uses a `requests` session of its own, taken from a pool
+    of ``concurrency`` sessions, as sessions are not thread safe.
+    '''
+
+    def __init__(self, harvester, harvest_job, concurrency):
+        self.harvester = harvester
+        self.harvest_job = harvest_job
+        self.concurrency = concurrency
+        self._pages = OrderedDict()
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='dcat-page-prefetch')
+
+        # Create the sessions in this thread, so the database and the
+        # update_session extension point are not accessed from the
+        # download threads
+        harvester._get_session(harvest_job)
+        self._sessions = Queue()
+        for i in range(concurrency):
+            self._sessions.put(harvester._create_session())
+
+    def __contains__(self, key):
+        return key in self._pages
+
+    def is_full(self):
+        return len(self._pages) >= self.concurrency
+
+    def schedule(self, key, url, page=1, content_type=None, page_state=None):
+        '''
+        Starts downloading the given url in the background, unless the page
+        is already scheduled or there are too many pages scheduled
+
+        If the url is empty, the page will be returned without content.
+        Returns True if the page was scheduled.
+        '''
+        if key in self._pages or self.is_full():
+            return False
+
+        future = None
+        if url:
+            future = self._executor.submit(
+                self._download, url, page, content_type, page_state)
+        self._pages[key] = (url, page_state, future)
+
+        return True
+
+    def _download(self, url, page, content_type, page_state):
+        session = self._sessions.get()
+        try:
+            return self.harvester._download_content(
+                url, self.harvest_job, page, content_type, page_state,
+                session=session)
+        finally:
+            self._sessions.put(session)
+
+    def get(self, key):
+        '''
+        Returns a tuple with the url, page state, content file and content
+        type of a scheduled page, waiting for it to be downloaded if needed
+
+        Exceptions raised while downloading the page are raised again.
+        '''
+        url, page_state, future = self._pages.pop(key)
+        if future is None:
+            return url, page_state, None, None
+
+        content, content_type, error = future.result()
+        if error:
+            self.harvester._save_gather_error(error, self.harvest_job)
+
+        return url, page_state, content, content_type
+
+    def discard(self):
+        '''
+        Discards all the scheduled pages, closing the downloaded files
+        '''
+        while self._pages:
+            key, (url, page_state, future) = self._pages.popitem(last=False)
+            if future is None or future.cancel():
+                continue
+            try:
+                content = future.result()[0]
+            except Exception:
+                continue
+            if content is not None:
+                content.close()
+
+    def close(self):
+        self.discard()
+        self._executor.shutdown(wait=True)
+        while not self._sessions.empty():
+            self._sessions.get().close()
+
+
+class GatherCheckpoint(object):
+    '''
+    Pages already processed by the gather stage of a harvest job, so it can
+    resume after the last one if the job is gathered again
+
+    Each page is appended to a file as a line of JSON with the url of the
+    page, the url of the next one and the guids, names and harvest object
+    ids of the datasets found in it. A last line that was not completely
+    written (eg because the process was killed) is ignored and removed.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = []
+        self.guids = set()
+        self.names = []
+        self.object_ids = []
+
+        if not os.path.exists(path):
+            return
+
+        valid_length = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    page = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self._add(page)
+                valid_length += len(line)
+        if valid_length != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(valid_length)
+
+    def __bool__(self):
+        return bool(self.pages)
+
+    __nonzero__ = __bool__
+
+    @property
+    def next_page_url(self):
+        return self.pages[-1]['next_page_url'] if self.pages else None
+
+    @property
+    def first_page_hash(self):
+        for page in self.pages:
+            if page.get('content_hash'):
+                return page['content_hash']
+        return None
+
+    def _add(self, page):
+        self.pages.append(page)
+        self.guids.update(page['guids'])
+        self.names.extend(page['names'])
+        self.object_ids.extend(page['object_ids'])
+
+    def add_page(self, url, next_page_url, guids, names, object_ids,
+                 content_hash=None):
+        '''
+        Records a processed page, once all its harvest objects are saved
+        '''
+        page = {
+            'url': url,
+            'next_page_url': next_page_url,
+            'content_hash': content_hash,
+            'guids': sorted(guids),
+            'names': list(names),
+            'object_ids': list(object_ids),
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write((json.dumps(page) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        self._add(page)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.pages = []
+        self.guids = set()
+        self.names = []
+        self.object_ids = []
+
+
+class ImportIndex(object):
+    '''
+    Lookups used when importing the objects of a harvest job, loaded with a
+    few queries for all the guids of the job rather than once per object
+
+    It maps each guid to the current harvest object with that guid and to
+    the existing dataset (id, name and resources) with that guid. Guids are
+    removed with ``discard()`` once their object has been imported, after
+    which they are looked up in the database again.
+    '''
+
+    QUERY_CHUNK_SIZE = 1000
+
+    def __init__(self, harvest_job_id):
+        self.harvest_job_id = harvest_job_id
+        self._current_objects = {}
+        self._datasets = {}
+
+        guids = [guid for guid, in model.Session.query(HarvestObject.guid)
+                 .filter(HarvestObject.harvest_job_id == harvest_job_id)
+                 .filter(HarvestObject.guid.isnot(None))
+                 .distinct()]
+        self._guids = set(guids)
+
+        for chunk in self._chunks(guids):
+            query = model.Session.query(HarvestObject.guid, HarvestObject.id) \
+                .filter(HarvestObject.current == True) \
+                .filter(HarvestObject.guid.in_(chunk))
+            for guid, object_id in query:
+                self._current_objects.setdefault(guid, object_id)
+
+        packages = {}
+        for chunk in self._chunks(guids):
+            query = model.Session.query(
+                model.PackageExtra.value, model.Package.id, model.Package.name) \
+                .join(model.Package,
+                      model.Package.id == model.PackageExtra.package_id) \
+                .filter(model.PackageExtra.key == 'guid') \
+                .filter(model.PackageExtra.value.in_(chunk)) \
+                .filter(model.Package.state == 'active')
+            for guid, package_id, name in query:
+                if guid in self._datasets:
+                    log.error('Found more than one dataset with the same '
+                              'guid: {0}'.format(guid))
+                    continue
+                dataset = {'id': package_id, 'name': name, 'resources': []}
+                self._datasets[guid] = dataset
+                packages[package_id] = dataset
+
+        for chunk in self._chunks(list(packages.keys())):
+            query = model.Session.query(model.Resource) \
+                .filter(model.Resource.package_id.in_(chunk)) \
+                .filter(model.Resource.state == 'active') \
+                .order_by(model.Resource.package_id, model.Resource.position)
+            for resource in query:
+                resource_dict = dict(resource.extras or {})
+                resource_dict.update({
+                    'id': resource.id,
+                    'url': resource.url,
+                    'name': resource.name,
+                    'format': resource.format,
+                    'description': resource.description,
+                })
+                packages[resource.package_id]['resources'].append(
+                    resource_dict)
+
+    def _chunks(self, values):
+        for i in range(0, len(values), self.QUERY_CHUNK_SIZE):
+            yield values[i:i + self.QUERY_CHUNK_SIZE]
+
+    def __contains__(self, guid):
+        return guid in self._guids
+
+    def get_current_object(self, guid):
+        '''
+        Returns the current harvest object with the given guid, or None
+        '''
+        object_id = self._current_objects.get(guid)
+        if object_id is None:
+            return None
+        return model.Session.query(HarvestObject).get(object_id)
+
+    def get_dataset(self, guid):
+        '''
+        Returns a dict with the id, name and resources of the existing
+        dataset with the given guid, or None
+        '''
+        return self._datasets.get(guid)
+
+    def discard(self, guid):
+        self._guids.discard(guid)
+        self._current_objects.pop(guid, None)
+        self._datasets.pop(guid, None)
+
+
+class ImportContext(object):
+    '''
+    Values needed to import each object of a harvest job that are the same
+    for all of them, computed once per job
+
+    It holds the site user name, the owner organization of the harvest
+    source dataset, the ``IDCATRDFHarvester`` implementations, the
+    package schemas, as modified by these plugins, and the parser for
+    stored dataset descriptions.
+    '''
+
+    def __init__(self, harvester, harvest_job_id, harvest_source_id):
+        self.harvest_job_id = harvest_job_id
+        self.user_name = harvester._get_user_name()
+        self.harvester_plugins = list(
+            p.PluginImplementations(IDCATRDFHarvester))
+
+        source_dataset = None
+        if harvest_source_id:
+            source_dataset = model.Package.get(harvest_source_id)
+        self.source_owner_org = (
+            source_dataset.owner_org if source_dataset else None)
+
+        self._package_schemas = {}
+
+        # Ids of the datasets sent to the search index since its last commit
+        self.pending_search_ids = set()
+
+        self._rdf_parser = None
+
+    def get_rdf_parser(self):
+        '''
+        Returns the ``RDFParser`` used to parse the dataset descriptions
+        stored with the harvest objects, created the first time it is needed
+        '''
+        if self._rdf_parser is None:
+            self._rdf_parser = RDFParser()
+        return self._rdf_parser
+
+    def get_package_schema(self, package_type, action):
+        '''
+        Returns the schema used to create (``action='create'``) or update
+        (``action='update'``) datasets of the given type
+
+        The schema returned is a copy, so it can be modified by the caller.
+        '''
+        key = (package_type, action)
+        if key not in self._package_schemas:
+            package_plugin = lib_plugins.lookup_package_plugin(package_type)
+            if action == 'create':
+                schema = package_plugin.create_package_schema()
+                for harvester in self.harvester_plugins:
+                    schema = harvester.update_package_schema_for_create(schema)
+            else:
+                schema = package_plugin.update_package_schema()
+                for harvester in self.harvester_plugins:
+                    schema = harvester.update_package_schema_for_update(schema)
+            self._package_schemas[key] = schema
+
+        return dict(self._package_schemas[key])
+
 
 class DCATHarvester(HarvesterBase):
 
     DEFAULT_MAX_FILE_SIZE_MB = 50
     CHUNK_SIZE = 1024 * 512
+    # Downloaded files bigger than this are stored on disk rather than in
+    # memory
+    SPOOL_MAX_SIZE = 1024 * 1024 * 5
+    DEFAULT_GATHER_BATCH_SIZE = 500
+    DEFAULT_HTTP_RETRIES = 0
+    DEFAULT_HTTP_BACKOFF_FACTOR = 0.5
+    HTTP_RETRY_STATUSES = [429, 500, 502, 503, 504]
+    # Number of jobs whose import index and context are kept in memory,
+    # for workers importing the objects of several jobs at the same time
+    IMPORT_CACHE_SIZE = 4
+    # Harvest object extras used to store the validators of the page where
+    # each dataset was found, mapped to the keys in the page state dict
+    PAGE_STATE_EXTRAS = {
+        'page_url': 'url',
+        'page_etag': 'etag',
+        'page_last_modified': 'last_modified',
+        'page_next_url': 'next_page_url',
+        'page_hash': 'content_hash',
+    }
 
     force_import = False
 
+    _session = None
+    _session_job_id = None
+    _session_skip_head = False
+    # Guards _session_skip_head, which is also set by the threads of the
+    # PagePrefetcher
+    _session_lock = threading.Lock()
+
+    _import_indexes = None
+    _import_contexts = None
+
+    def validate_config(self, source_config):
+        if not source_config:
+            return source_config
+
+        source_config_obj = json.loads(source_config)
+        if 'gather_concurrency' in source_config_obj:
+            gather_concurrency = source_config_obj['gather_concurrency']
+            if (not isinstance(gather_concurrency, int)
+                    or isinstance(gather_concurrency, bool)
+                    or gather_concurrency < 1):
+                raise ValueError('gather_concurrency must be a positive integer')
+
+        return source_config
+
+    def _get_session(self, harvest_job):
+        '''
+        Returns the `requests` session used for all requests of a harvest
+        job, creating it on the first request
+
+        Reusing the session keeps the connections to the remote server open
+        between pages. Failed requests are retried if
+        ``ckanext.dcat.http_retries`` is set, waiting an increasing time
+        between attempts based on ``ckanext.dcat.http_backoff_factor``. The
+        session is passed to ``IDCATRDFHarvester.update_session`` once per
+        job.
+        '''
+        job_id = getattr(harvest_job, 'id', None)
+        if (self._session is not None and job_id
+                and job_id == self._session_job_id):
+            return self._session
+
+        if self._session is not None:
+            self._session.close()
+
+        self._session = self._create_session()
+        self._session_job_id = job_id
+        with self._session_lock:
+            self._session_skip_head = False
+
+        return self._session
+
+    def _create_session(self):
+        '''
+        Returns a new `requests` session, configured with the retry options
+        and passed to ``IDCATRDFHarvester.update_session``
+        '''
+        session = requests.Session()
+
+        retries = toolkit.asint(config.get(
+            'ckanext.dcat.http_retries', self.DEFAULT_HTTP_RETRIES))
+        if retries > 0:
+            backoff_factor = float(config.get(
+                'ckanext.dcat.http_backoff_factor',
+                self.DEFAULT_HTTP_BACKOFF_FACTOR))
+            adapter = HTTPAdapter(max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=self.HTTP_RETRY_STATUSES,
+                allowed_methods=['HEAD', 'GET'],
+                raise_on_status=False,
+            ))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        for harvester in p.PluginImplementations(IDCATRDFHarvester):
+            session = harvester.update_session(session)
+
+        return session
+
     def _get_content_and_type(self, url, harvest_job, page=1,
-                              content_type=None):
+                              content_type=None, page_state=None):
         '''
         Gets the content and type of the given url.
 
@@ -35,73 +518,164 @@ class DCATHarvester(HarvesterBase):
         :param harvest_job: the job, used for error reporting
         :param page: adds paging to the url
         :param content_type: will be returned as type
+        :param page_state: validators for conditional requests (see
+            ``_get_content_file_and_type``)
         :return: a tuple containing the content and content-type
         '''
+        content_file, content_type = self._get_content_file_and_type(
+            url, harvest_job, page, content_type, page_state)
+        if content_file is None:
+            return None, None
+
+        with content_file:
+            content = content_file.read().decode('utf-8')
+
+        return content, content_type
+
+    def _get_page_url(self, url, page=1):
+        '''
+        Returns the url for the given page, adding a ``page`` parameter
+        after the first one
+        '''
+        if page > 1:
+            url = url + '&' if '?' in url else url + '?'
+            url = url + 'page={0}'.format(page)
+        return url
+
+    def _get_content_file_and_type(self, url, harvest_job, page=1,
+                                   content_type=None, page_state=None):
+        '''
+        Gets the content of the given url as a binary file-like object,
+        and its type.
+
+        Remote files are downloaded to a temporary file, which is kept in
+        memory unless it gets bigger than ``SPOOL_MAX_SIZE``. The caller is
+        responsible for closing the returned file.
+
+        If a ``page_state`` dict is provided (see ``_get_page_state``), its
+        validators are sent as ``If-None-Match`` and ``If-Modified-Since``
+        headers and updated with the ones returned by the server. If the
+        server answers with ``304 Not Modified``, ``not_modified`` is set to
+        True in the dict and ``(None, None)`` is returned, without saving
+        any error.
+
+        :param url: a web url (starting with http) or a local path
+        :param harvest_job: the job, used for error reporting
+        :param page: adds paging to the url
+        :param content_type: will be returned as type
+        :param page_state: validators for conditional requests
+        :return: a tuple containing the content file and content-type
+        '''
+        content, content_type, error = self._download_content(
+            url, harvest_job, page, content_type, page_state)
+        if error:
+            self._save_gather_error(error, harvest_job)
+
+        return content, content_type
+
+    def _download_content(self, url, harvest_job, page=1, content_type=None,
+                          page_state=None, session=None):
+        '''
+        Downloads the given url, see ``_get_content_file_and_type``
+
+        Instead of saving errors to the database, it returns them as the
+        third item of the returned tuple, so it can be called from other
+        threads (see ``PagePrefetcher``), passing a ``session`` not used by
+        any other thread. The session for the harvest job must have been
+        created beforehand in the main thread.
+        '''
 
         if not url.lower().startswith('http'):
             # Check local file
             if os.path.exists(url):
-                with open(url, 'r') as f:
-                    content = f.read()
                 content_type = content_type or rdflib.util.guess_format(url)
-                return content, content_type
+                return open(url, 'rb'), content_type, None
             else:
-                self._save_gather_error('Could not get content for this url',
-                                        harvest_job)
-                return None, None
+                return None, None, 'Could not get content for this url'
 
+        content = None
         try:
 
-            if page > 1:
-                url = url + '&' if '?' in url else url + '?'
-                url = url + 'page={0}'.format(page)
+            url = self._get_page_url(url, page)
 
             log.debug('Getting file %s', url)
 
             # get the `requests` session object
-            session = requests.Session()
-            for harvester in p.PluginImplementations(IDCATRDFHarvester):
-                session = harvester.update_session(session)
+            if session is None:
+                session = self._get_session(harvest_job)
 
-            # first we try a HEAD request which may not be supported
-            did_get = False
-            r = session.head(url)
+            headers = {}
+            if page_state is not None:
+                page_state['not_modified'] = False
+                if page_state.get('etag'):
+                    headers['If-None-Match'] = page_state['etag']
+                if page_state.get('last_modified'):
+                    headers['If-Modified-Since'] = page_state['last_modified']
 
-            if r.status_code == 405 or r.status_code == 400:
-                r = session.get(url, stream=True)
+            # first we try a HEAD request which may not be supported. This
+            # is skipped if the server already returned the size of a
+            # previous file in the GET response, as it will be checked
+            # before downloading the file anyway
+            did_get = False
+            with self._session_lock:
+                skip_head = self._session_skip_head
+            if skip_head:
+                r = session.get(url, stream=True, headers=headers)
                 did_get = True
+            else:
+                r = session.head(url, headers=headers)
+
+                if r.status_code == 405 or r.status_code == 400:
+                    r = session.get(url, stream=True, headers=headers)
+                    did_get = True
+            if r.status_code == 304 and headers:
+                r.close()
+                page_state['not_modified'] = True
+                return None, None, None
             r.raise_for_status()
 
             max_file_size = 1024 * 1024 * toolkit.asint(config.get('ckanext.dcat.max_file_size', self.DEFAULT_MAX_FILE_SIZE_MB))
             cl = r.headers.get('content-length')
             if cl and int(cl) > max_file_size:
+                r.close()
                 msg = '''Remote file is too big. Allowed
                     file size: {allowed}, Content-Length: {actual}.'''.format(
                     allowed=max_file_size, actual=cl)
-                self._save_gather_error(msg, harvest_job)
-                return None, None
+                return None, None, msg
 
             if not did_get:
-                r = session.get(url, stream=True)
+                r = session.get(url, stream=True, headers=headers)
+                if r.status_code == 304 and headers:
+                    r.close()
+                    page_state['not_modified'] = True
+                    return None, None, None
+                r.raise_for_status()
+
+            if r.headers.get('content-length'):
+                with self._session_lock:
+                    self._session_skip_head = True
+
+            if page_state is not None:
+                page_state['etag'] = r.headers.get('etag')
+                page_state['last_modified'] = r.headers.get('last-modified')
 
             length = 0
-            content = b''
+            content = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE)
             for chunk in r.iter_content(chunk_size=self.CHUNK_SIZE):
-                content = content + chunk
+                content.write(chunk)
 
                 length += len(chunk)
 
                 if length >= max_file_size:
-                    self._save_gather_error('Remote file is too big.',
-                                            harvest_job)
-                    return None, None
+                    content.close()
+                    return None, None, 'Remote file is too big.'
 
-            content = content.decode('utf-8')
+            content.seek(0)
 
             if content_type is None and r.headers.get('content-type'):
                 content_type = r.headers.get('content-type').split(";", 1)[0]
 
-            return content, content_type
+            return content, content_type, None
 
         except requests.exceptions.HTTPError as error:
             if page > 1 and error.response.status_code == 404:
@@ -110,18 +684,502 @@ class DCATHarvester(HarvesterBase):
 
             msg = 'Could not get content from %s. Server responded with %s %s'\
                 % (url, error.response.status_code, error.response.reason)
-            self._save_gather_error(msg, harvest_job)
-            return None, None
+            return None, None, msg
         except requests.exceptions.ConnectionError as error:
+            if content is not None:
+                content.close()
             msg = '''Could not get content from %s because a
                                 connection error occurred. %s''' % (url, error)
-            self._save_gather_error(msg, harvest_job)
-            return None, None
+            return None, None, msg
         except requests.exceptions.Timeout as error:
+            if content is not None:
+                content.close()
             msg = 'Could not get content from %s because the connection timed'\
                 ' out.' % url
-            self._save_gather_error(msg, harvest_job)
-            return None, None
+            return None, None, msg
+
+    def _get_page_state(self, url, harvest_job):
+        '''
+        Returns the validators (``etag`` and ``last_modified``) returned by
+        the server for the given page url in a previous job of the same
+        source, and the guids of the datasets found in it, to be used in a
+        conditional request
+
+        If ``ckanext.dcat.skip_unchanged_pages`` is enabled, the hash of the
+        page content in that job is also returned as ``content_hash``.
+
+        Validators are only returned if all the datasets gathered from the
+        page in the last job were imported successfully, otherwise the page
+        needs to be harvested again.
+
+        Returns None if both conditional requests (see
+        ``ckanext.dcat.conditional_requests``) and skipping unchanged pages
+        are disabled or the url is not remote.
+        '''
+        conditional_requests = toolkit.asbool(
+            config.get('ckanext.dcat.conditional_requests', False))
+        skip_unchanged_pages = self._skip_unchanged_pages()
+        if not conditional_requests and not skip_unchanged_pages:
+            return None
+        if not url or not url.lower().startswith('http'):
+            return None
+
+        page_state = {
+            'url': url,
+            'etag': None,
+            'last_modified': None,
+            'next_page_url': None,
+            'content_hash': None,
+            'guids': [],
+            'not_modified': False,
+        }
+
+        def page_objects_query(*columns):
+            return model.Session.query(*columns) \
+                .join(HarvestObjectExtra,
+                      HarvestObjectExtra.harvest_object_id == HarvestObject.id) \
+                .filter(HarvestObject.harvest_source_id == harvest_job.source.id) \
+                .filter(HarvestObject.harvest_job_id != harvest_job.id) \
+                .filter(HarvestObjectExtra.key == 'page_url') \
+                .filter(HarvestObjectExtra.value == url)
+
+        last_object = page_objects_query(
+            HarvestObject.id, HarvestObject.harvest_job_id) \
+            .order_by(HarvestObject.gathered.desc()) \
+            .first()
+        if not last_object:
+            return page_state
+
+        guids = set()
+        page_objects = page_objects_query(
+            HarvestObject.guid, HarvestObject.state,
+            HarvestObject.harvest_job_id) \
+            .filter(or_(HarvestObject.harvest_job_id == last_object.harvest_job_id,
+                        HarvestObject.current == True))  # noqa: E712
+        for guid, state, job_id in page_objects:
+            if job_id == last_object.harvest_job_id and state != 'COMPLETE':
+                return page_state
+            guids.add(guid)
+
+        extras = model.Session.query(
+            HarvestObjectExtra.key, HarvestObjectExtra.value) \
+            .filter(HarvestObjectExtra.harvest_object_id == last_object.id) \
+            .filter(HarvestObjectExtra.key.in_(self.PAGE_STATE_EXTRAS))
+        for key, value in extras:
+            page_state[self.PAGE_STATE_EXTRAS[key]] = value
+        page_state['guids'] = sorted(guids)
+
+        # Validators are still stored, but not sent
+        if not conditional_requests:
+            page_state['etag'] = page_state['last_modified'] = None
+        if not skip_unchanged_pages:
+            page_state['content_hash'] = None
+
+        return page_state
+
+    def _get_page_state_url(self, page_state):
+        '''
+        Returns the page url stored with the datasets found in it, which is
+        only set if the server returned any validators for the page or its
+        content hash is known
+        '''
+        if not page_state or not (
+                page_state.get('etag') or page_state.get('last_modified')
+                or page_state.get('content_hash')):
+            return None
+        return page_state['url']
+
+    def _get_page_state_extras(self, page_state):
+        '''
+        Returns the harvest object extras that store the validators and the
+        content hash of the page where the dataset was found, if known
+        '''
+        if not self._get_page_state_url(page_state):
+            return []
+
+        return [
+            HarvestObjectExtra(key=key, value=page_state[state_key])
+            for key, state_key in self.PAGE_STATE_EXTRAS.items()
+            if page_state.get(state_key)
+        ]
+
+    def _skip_unchanged_pages(self):
+        '''
+        Whether pages with the same content as in the previous job should be
+        skipped in the gather stage, without parsing them, set via
+        ``ckanext.dcat.skip_unchanged_pages``
+        '''
+        return toolkit.asbool(
+            config.get('ckanext.dcat.skip_unchanged_pages', False))
+
+    def _skip_unchanged_datasets(self):
+        '''
+        Whether datasets that have not changed since they were last imported
+        should be skipped in the gather stage, set via
+        ``ckanext.dcat.skip_unchanged_datasets``
+        '''
+        return toolkit.asbool(
+            config.get('ckanext.dcat.skip_unchanged_datasets', False))
+
+    def _get_dataset_fingerprint(self, dataset_dict):
+        '''
+        Returns a hash of the given dataset dict used to detect datasets that
+        have not changed since the previous job
+
+        The hash does not depend on the order of the keys or on the ids of
+        blank nodes in the harvested graph.
+        '''
+        content = json.dumps(dataset_dict, sort_keys=True)
+        content = BNODE_ID_RE.sub('_:b', content)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def _get_current_fingerprints(self, harvest_job):
+        '''
+        Returns the fingerprint and the page url (if any) of the current
+        harvest objects of the source, as a dict keyed by guid
+
+        Only objects that were imported successfully and whose dataset still
+        exists and is active are returned, so datasets that failed to import
+        or were deleted are gathered again.
+        '''
+        query = model.Session.query(
+            HarvestObject.guid, HarvestObjectExtra.key,
+            HarvestObjectExtra.value) \
+            .join(HarvestObjectExtra,
+                  HarvestObjectExtra.harvest_object_id == HarvestObject.id) \
+            .join(model.Package, model.Package.id == HarvestObject.package_id) \
+            .filter(HarvestObject.current == True) \
+            .filter(HarvestObject.state == 'COMPLETE') \
+            .filter(model.Package.state == 'active') \
+            .filter(HarvestObject.harvest_source_id == harvest_job.source.id) \
+            .filter(HarvestObjectExtra.key.in_(['fingerprint', 'page_url']))
+
+        fingerprints = {}
+        for guid, key, value in query:
+            fingerprints.setdefault(guid, {})[key] = value
+
+        return fingerprints
+
+    def _is_dataset_unchanged(self, guid, fingerprint, page_url,
+                              current_fingerprints):
+        '''
+        Checks if the dataset was imported with the same fingerprint and
+        from the same page in a previous job
+        '''
+        current = current_fingerprints.get(guid)
+        return bool(current
+                    and current.get('fingerprint') == fingerprint
+                    and current.get('page_url') == page_url)
+
+    def _get_gather_concurrency(self, source_config=None):
+        '''
+        Returns the number of pages of the harvest source that can be
+        downloaded at the same time, set via the ``gather_concurrency`` key of
+        the source configuration or ``ckanext.dcat.gather_concurrency``
+        '''
+        concurrency = (source_config or {}).get('gather_concurrency')
+        if concurrency is None:
+            concurrency = toolkit.asint(
+                config.get('ckanext.dcat.gather_concurrency', 1))
+        return max(concurrency, 1)
+
+    def _get_page_prefetcher(self, harvest_job, source_config=None):
+        '''
+        Returns a ``PagePrefetcher`` if pages should be downloaded
+        concurrently, or None otherwise
+        '''
+        concurrency = self._get_gather_concurrency(source_config)
+        if concurrency < 2:
+            return None
+        return PagePrefetcher(self, harvest_job, concurrency)
+
+    def _predict_page_urls(self, next_page_url, paging_info, limit):
+        '''
+        Returns the urls of up to ``limit`` pages following
+        ``next_page_url``, if they can be predicted from the pagination info
+
+        Urls can only be predicted if pages are identified by a numeric
+        ``page`` parameter, and the last page is known, either from its url
+        or the total number of items and items per page.
+        '''
+        match = PAGE_PARAM_RE.search(next_page_url or '')
+        if not match or limit < 1:
+            return []
+        next_page = int(match.group(2))
+
+        def page_url(page):
+            return '{0}{1}{2}{3}'.format(
+                next_page_url[:match.start()], match.group(1), page,
+                next_page_url[match.end():])
+
+        last_page = None
+        last_url = paging_info.get('last')
+        if last_url:
+            last_match = PAGE_PARAM_RE.search(last_url)
+            if last_match and page_url(last_match.group(2)) == last_url:
+                last_page = int(last_match.group(2))
+        elif paging_info.get('count') and paging_info.get('items_per_page'):
+            first_page = 1
+            first_match = PAGE_PARAM_RE.search(paging_info.get('first') or '')
+            if first_match:
+                first_page = int(first_match.group(2))
+            num_pages = -(-paging_info['count'] // paging_info['items_per_page'])
+            last_page = first_page + num_pages - 1
+
+        if last_page is None:
+            return []
+
+        return [
+            page_url(page) for page in
+            range(next_page + 1, min(last_page, next_page + limit) + 1)
+        ]
+
+    def _get_payload_encoding(self):
+        '''
+        Returns the compression used for the content of the harvest objects,
+        set via ``ckanext.dcat.payload_encoding`` (``none``, ``zlib`` or
+        ``lzma``)
+        '''
+        encoding = config.get('ckanext.dcat.payload_encoding') or 'none'
+        if encoding not in PAYLOAD_ENCODINGS:
+            raise ValueError(
+                'Unknown ckanext.dcat.payload_encoding: {0}'.format(encoding))
+        return encoding
+
+    def _get_payload_blob_path(self, digest, encoding):
+        directory = config.get('ckanext.dcat.payload_store_path')
+        if not directory:
+            raise ValueError('ckanext.dcat.payload_store_path is not set')
+        file_name = digest if encoding == 'none' else \
+            '{0}.{1}'.format(digest, encoding)
+        return os.path.join(directory, digest[:2], file_name)
+
+    def _encode_payload(self, content):
+        '''
+        Encodes the content of a harvest object before storing it
+
+        If ``ckanext.dcat.payload_store_path`` is set, the content
+        (compressed with ``ckanext.dcat.payload_encoding``) is stored in a
+        file of that directory named after its SHA-256 hash, so identical
+        contents are only stored once across jobs, and a reference to it is
+        returned. Otherwise, if ``ckanext.dcat.payload_encoding`` is set, the
+        compressed content is returned encoded as base64. Encoded contents
+        are prefixed with ``dcat-<encoding>:`` and decoded with
+        ``_decode_payload``.
+        '''
+        encoding = self._get_payload_encoding()
+        store_path = config.get('ckanext.dcat.payload_store_path')
+        if encoding == 'none' and not store_path:
+            return content
+
+        data = content.encode('utf-8')
+        compress = PAYLOAD_ENCODINGS[encoding][0]
+
+        if store_path:
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._get_payload_blob_path(digest, encoding)
+            if os.path.exists(path):
+                # Mark the blob as used, so it is not purged before the
+                # object referencing it is saved (see purge_payload_blobs)
+                os.utime(path)
+            else:
+                directory = os.path.dirname(path)
+                os.makedirs(directory, exist_ok=True)
+                # Write to a temporary file first so readers never see a
+                # partially written blob
+                fd, tmp_path = tempfile.mkstemp(dir=directory)
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(compress(data))
+                    os.replace(tmp_path, path)
+                except Exception:
+                    os.remove(tmp_path)
+                    raise
+            return 'dcat-blob:{0}:{1}'.format(encoding, digest)
+
+        return 'dcat-{0}:{1}'.format(
+            encoding, base64.b64encode(compress(data)).decode('ascii'))
+
+    def _decode_payload(self, content):
+        '''
+        Returns the original content of a harvest object encoded with
+        ``_encode_payload``
+
+        Contents that are not encoded (eg the ones stored before enabling
+        the encoding) are returned unchanged.
+        '''
+        if not content:
+            return content
+        match = PAYLOAD_PREFIX_RE.match(content)
+        if not match:
+            return content
+
+        kind = match.group(1)
+        value = content[match.end():]
+        try:
+            if kind == 'blob':
+                encoding, digest = value.split(':', 1)
+                path = self._get_payload_blob_path(digest, encoding)
+                with open(path, 'rb') as f:
+                    data = f.read()
+            else:
+                encoding = kind
+                data = base64.b64decode(value)
+
+            return PAYLOAD_ENCODINGS[encoding][1](data).decode('utf-8')
+        except (OSError, KeyError, binascii.Error, zlib.error,
+                lzma.LZMAError) as e:
+            raise ValueError('Could not decode content: {0!r}'.format(e))
+
+    def _get_object_content(self, harvest_object):
+        '''
+        Returns the decoded content of the given harvest object
+        '''
+        return self._decode_payload(harvest_object.content)
+
+    def _get_gather_batch_size(self):
+        '''
+        Returns the number of harvest objects saved at once during the
+        gather stage, set via ``ckanext.dcat.gather_batch_size``
+        '''
+        return max(toolkit.asint(config.get(
+            'ckanext.dcat.gather_batch_size', self.DEFAULT_GATHER_BATCH_SIZE)), 1)
+
+    def _save_harvest_objects(self, harvest_objects):
+        '''
+        Saves the provided harvest objects in bulk, using a single commit
+
+        Returns a list with the ids of the harvest objects.
+        '''
+        if not harvest_objects:
+            return []
+
+        model.Session.add_all(harvest_objects)
+        model.Session.flush()
+        # Get the ids before committing, otherwise each object would be
+        # loaded again from the database when accessing them
+        object_ids = [obj.id for obj in harvest_objects]
+        model.Session.commit()
+
+        return object_ids
+
+    def _delete_harvest_objects(self, object_ids):
+        '''
+        Deletes the provided harvest objects and their extras, in batches
+        (see ``_get_gather_batch_size``)
+
+        Used to remove the objects saved by a gather stage that failed before
+        finishing, as they will never be fetched or imported.
+        '''
+        batch_size = self._get_gather_batch_size()
+        for i in range(0, len(object_ids), batch_size):
+            ids = object_ids[i:i + batch_size]
+            model.Session.query(HarvestObjectExtra) \
+                         .filter(HarvestObjectExtra.harvest_object_id.in_(ids)) \
+                         .delete(synchronize_session=False)
+            model.Session.query(HarvestObject) \
+                         .filter(HarvestObject.id.in_(ids)) \
+                         .delete(synchronize_session=False)
+        model.Session.commit()
+
+    def _save_harvest_objects_for_deletion(self, guids_to_delete,
+                                           guid_to_package_id, harvest_job):
+        '''
+        Creates a harvest object flagged for deletion for each of the provided
+        guids, and marks all the other objects for these guids as not current
+
+        Guids are processed in batches (see ``_get_gather_batch_size``), with
+        a single update query and a bulk insert for each batch.
+
+        Returns a list with the ids of the harvest objects to delete.
+        '''
+        guids_to_delete = sorted(guids_to_delete)
+        batch_size = self._get_gather_batch_size()
+
+        object_ids = []
+        for i in range(0, len(guids_to_delete), batch_size):
+            guids = guids_to_delete[i:i + batch_size]
+
+            model.Session.query(HarvestObject) \
+                         .filter(HarvestObject.guid.in_(guids)) \
+                         .update({'current': False}, synchronize_session=False)
+
+            harvest_objects = [
+                HarvestObject(guid=guid, job=harvest_job,
+                              harvest_source_id=harvest_job.source.id,
+                              package_id=guid_to_package_id[guid],
+                              extras=[HarvestObjectExtra(key='status',
+                                                         value='delete')])
+                for guid in guids
+            ]
+            object_ids.extend(self._save_harvest_objects(harvest_objects))
+
+        return object_ids
+
+    def _get_gather_checkpoint(self, harvest_job):
+        '''
+        Returns the checkpoint of the gather stage of the given job, stored
+        in the directory set via ``ckanext.dcat.gather_checkpoint_path``, or
+        None if it is not set
+        '''
+        directory = config.get('ckanext.dcat.gather_checkpoint_path')
+        if not directory:
+            return None
+        return GatherCheckpoint(
+            os.path.join(directory, '{0}.jsonl'.format(harvest_job.id)))
+
+    def _resume_gather(self, harvest_job, checkpoint):
+        '''
+        Prepares the harvest objects of a job to resume its gather stage from
+        the given checkpoint
+
+        Objects saved after the last checkpointed page are deleted, as the
+        page will be processed again, except the ones flagged for deletion,
+        which are only created after all pages have been processed. If any
+        of the checkpointed objects no longer exists (eg because the job
+        failed and its objects were removed), the checkpoint and all the
+        objects of the job are deleted and the job starts from scratch.
+
+        Returns a list with the ids of the objects flagged for deletion that
+        were kept.
+        '''
+        status_extra = aliased(HarvestObjectExtra)
+        job_objects = dict(
+            model.Session.query(HarvestObject.id, status_extra.value)
+            .outerjoin(status_extra, and_(
+                status_extra.harvest_object_id == HarvestObject.id,
+                status_extra.key == 'status'))
+            .filter(HarvestObject.harvest_job_id == harvest_job.id))
+
+        if checkpoint and not set(checkpoint.object_ids) <= set(job_objects):
+            log.warning('Objects of gather checkpoint for job %s not found, '
+                        'starting again', harvest_job.id)
+            checkpoint.remove()
+
+        checkpoint_ids = set(checkpoint.object_ids)
+        object_ids_to_keep = []
+        object_ids_to_remove = []
+        for object_id, status in job_objects.items():
+            if object_id in checkpoint_ids:
+                continue
+            if checkpoint and status == 'delete':
+                object_ids_to_keep.append(object_id)
+            else:
+                object_ids_to_remove.append(object_id)
+
+        if object_ids_to_remove:
+            for harvest_object in model.Session.query(HarvestObject) \
+                    .filter(HarvestObject.id.in_(object_ids_to_remove)):
+                model.Session.delete(harvest_object)
+            model.Session.commit()
+
+        if checkpoint:
+            log.info('Resuming gather stage of job %s from %s (%d pages, '
+                     '%d datasets already gathered)', harvest_job.id,
+                     checkpoint.next_page_url, len(checkpoint.pages),
+                     len(checkpoint.object_ids))
+
+        return object_ids_to_keep
 
     def _get_object_extra(self, harvest_object, key):
         '''
@@ -155,6 +1213,161 @@ class DCATHarvester(HarvesterBase):
             return obj.source.url
         return None
 
+    def _get_import_index(self, harvest_object):
+        '''
+        Returns the ``ImportIndex`` of the job of the given harvest object,
+        building it when the first object of the job is imported
+
+        Returns None if ``ckanext.dcat.import_index`` is disabled.
+        '''
+        if not toolkit.asbool(config.get('ckanext.dcat.import_index', True)):
+            return None
+
+        job_id = getattr(harvest_object, 'harvest_job_id', None)
+        if not job_id:
+            return None
+
+        if self._import_indexes is None:
+            self._import_indexes = OrderedDict()
+        import_index = self._import_indexes.get(job_id)
+        if import_index is None:
+            import_index = ImportIndex(job_id)
+            self._import_indexes[job_id] = import_index
+            while len(self._import_indexes) > self.IMPORT_CACHE_SIZE:
+                self._import_indexes.popitem(last=False)
+        else:
+            self._import_indexes.move_to_end(job_id)
+
+        return import_index
+
+    def _get_import_context(self, harvest_object):
+        '''
+        Returns the ``ImportContext`` of the job of the given harvest
+        object, creating it when the first object of the job is imported
+
+        A new context is created for each job, so changes in the plugins,
+        schemas or harvest source are picked up by the following jobs.
+        '''
+        job_id = getattr(harvest_object, 'harvest_job_id', None)
+        if self._import_contexts is None:
+            self._import_contexts = OrderedDict()
+        if job_id and job_id in self._import_contexts:
+            self._import_contexts.move_to_end(job_id)
+            return self._import_contexts[job_id]
+
+        source_id = getattr(harvest_object, 'harvest_source_id', None) \
+            or harvest_object.source.id
+        import_context = ImportContext(self, job_id, source_id)
+        if job_id:
+            self._import_contexts[job_id] = import_context
+            while len(self._import_contexts) > self.IMPORT_CACHE_SIZE:
+                # Commit the datasets of the least recently imported job
+                _, evicted_context = self._import_contexts.popitem(last=False)
+                self._commit_search_index(evicted_context)
+
+        return import_context
+
+    def _get_search_commit_batch_size(self):
+        '''
+        Returns the number of imported datasets after which the search index
+        is committed, set via ``ckanext.dcat.search_commit_batch_size``
+
+        0 (the default) commits the index after each dataset. The option is
+        ignored if ``ckan.search.solr_commit`` is enabled, as CKAN commits
+        the index when each dataset is indexed anyway.
+        '''
+        if toolkit.asbool(config.get('ckan.search.solr_commit', True)):
+            return 0
+        return max(toolkit.asint(config.get(
+            'ckanext.dcat.search_commit_batch_size', 0)), 0)
+
+    def _add_pending_search_commit(self, import_context, package_id):
+        '''
+        Records a dataset created or updated during the import stage, and
+        commits the search index once for every batch of
+        ``ckanext.dcat.search_commit_batch_size`` datasets
+
+        CKAN sends the dataset to the search index when the action commits
+        the database, without committing the index if
+        ``ckan.search.solr_commit`` is disabled in the process config.
+        '''
+        batch_size = self._get_search_commit_batch_size()
+        if not batch_size:
+            return
+
+        import_context.pending_search_ids.add(package_id)
+        if (not import_context.harvest_job_id
+                or len(import_context.pending_search_ids) >= batch_size):
+            # Contexts of objects without a job are not kept
+            self._commit_search_index(import_context)
+
+    def _end_object_import(self, harvest_object):
+        '''
+        Called once each harvest object has been imported, successfully or
+        not. If it was the last object of its job, commits the datasets of
+        the job pending in the search index and drops the import index and
+        context of the job
+        '''
+        job_id = getattr(harvest_object, 'harvest_job_id', None)
+        import_indexes = self._import_indexes or {}
+        import_contexts = self._import_contexts or {}
+        if job_id not in import_indexes and job_id not in import_contexts:
+            return
+
+        if not self._is_last_job_object(harvest_object):
+            return
+
+        import_indexes.pop(job_id, None)
+        import_context = import_contexts.pop(job_id, None)
+        if import_context is not None:
+            self._commit_search_index(import_context)
+
+    def _is_last_job_object(self, harvest_object):
+        '''
+        Returns True if no other object of the job of the given harvest
+        object is waiting to be fetched or imported
+        '''
+        job_id = getattr(harvest_object, 'harvest_job_id', None)
+        if not job_id:
+            return True
+
+        pending = model.Session.query(HarvestObject.id) \
+            .filter(HarvestObject.harvest_job_id == job_id) \
+            .filter(HarvestObject.id != harvest_object.id) \
+            .filter(HarvestObject.state.in_(['WAITING', 'FETCH', 'IMPORT'])) \
+            .first()
+        return pending is None
+
+    def _commit_search_index(self, import_context):
+        '''
+        Commits the datasets recorded with ``_add_pending_search_commit``,
+        if any
+        '''
+        if not import_context.pending_search_ids:
+            return
+        log.debug('Committing %d datasets to the search index',
+                  len(import_context.pending_search_ids))
+        import_context.pending_search_ids = set()
+        try:
+            search.commit()
+        except search.SearchIndexError:
+            # The datasets are already in the index, they will be visible
+            # after the next commit
+            log.exception('Could not commit the search index')
+
+    def _get_previous_object(self, harvest_object, import_index=None):
+        '''
+        Returns the current harvest object with the same guid as the given
+        one (if any)
+        '''
+        if import_index is not None and harvest_object.guid in import_index:
+            return import_index.get_current_object(harvest_object.guid)
+
+        return model.Session.query(HarvestObject) \
+            .filter(HarvestObject.guid == harvest_object.guid) \
+            .filter(HarvestObject.current == True) \
+            .first()
+
     def _read_datasets_from_db(self, guid):
         '''
         Returns a database result of datasets matching the given guid.
@@ -168,12 +1381,16 @@ class DCATHarvester(HarvesterBase):
                                 .all()
         return datasets
 
-    def _get_existing_dataset(self, guid):
+    def _get_existing_dataset(self, guid, import_index=None):
         '''
         Checks if a dataset with a certain guid extra already exists
 
-        Returns a dict as the ones returned by package_show
+        Returns a dict as the ones returned by package_show. If an
+        ``ImportIndex`` containing the guid is provided, the dict only has
+        the id, name and resources of the dataset.
         '''
+        if import_index is not None and guid in import_index:
+            return import_index.get_dataset(guid)
 
         datasets = self._read_datasets_from_db(guid)
 
@@ -195,3 +1412,72 @@ class DCATHarvester(HarvesterBase):
         return package_dict
 
     # End hooks
+
+
+def purge_payload_blobs(dry_run=False):
+    '''
+    Removes the files of ``ckanext.dcat.payload_store_path`` that are not
+    referenced by any current harvest object or any object of an unfinished
+    job (in its content or extras)
+
+    Blobs are shared by all the objects with the same content, so they can't
+    be removed when a single object is replaced or purged. Files modified
+    after the oldest unfinished job was created are kept, as they may belong
+    to objects that have not been saved yet.
+
+    Returns the paths of the removed files (or the ones that would be
+    removed if ``dry_run`` is True)
+    '''
+    store_path = config.get('ckanext.dcat.payload_store_path')
+    if not store_path:
+        raise ValueError('ckanext.dcat.payload_store_path is not set')
+
+    started = model.Session.query(HarvestJob.created) \
+        .filter(HarvestJob.status != 'Finished') \
+        .order_by(HarvestJob.created) \
+        .first()
+    # Job dates are stored in UTC
+    keep_after = (started.created.replace(
+        tzinfo=datetime.timezone.utc).timestamp() if started
+        else time.time())
+
+    in_use = or_(HarvestObject.current == True,  # noqa: E712
+                 HarvestJob.status != 'Finished')
+    harvester = DCATHarvester()
+    referenced = set()
+    queries = [
+        model.Session.query(HarvestObject.content)
+        .join(HarvestJob, HarvestJob.id == HarvestObject.harvest_job_id)
+        .filter(HarvestObject.content.like('dcat-blob:%'))
+        .filter(in_use),
+        model.Session.query(HarvestObjectExtra.value)
+        .join(HarvestObject,
+              HarvestObject.id == HarvestObjectExtra.harvest_object_id)
+        .join(HarvestJob, HarvestJob.id == HarvestObject.harvest_job_id)
+        .filter(HarvestObjectExtra.value.like('dcat-blob:%'))
+        .filter(in_use),
+    ]
+    for query in queries:
+        for value, in query.yield_per(1000):
+            encoding, digest = value[len('dcat-blob:'):].split(':', 1)
+            referenced.add(os.path.normpath(
+                harvester._get_payload_blob_path(digest, encoding)))
+
+    removed = []
+    for directory, _, file_names in os.walk(store_path):
+        for file_name in file_names:
+            path = os.path.normpath(os.path.join(directory, file_name))
+            if path in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) >= keep_after:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except OSError:
+                continue
+            removed.append(path)
+
+    log.info('%s %d unused payload blobs from %s',
+             'Found' if dry_run else 'Removed', len(removed), store_path)
+    return removed
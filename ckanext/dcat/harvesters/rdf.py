@@ -9,8 +9,6 @@ import traceback
 import ckan.plugins as p
 import ckan.model as model
 
-import ckan.lib.plugins as lib_plugins
-
 from ckanext.harvest.model import HarvestObject, HarvestObjectExtra
 from ckanext.harvest.logic.schema import unicode_safe
 from ckanext.dcat.harvesters.base import DCATHarvester
@@ -29,7 +27,8 @@ class DCATRDFHarvester(DCATHarvester):
             'description': 'Harvester for DCAT datasets from an RDF graph'
         }
 
-    _names_taken = []
+    _names_taken = set()
+    _names_prefix_counts = {}
 
     def _get_dict_value(self, _dict, key, default=None):
         '''
@@ -51,6 +50,29 @@ class DCATRDFHarvester(DCATHarvester):
 
         return default
 
+    def _get_unique_name(self, name):
+        '''
+        Returns a name not used by any of the datasets previously gathered in
+        this job, appending a numeric suffix to the provided one if needed
+
+        The suffix is the number of names already taken that start with the
+        provided name followed by a dash, plus one.
+        '''
+        if name in self._names_taken:
+            name = '{}-{}'.format(name, self._names_prefix_counts.get(name, 0) + 1)
+
+        self._names_taken.add(name)
+
+        # Keep count of the names starting with each prefix ending before a
+        # dash, eg "a-b-c" counts for "a" and "a-b"
+        position = name.find('-')
+        while position != -1:
+            prefix = name[:position]
+            self._names_prefix_counts[prefix] = self._names_prefix_counts.get(prefix, 0) + 1
+            position = name.find('-', position + 1)
+
+        return name
+
     def _get_guid(self, dataset_dict, source_url=None):
         '''
         Try to get a unique identifier for a harvested dataset
@@ -95,8 +117,6 @@ class DCATRDFHarvester(DCATHarvester):
         Returns a list with the ids of the Harvest Objects to delete.
         '''
 
-        object_ids = []
-
         # Get all previous current guids and dataset ids for this source
         query = model.Session.query(HarvestObject.guid, HarvestObject.package_id) \
                              .filter(HarvestObject.current==True) \
@@ -106,31 +126,41 @@ class DCATRDFHarvester(DCATHarvester):
         for guid, package_id in query:
             guid_to_package_id[guid] = package_id
 
-        guids_in_db = list(guid_to_package_id.keys())
-
         # Get objects/datasets to delete (ie in the DB but not in the source)
-        guids_to_delete = set(guids_in_db) - set(guids_in_source)
+        guids_to_delete = set(guid_to_package_id.keys()) - set(guids_in_source)
 
         # Create a harvest object for each of them, flagged for deletion
-        for guid in guids_to_delete:
-            obj = HarvestObject(guid=guid, job=harvest_job,
-                                package_id=guid_to_package_id[guid],
-                                extras=[HarvestObjectExtra(key='status',
-                                                           value='delete')])
+        return self._save_harvest_objects_for_deletion(
+            guids_to_delete, guid_to_package_id, harvest_job)
 
-            # Mark the rest of objects for this guid as not current
-            model.Session.query(HarvestObject) \
-                         .filter_by(guid=guid) \
-                         .update({'current': False}, False)
-            obj.save()
-            object_ids.append(obj.id)
+    def _parse_dataset_description(self, dataset, description, import_context):
+        '''
+        Returns the dataset parsed from the description stored with a
+        harvest object, keeping the values set in the gather stage (name,
+        owner organization and guid)
+
+        As the profiles are run again, changes in them are applied when
+        importing the object again, without downloading the source.
+        '''
+        parser = import_context.get_rdf_parser()
+        parsed_dataset = parser.parse_dataset_description(description)
 
-        return object_ids
+        parsed_dataset['name'] = dataset['name']
+        if not parsed_dataset.get('owner_org') and dataset.get('owner_org'):
+            parsed_dataset['owner_org'] = dataset['owner_org']
+        parsed_dataset.setdefault('extras', []).extend(
+            extra for extra in dataset.get('extras', [])
+            if extra['key'] == 'guid')
+
+        return parsed_dataset
 
     def validate_config(self, source_config):
         if not source_config:
             return source_config
 
+        source_config = super(DCATRDFHarvester, self).validate_config(
+            source_config)
+
         source_config_obj = json.loads(source_config)
         if 'rdf_format' in source_config_obj:
             rdf_format = source_config_obj['rdf_format']
@@ -140,129 +170,399 @@ class DCATRDFHarvester(DCATHarvester):
             if rdf_format not in supported_formats:
                 raise ValueError('rdf_format should be one of: ' + ", ".join(supported_formats))
 
+        if 'streaming' in source_config_obj:
+            if not isinstance(source_config_obj['streaming'], bool):
+                raise ValueError('streaming must be a boolean')
+
+        if 'store_descriptions' in source_config_obj:
+            if not isinstance(source_config_obj['store_descriptions'], bool):
+                raise ValueError('store_descriptions must be a boolean')
+            if (source_config_obj['store_descriptions']
+                    and source_config_obj.get('streaming')):
+                raise ValueError(
+                    'store_descriptions can not be used with streaming')
+
+        if 'disk_store_threshold' in source_config_obj:
+            disk_store_threshold = source_config_obj['disk_store_threshold']
+            if (not isinstance(disk_store_threshold, int)
+                    or isinstance(disk_store_threshold, bool)
+                    or disk_store_threshold < 0):
+                raise ValueError(
+                    'disk_store_threshold must be a non negative integer')
+
+        if 'parser_processes' in source_config_obj:
+            parser_processes = source_config_obj['parser_processes']
+            if (not isinstance(parser_processes, int)
+                    or isinstance(parser_processes, bool)
+                    or parser_processes < 1):
+                raise ValueError('parser_processes must be a positive integer')
+
         return source_config
 
+    def _before_download(self, url, harvest_job):
+        '''
+        Calls the ``IDCATRDFHarvester.before_download`` extension point for
+        the given page url, saving any errors returned
+
+        Returns the url to download, or None if the gather stage should stop.
+        '''
+        for harvester in p.PluginImplementations(IDCATRDFHarvester):
+            url, before_download_errors = harvester.before_download(url, harvest_job)
+
+            for error_msg in before_download_errors:
+                self._save_gather_error(error_msg, harvest_job)
+
+            if not url:
+                return None
+
+        return url
+
+    def _prefetch_pages(self, prefetcher, parser, harvest_job, rdf_format):
+        '''
+        Schedules the download of the next page of the given parser and, if
+        their urls can be predicted, the ones that follow it
+        '''
+        paging_info = parser.pagination()
+        next_page_url = paging_info.get('next')
+        if not next_page_url:
+            return
+
+        page_urls = [next_page_url] + self._predict_page_urls(
+            next_page_url, paging_info, prefetcher.concurrency)
+        for page_url in page_urls:
+            if prefetcher.is_full():
+                break
+            if page_url in prefetcher:
+                continue
+            url = self._before_download(page_url, harvest_job)
+            page_state = self._get_page_state(url, harvest_job) if url else None
+            prefetcher.schedule(page_url, url, 1, rdf_format, page_state)
+
     def gather_stage(self, harvest_job):
 
         log.debug('In DCATRDFHarvester gather_stage')
 
         rdf_format = None
+        parser_processes = 1
+        streaming = False
+        store_descriptions = False
+        disk_store_threshold = None
+        source_config = {}
         if harvest_job.source.config:
-            rdf_format = json.loads(harvest_job.source.config).get("rdf_format")
+            source_config = json.loads(harvest_job.source.config)
+            rdf_format = source_config.get("rdf_format")
+            parser_processes = source_config.get("parser_processes", 1)
+            streaming = source_config.get("streaming", False)
+            store_descriptions = source_config.get("store_descriptions", False)
+            disk_store_threshold = source_config.get("disk_store_threshold")
 
         # Get file contents of first page
         next_page_url = harvest_job.source.url
 
-        guids_in_source = []
+        guids_in_source = set()
         object_ids = []
+        harvest_objects = []
+        batch_size = self._get_gather_batch_size()
         last_content_hash = None
-        self._names_taken = []
-
-        while next_page_url:
-            for harvester in p.PluginImplementations(IDCATRDFHarvester):
-                next_page_url, before_download_errors = harvester.before_download(next_page_url, harvest_job)
-
-                for error_msg in before_download_errors:
-                    self._save_gather_error(error_msg, harvest_job)
-
-                if not next_page_url:
-                    return []
-
-            content, rdf_format = self._get_content_and_type(next_page_url, harvest_job, 1, content_type=rdf_format)
-
-            content_hash = hashlib.md5()
-            if content:
-                content_hash.update(content.encode('utf8'))
-
-            if last_content_hash:
-                if content_hash.digest() == last_content_hash.digest():
-                    log.warning('Remote content was the same even when using a paginated URL, skipping')
-                    break
-            else:
-                last_content_hash = content_hash
-
-            # TODO: store content?
-            for harvester in p.PluginImplementations(IDCATRDFHarvester):
-                content, after_download_errors = harvester.after_download(content, harvest_job)
-
-                for error_msg in after_download_errors:
-                    self._save_gather_error(error_msg, harvest_job)
-
-            if not content:
-                return []
-
-            # TODO: profiles conf
-            parser = RDFParser()
-
-            try:
-                parser.parse(content, _format=rdf_format)
-            except RDFParserException as e:
-                self._save_gather_error('Error parsing the RDF file: {0}'.format(e), harvest_job)
-                return []
-
-            for harvester in p.PluginImplementations(IDCATRDFHarvester):
-                parser, after_parsing_errors = harvester.after_parsing(parser, harvest_job)
+        self._names_taken = set()
+        self._names_prefix_counts = {}
+
+        # Resume after the last page processed if the job was interrupted
+        checkpoint = self._get_gather_checkpoint(harvest_job)
+        resumed_object_ids = []
+        if checkpoint is not None:
+            resumed_object_ids = self._resume_gather(harvest_job, checkpoint)
+            if checkpoint:
+                next_page_url = checkpoint.next_page_url
+                guids_in_source.update(checkpoint.guids)
+                object_ids.extend(checkpoint.object_ids)
+                last_content_hash = checkpoint.first_page_hash
+                for name in checkpoint.names:
+                    self._get_unique_name(name)
+
+        skip_unchanged = self._skip_unchanged_datasets()
+        current_fingerprints = {}
+        if skip_unchanged:
+            current_fingerprints = self._get_current_fingerprints(harvest_job)
+        unchanged_count = 0
+
+        # When streaming, the next page is only known once all the datasets
+        # of the current one have been read, so pages can't be prefetched and
+        # their state can't be stored with the datasets. Pages are not
+        # prefetched either when parsing datasets in parallel, as forking the
+        # worker processes while other threads are downloading pages could
+        # leave them deadlocked
+        prefetcher = None
+        if not streaming and parser_processes <= 1:
+            prefetcher = self._get_page_prefetcher(harvest_job, source_config)
+        elif self._get_gather_concurrency(source_config) > 1:
+            log.info('Pages of source %s are not downloaded concurrently, as '
+                     'they are parsed in streaming mode or by several '
+                     'processes', harvest_job.source.id)
+        keep_checkpoint = False
+        try:
+            while next_page_url:
+                current_page_url = next_page_url
+                page_guids = set()
+                page_names = []
+                page_first_object = len(object_ids)
+
+                if prefetcher is not None and next_page_url in prefetcher:
+                    next_page_url, page_state, content, content_type = \
+                        prefetcher.get(next_page_url)
+                    if not next_page_url:
+                        return []
+                else:
+                    if prefetcher is not None:
+                        # The scheduled pages were not the following ones
+                        prefetcher.discard()
+
+                    next_page_url = self._before_download(next_page_url, harvest_job)
+                    if not next_page_url:
+                        return []
+
+                    page_state = None
+                    if not streaming:
+                        page_state = self._get_page_state(next_page_url, harvest_job)
+                    content, content_type = self._get_content_file_and_type(
+                        next_page_url, harvest_job, 1, content_type=rdf_format,
+                        page_state=page_state)
+
+                if page_state and page_state['not_modified']:
+                    # The page has not changed since the last job, keep the
+                    # datasets found in it
+                    log.debug('Page %s not modified, skipping %d datasets',
+                              next_page_url, len(page_state['guids']))
+                    guids_in_source.update(page_state['guids'])
+                    next_page_url = page_state['next_page_url']
+                    if checkpoint is not None:
+                        checkpoint.add_page(current_page_url, next_page_url,
+                                            page_state['guids'], [], [])
+                    continue
+
+                rdf_format = content_type
+
+                content_hash = hashlib.md5()
+                if content:
+                    content_length = 0
+                    for chunk in iter(lambda: content.read(self.CHUNK_SIZE), b''):
+                        content_hash.update(chunk)
+                        content_length += len(chunk)
+                    content.seek(0)
+
+                    if not content_length:
+                        content.close()
+                        content = ''
+
+                if last_content_hash:
+                    if content_hash.hexdigest() == last_content_hash:
+                        log.warning('Remote content was the same even when using a paginated URL, skipping')
+                        if hasattr(content, 'close'):
+                            content.close()
+                        break
+                else:
+                    last_content_hash = content_hash.hexdigest()
+
+                if page_state and self._skip_unchanged_pages():
+                    if content and page_state['content_hash'] == content_hash.hexdigest():
+                        # The page has the same content as in the last job,
+                        # keep the datasets found in it without parsing it
+                        log.debug('Page %s unchanged, skipping %d datasets',
+                                  next_page_url, len(page_state['guids']))
+                        content.close()
+                        guids_in_source.update(page_state['guids'])
+                        next_page_url = page_state['next_page_url']
+                        if checkpoint is not None:
+                            checkpoint.add_page(
+                                current_page_url, next_page_url,
+                                page_state['guids'], [], [],
+                                content_hash.hexdigest())
+                        continue
+                    page_state['content_hash'] = content_hash.hexdigest()
 
-                for error_msg in after_parsing_errors:
-                    self._save_gather_error(error_msg, harvest_job)
+                after_download_harvesters = list(p.PluginImplementations(IDCATRDFHarvester))
+                if after_download_harvesters and hasattr(content, 'read'):
+                    # Extensions get the content as a string
+                    with content:
+                        content = content.read().decode('utf-8')
 
-            if not parser:
-                return []
+                # TODO: store content?
+                for harvester in after_download_harvesters:
+                    content, after_download_errors = harvester.after_download(content, harvest_job)
 
-            try:
+                    for error_msg in after_download_errors:
+                        self._save_gather_error(error_msg, harvest_job)
 
-                source_dataset = model.Package.get(harvest_job.source.id)
+                if not content:
+                    return []
 
-                for dataset in parser.datasets():
-                    if not dataset.get('name'):
-                        dataset['name'] = self._gen_new_name(dataset['title'])
-                    if dataset['name'] in self._names_taken:
-                        suffix = len([i for i in self._names_taken if i.startswith(dataset['name'] + '-')]) + 1
-                        dataset['name'] = '{}-{}'.format(dataset['name'], suffix)
-                    self._names_taken.append(dataset['name'])
+                # TODO: profiles conf
+                parser = RDFParser(disk_store_threshold=disk_store_threshold)
 
-                    # Unless already set by the parser, get the owner organization (if any)
-                    # from the harvest source dataset
-                    if not dataset.get('owner_org'):
-                        if source_dataset.owner_org:
-                            dataset['owner_org'] = source_dataset.owner_org
+                try:
+                    parser.parse(content, _format=rdf_format, streaming=streaming)
+                except RDFParserException as e:
+                    self._save_gather_error('Error parsing the RDF file: {0}'.format(e), harvest_job)
+                    if hasattr(content, 'close'):
+                        content.close()
+                    return []
 
-                    # Try to get a unique identifier for the harvested dataset
-                    guid = self._get_guid(dataset, source_url=source_dataset.url)
+                # When streaming, the content is read while getting the
+                # datasets
+                if hasattr(content, 'close') and not streaming:
+                    content.close()
 
-                    if not guid:
-                        self._save_gather_error('Could not get a unique identifier for dataset: {0}'.format(dataset),
-                                                harvest_job)
-                        continue
+                for harvester in p.PluginImplementations(IDCATRDFHarvester):
+                    parser, after_parsing_errors = harvester.after_parsing(parser, harvest_job)
 
-                    dataset['extras'].append({'key': 'guid', 'value': guid})
-                    guids_in_source.append(guid)
+                    for error_msg in after_parsing_errors:
+                        self._save_gather_error(error_msg, harvest_job)
 
-                    obj = HarvestObject(guid=guid, job=harvest_job,
-                                        content=json.dumps(dataset))
+                if not parser:
+                    if hasattr(content, 'close'):
+                        content.close()
+                    return []
 
-                    obj.save()
-                    object_ids.append(obj.id)
-            except Exception as e:
-                self._save_gather_error('Error when processsing dataset: %r / %s' % (e, traceback.format_exc()),
-                                        harvest_job)
-                return []
+                if page_state:
+                    page_state['next_page_url'] = parser.next_page()
+                page_url = self._get_page_state_url(page_state)
 
-            # get the next page
-            next_page_url = parser.next_page()
+                if prefetcher is not None:
+                    # Start downloading the following pages while the datasets
+                    # in this one are processed
+                    self._prefetch_pages(prefetcher, parser, harvest_job,
+                                         rdf_format)
 
-        # Check if some datasets need to be deleted
-        object_ids_to_delete = self._mark_datasets_for_deletion(guids_in_source, harvest_job)
+                try:
 
-        object_ids.extend(object_ids_to_delete)
+                    source_dataset = model.Package.get(harvest_job.source.id)
 
-        return object_ids
+                    if store_descriptions:
+                        # Profiles are run on the description of each
+                        # dataset, which is stored with the object
+                        parsed_datasets = parser.datasets_with_descriptions()
+                    else:
+                        parsed_datasets = (
+                            (dataset, None) for dataset in
+                            parser.datasets(processes=parser_processes))
+
+                    for dataset, description in parsed_datasets:
+                        # The name is generated below, keep the original one
+                        # for the fingerprint
+                        parsed_name = dataset.get('name')
+                        if not dataset.get('name'):
+                            dataset['name'] = self._gen_new_name(dataset['title'])
+                        dataset['name'] = self._get_unique_name(dataset['name'])
+                        page_names.append(dataset['name'])
+
+                        # Unless already set by the parser, get the owner organization (if any)
+                        # from the harvest source dataset
+                        if not dataset.get('owner_org'):
+                            if source_dataset.owner_org:
+                                dataset['owner_org'] = source_dataset.owner_org
+
+                        # Try to get a unique identifier for the harvested dataset
+                        guid = self._get_guid(dataset, source_url=source_dataset.url)
+
+                        if not guid:
+                            self._save_gather_error('Could not get a unique identifier for dataset: {0}'.format(dataset),
+                                                    harvest_job)
+                            continue
+
+                        dataset['extras'].append({'key': 'guid', 'value': guid})
+                        guids_in_source.add(guid)
+                        page_guids.add(guid)
+
+                        extras = self._get_page_state_extras(page_state)
+                        if skip_unchanged:
+                            fingerprint = self._get_dataset_fingerprint(
+                                dict(dataset, name=parsed_name))
+                            if self._is_dataset_unchanged(
+                                    guid, fingerprint, page_url,
+                                    current_fingerprints):
+                                unchanged_count += 1
+                                continue
+                            extras.append(HarvestObjectExtra(
+                                key='fingerprint', value=fingerprint))
+                        if description is not None:
+                            extras.append(HarvestObjectExtra(
+                                key='rdf_description',
+                                value=self._encode_payload(
+                                    description.serialize(format='nt'))))
+
+                        harvest_objects.append(
+                            HarvestObject(guid=guid, job=harvest_job,
+                                          harvest_source_id=harvest_job.source.id,
+                                          content=self._encode_payload(json.dumps(dataset)),
+                                          extras=extras))
+
+                        if len(harvest_objects) >= batch_size:
+                            object_ids.extend(self._save_harvest_objects(harvest_objects))
+                            harvest_objects = []
+                            log.info('Gathered %d datasets for job %s',
+                                     len(object_ids), harvest_job.id)
+                except RDFParserException as e:
+                    self._save_gather_error('Error parsing the RDF file: {0}'.format(e), harvest_job)
+                    return []
+                except Exception as e:
+                    self._save_gather_error('Error when processsing dataset: %r / %s' % (e, traceback.format_exc()),
+                                            harvest_job)
+                    return []
+                finally:
+                    if hasattr(content, 'close'):
+                        content.close()
+
+                # get the next page
+                next_page_url = parser.next_page()
+                # Remove the database of a disk-backed graph
+                parser.close()
+
+                if checkpoint is not None:
+                    # The objects of the page need to be saved before
+                    # recording it
+                    object_ids.extend(self._save_harvest_objects(harvest_objects))
+                    harvest_objects = []
+                    checkpoint.add_page(
+                        current_page_url, next_page_url, page_guids,
+                        page_names, object_ids[page_first_object:],
+                        content_hash.hexdigest())
+
+            if harvest_objects:
+                object_ids.extend(self._save_harvest_objects(harvest_objects))
+                log.info('Gathered %d datasets for job %s',
+                         len(object_ids), harvest_job.id)
+            if unchanged_count:
+                log.info('Skipped %d unchanged datasets for job %s',
+                         unchanged_count, harvest_job.id)
+
+            # Check if some datasets need to be deleted
+            object_ids_to_delete = self._mark_datasets_for_deletion(guids_in_source, harvest_job)
+
+            object_ids.extend(resumed_object_ids)
+            object_ids.extend(object_ids_to_delete)
+
+            return object_ids
+        except BaseException:
+            # Keep the checkpoint in case the job is gathered again
+            keep_checkpoint = True
+            raise
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+            if checkpoint is not None and not keep_checkpoint:
+                checkpoint.remove()
 
     def fetch_stage(self, harvest_object):
         # Nothing to do here
         return True
 
     def import_stage(self, harvest_object):
+        try:
+            return self._import_object(harvest_object)
+        finally:
+            self._end_object_import(harvest_object)
+
+    def _import_object(self, harvest_object):
 
         log.debug('In DCATRDFHarvester import_stage')
 
@@ -287,17 +587,32 @@ class DCATRDFHarvester(DCATHarvester):
             return False
 
         try:
-            dataset = json.loads(harvest_object.content)
+            dataset = json.loads(self._get_object_content(harvest_object))
         except ValueError:
             self._save_object_error('Could not parse content for object {0}'.format(harvest_object.id),
                                     harvest_object, 'Import')
             return False
 
+        # Schemas, plugins and user, shared by all the objects of the job
+        import_context = self._get_import_context(harvest_object)
+
+        # Run the current profiles on the dataset description, if stored
+        description = self._get_object_extra(harvest_object, 'rdf_description')
+        if description:
+            try:
+                dataset = self._parse_dataset_description(
+                    dataset, self._decode_payload(description), import_context)
+            except RDFParserException as e:
+                self._save_object_error(
+                    'Error parsing the dataset description for object {0}: {1}'.format(
+                        harvest_object.id, e), harvest_object, 'Import')
+                return False
+
+        # Lookups for all the objects of the job, loaded once
+        import_index = self._get_import_index(harvest_object)
+
         # Get the last harvested object (if any)
-        previous_object = model.Session.query(HarvestObject) \
-                                       .filter(HarvestObject.guid==harvest_object.guid) \
-                                       .filter(HarvestObject.current==True) \
-                                       .first()
+        previous_object = self._get_previous_object(harvest_object, import_index)
 
         # Flag previous object as not current anymore
         if previous_object:
@@ -309,7 +624,7 @@ class DCATRDFHarvester(DCATHarvester):
         harvest_object.add()
 
         context = {
-            'user': self._get_user_name(),
+            'user': import_context.user_name,
             'return_id_only': True,
             'ignore_auth': True,
         }
@@ -317,14 +632,12 @@ class DCATRDFHarvester(DCATHarvester):
         dataset = self.modify_package_dict(dataset, {}, harvest_object)
 
         # Check if a dataset with the same guid exists
-        existing_dataset = self._get_existing_dataset(harvest_object.guid)
+        existing_dataset = self._get_existing_dataset(harvest_object.guid, import_index)
 
         try:
-            package_plugin = lib_plugins.lookup_package_plugin(dataset.get('type', None))
+            package_type = dataset.get('type', None)
             if existing_dataset:
-                package_schema = package_plugin.update_package_schema()
-                for harvester in p.PluginImplementations(IDCATRDFHarvester):
-                    package_schema = harvester.update_package_schema_for_update(package_schema)
+                package_schema = import_context.get_package_schema(package_type, 'update')
                 context['schema'] = package_schema
 
                 # Don't change the dataset name even if the title has
@@ -341,7 +654,7 @@ class DCATRDFHarvester(DCATHarvester):
                     if res_uri and res_uri in resource_mapping:
                         resource['id'] = resource_mapping[res_uri]
 
-                for harvester in p.PluginImplementations(IDCATRDFHarvester):
+                for harvester in import_context.harvester_plugins:
                     harvester.before_update(harvest_object, dataset, harvester_tmp_dict)
 
                 try:
@@ -351,6 +664,7 @@ class DCATRDFHarvester(DCATHarvester):
                         harvest_object.add()
 
                         p.toolkit.get_action('package_update')(context, dataset)
+                        self._add_pending_search_commit(import_context, dataset['id'])
                     else:
                         log.info('Ignoring dataset %s' % existing_dataset['name'])
                         return 'unchanged'
@@ -358,7 +672,7 @@ class DCATRDFHarvester(DCATHarvester):
                     self._save_object_error('Update validation Error: %s' % str(e.error_summary), harvest_object, 'Import')
                     return False
 
-                for harvester in p.PluginImplementations(IDCATRDFHarvester):
+                for harvester in import_context.harvester_plugins:
                     err = harvester.after_update(harvest_object, dataset, harvester_tmp_dict)
 
                     if err:
@@ -368,9 +682,7 @@ class DCATRDFHarvester(DCATHarvester):
                 log.info('Updated dataset %s' % dataset['name'])
 
             else:
-                package_schema = package_plugin.create_package_schema()
-                for harvester in p.PluginImplementations(IDCATRDFHarvester):
-                    package_schema = harvester.update_package_schema_for_create(package_schema)
+                package_schema = import_context.get_package_schema(package_type, 'create')
                 context['schema'] = package_schema
 
                 # We need to explicitly provide a package ID
@@ -380,7 +692,7 @@ class DCATRDFHarvester(DCATHarvester):
                 harvester_tmp_dict = {}
 
                 name = dataset['name']
-                for harvester in p.PluginImplementations(IDCATRDFHarvester):
+                for harvester in import_context.harvester_plugins:
                     harvester.before_create(harvest_object, dataset, harvester_tmp_dict)
 
                 try:
@@ -396,6 +708,7 @@ class DCATRDFHarvester(DCATHarvester):
                         model.Session.flush()
 
                         p.toolkit.get_action('package_create')(context, dataset)
+                        self._add_pending_search_commit(import_context, dataset['id'])
                     else:
                         log.info('Ignoring dataset %s' % name)
                         return 'unchanged'
@@ -403,7 +716,7 @@ class DCATRDFHarvester(DCATHarvester):
                     self._save_object_error('Create validation Error: %s' % str(e.error_summary), harvest_object, 'Import')
                     return False
 
-                for harvester in p.PluginImplementations(IDCATRDFHarvester):
+                for harvester in import_context.harvester_plugins:
                     err = harvester.after_create(harvest_object, dataset, harvester_tmp_dict)
 
                     if err:
@@ -417,6 +730,8 @@ class DCATRDFHarvester(DCATHarvester):
             return False
 
         finally:
+            if import_index is not None:
+                import_index.discard(harvest_object.guid)
             model.Session.commit()
 
         return True
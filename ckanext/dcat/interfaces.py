@@ -33,8 +33,11 @@ class IDCATRDFHarvester(Interface):
 
     def update_session(self, session):
         '''
-        Called before making the HTTP request to the remote site to download
-        the RDF file.
+        Called before making the HTTP requests to the remote site to download
+        the RDF file. It is called once per harvest job, and the returned
+        session is used for all the requests of the job (eg for all pages).
+        When pages are downloaded concurrently (see the ``gather_concurrency``
+        option), it is also called for the session of each download thread.
 
         It returns a valid `requests` session object.
 
@@ -196,7 +199,8 @@ class IDCATRDFHarvester(Interface):
 
     def update_package_schema_for_create(self, package_schema):
         '''
-        Called just before the ``package_create`` action.
+        Called before the first ``package_create`` action of each harvest job.
+        The returned schema is used for all the datasets of the job.
 
         :param package_schema: The default create package schema dict.
         :type package_schema_dict: dict
@@ -208,7 +212,8 @@ class IDCATRDFHarvester(Interface):
 
     def update_package_schema_for_update(self, package_schema):
         '''
-        Called just before the ``package_update`` action.
+        Called before the first ``package_update`` action of each harvest job.
+        The returned schema is used for all the datasets of the job.
 
         :param package_schema: The default update package schema dict.
         :type package_schema_dict: dict
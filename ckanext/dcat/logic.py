@@ -4,12 +4,18 @@ import math
 from ckantoolkit import config
 from dateutil.parser import parse as dateutil_parse
 
+from ckan import model
 from ckan.plugins import toolkit
 
 import ckanext.dcat.converters as converters
 
-from ckanext.dcat.processors import RDFSerializer
-from ckanext.dcat.utils import catalog_uri
+from ckanext.dcat.cache import get_serialization_cache
+from ckanext.dcat.processors import (
+    RDFSerializer,
+    DEFAULT_RDF_PROFILES,
+    RDF_PROFILES_CONFIG_OPTION,
+)
+from ckanext.dcat.utils import catalog_uri, url_to_rdflib_format
 
 DATASETS_PER_PAGE = 100
 
@@ -21,6 +27,17 @@ def dcat_dataset_show(context, data_dict):
 
     toolkit.check_access('dcat_dataset_show', context, data_dict)
 
+    cache = get_serialization_cache()
+    if cache:
+        package = model.Package.get(data_dict.get('id'))
+        if package and package.state == 'active':
+            output = cache.get(_serialization_cache_key(
+                package.id, package.metadata_modified.isoformat(), data_dict))
+            if output is not None:
+                toolkit.check_access('package_show', context,
+                                     {'id': package.id})
+                return output
+
     dataset_dict = toolkit.get_action('package_show')(context, data_dict)
 
     serializer = RDFSerializer(profiles=data_dict.get('profiles'))
@@ -28,9 +45,35 @@ def dcat_dataset_show(context, data_dict):
     output = serializer.serialize_dataset(dataset_dict,
                                           _format=data_dict.get('format'))
 
+    if cache and dataset_dict.get('state') == 'active':
+        cache.set(_serialization_cache_key(
+            dataset_dict['id'], dataset_dict['metadata_modified'], data_dict),
+            output)
+
     return output
 
 
+def _serialization_cache_key(dataset_id, metadata_modified, data_dict):
+    '''
+    Returns the key used to store the serialization of a dataset in the
+    serialization cache
+
+    The key is a tuple with the dataset id, its `metadata_modified` value,
+    the profiles and the rdflib format used.
+    '''
+    profiles = data_dict.get('profiles')
+    if not profiles:
+        profiles = config.get(RDF_PROFILES_CONFIG_OPTION, None)
+        if profiles:
+            profiles = profiles.split(' ')
+        else:
+            profiles = DEFAULT_RDF_PROFILES
+
+    _format = url_to_rdflib_format(data_dict.get('format') or 'xml')
+
+    return (dataset_id, metadata_modified, tuple(profiles), _format)
+
+
 @toolkit.side_effect_free
 def dcat_catalog_show(context, data_dict):
 
@@ -42,6 +85,12 @@ def dcat_catalog_show(context, data_dict):
 
     serializer = RDFSerializer(profiles=data_dict.get('profiles'))
 
+    if context.get('stream'):
+        return serializer.serialize_catalog_stream(
+            {}, dataset_dicts,
+            _format=data_dict.get('format'),
+            pagination_info=pagination_info)
+
     output = serializer.serialize_catalog({}, dataset_dicts,
                                           _format=data_dict.get('format'),
                                           pagination_info=pagination_info)
@@ -61,6 +110,12 @@ def dcat_catalog_search(context, data_dict):
 
     serializer = RDFSerializer(profiles=data_dict.get('profiles'))
 
+    if context.get('stream'):
+        return serializer.serialize_catalog_stream(
+            {}, dataset_dicts,
+            _format=data_dict.get('format'),
+            pagination_info=pagination_info)
+
     output = serializer.serialize_catalog({}, dataset_dicts,
                                           _format=data_dict.get('format'),
                                           pagination_info=pagination_info)
@@ -20,6 +20,7 @@ from ckanext.dcat.logic import (dcat_dataset_show,
                                 dcat_auth,
                                 )
 from ckanext.dcat import utils
+from ckanext.dcat.cache import invalidate_dataset
 from ckanext.dcat.validators import dcat_validators
 
 
@@ -130,6 +131,12 @@ class DCATPlugin(p.SingletonPlugin, DefaultTranslation):
     def before_index(self, dataset_dict):
         return self.before_dataset_index(dataset_dict)
 
+    def after_update(self, context, data_dict):
+        return self.after_dataset_update(context, data_dict)
+
+    def after_delete(self, context, data_dict):
+        return self.after_dataset_delete(context, data_dict)
+
     # CKAN >= 2.10 hooks
     def after_dataset_show(self, context, data_dict):
 
@@ -162,6 +169,12 @@ class DCATPlugin(p.SingletonPlugin, DefaultTranslation):
 
         return data_dict
 
+    def after_dataset_update(self, context, data_dict):
+        invalidate_dataset(data_dict.get('id'))
+
+    def after_dataset_delete(self, context, data_dict):
+        invalidate_dataset(data_dict.get('id'))
+
     def before_dataset_index(self, dataset_dict):
         schema = _get_dataset_schema(dataset_dict["type"])
         spatial = None
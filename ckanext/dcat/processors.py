@@ -2,24 +2,43 @@ from __future__ import print_function
 
 from builtins import str
 from builtins import object
+import io
 import sys
+import uuid
+import codecs
+import hashlib
 import argparse
 import xml
 import json
-from pkg_resources import iter_entry_points
+import logging
+import itertools
+import tempfile
+import threading
+import multiprocessing
+from xml.etree import ElementTree
+from importlib.metadata import entry_points
 
 from ckantoolkit import config
 
 import rdflib
 import rdflib.parser
 from rdflib import URIRef, BNode, Literal
+from rdflib.exceptions import ParserError
+from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+from rdflib.plugins.parsers.nquads import NQuadsParser
 from rdflib.namespace import Namespace, RDF
 
 import ckan.plugins as p
+from ckan.model import meta
 
 from ckanext.dcat.utils import catalog_uri, dataset_uri, url_to_rdflib_format, DCAT_EXPOSE_SUBCATALOGS
 from ckanext.dcat.profiles import DCAT, DCT, FOAF
+from ckanext.dcat.profiles.base import get_dataset_schema
 from ckanext.dcat.exceptions import RDFProfileException, RDFParserException
+from ckanext.dcat.store import (
+    SQLiteStore, DISK_STORE_THRESHOLD_CONFIG, DISK_STORE_PATH_CONFIG)
+
+log = logging.getLogger(__name__)
 
 HYDRA = Namespace('http://www.w3.org/ns/hydra/core#')
 DCAT = Namespace("http://www.w3.org/ns/dcat#")
@@ -30,10 +49,37 @@ COMPAT_MODE_CONFIG_OPTION = 'ckanext.dcat.compatibility_mode'
 
 DEFAULT_RDF_PROFILES = ['euro_dcat_ap_2']
 
+# rdflib formats whose serializations of separate graphs can be concatenated
+# into a valid document, and thus can be streamed
+STREAMING_FORMATS = ['nt', 'turtle', 'n3', 'json-ld']
+
+# rdflib formats with one triple (or quad) per line, which can be parsed
+# incrementally (see RDFParser.parse)
+LINE_BASED_FORMATS = {
+    'nt': W3CNTriplesParser,
+    'nt11': W3CNTriplesParser,
+    'ntriples': W3CNTriplesParser,
+    'application/n-triples': W3CNTriplesParser,
+    'nquads': NQuadsParser,
+    'application/n-quads': NQuadsParser,
+}
+
+# rdflib formats for RDF/XML, which can be parsed one dataset element at a
+# time (see RDFParser.parse)
+RDFXML_FORMATS = ['xml', 'application/rdf+xml']
+
+# Number of top level RDF/XML elements that are not datasets parsed at once
+RDFXML_CONTEXT_CHUNK_SIZE = 500
+
+# Number of datasets sent to each worker process at once when parsing in
+# parallel
+PARALLEL_PARSING_CHUNK_SIZE = 100
+
 
 class RDFProcessor(object):
 
-    def __init__(self, profiles=None, dataset_type='dataset', compatibility_mode=False):
+    def __init__(self, profiles=None, dataset_type='dataset', compatibility_mode=False,
+                 disk_store_threshold=None):
         '''
         Creates a parser or serializer instance
 
@@ -47,6 +93,12 @@ class RDFProcessor(object):
         (eg adding the `dcat_` prefix or storing comma separated lists instead
         of JSON dumps).
 
+        If ``disk_store_threshold`` is set (or the
+        ``ckanext.dcat.disk_store.threshold`` config option), the graph is
+        backed by a ``SQLiteStore``, which moves the triples to a temporary
+        database on disk (in ``ckanext.dcat.disk_store.path``) once there are
+        more than this number of them. Use 0 to always store them on disk.
+
         '''
         if not profiles:
             profiles = config.get(RDF_PROFILES_CONFIG_OPTION, None)
@@ -66,36 +118,139 @@ class RDFProcessor(object):
                 config.get(COMPAT_MODE_CONFIG_OPTION, False))
         self.compatibility_mode = compatibility_mode
 
-        self.g = rdflib.ConjunctiveGraph()
+        if disk_store_threshold is None:
+            disk_store_threshold = config.get(DISK_STORE_THRESHOLD_CONFIG)
+        if disk_store_threshold is not None and disk_store_threshold != '':
+            store = SQLiteStore(
+                threshold=p.toolkit.asint(disk_store_threshold),
+                directory=config.get(DISK_STORE_PATH_CONFIG) or None)
+            self.g = rdflib.ConjunctiveGraph(store=store)
+        else:
+            self.g = rdflib.ConjunctiveGraph()
+
+    def close(self):
+        '''
+        Releases the resources used by the graph, like the database of a
+        disk-backed store
+        '''
+        self.g.close()
 
     def _load_profiles(self, profile_names):
         '''
         Loads the specified RDF parser profiles
 
         These are registered on ``entry_points`` in setup.py, under the
-        ``[ckan.rdf.profiles]`` group.
+        ``[ckan.rdf.profiles]`` group. See ``load_profiles``.
         '''
-        profiles = []
-        loaded_profiles_names = []
+        return load_profiles(profile_names)
 
-        for profile_name in profile_names:
-            for profile in iter_entry_points(
-                    group=RDF_PROFILES_ENTRY_POINT_GROUP,
-                    name=profile_name):
-                profile_class = profile.load()
-                # Set a reference to the profile name
-                profile_class.name = profile.name
-                profiles.append(profile_class)
-                loaded_profiles_names.append(profile.name)
-                break
+    @property
+    def _profiles(self):
+        return self._profile_classes
+
+    @_profiles.setter
+    def _profiles(self, profiles):
+        self._profile_classes = profiles
+        # Make sure the new profiles get instantiated
+        self._profile_instances = None
+
+    def _get_profiles(self):
+        '''
+        Returns instances of the loaded profiles, ready to process a dataset
+
+        Profiles are instantiated the first time this is called, and the
+        same instances (and the dataset schema they use) are reused for all
+        following datasets. Before being returned, profiles get a reference
+        to the current processor graph and their ``reset()`` method is
+        called, so no state is carried over between datasets.
+        '''
+        if self._profile_instances is None:
+            dataset_schema = get_dataset_schema(self.dataset_type)
+            self._profile_instances = [
+                profile_class(
+                    self.g,
+                    dataset_type=self.dataset_type,
+                    compatibility_mode=self.compatibility_mode,
+                    dataset_schema=dataset_schema,
+                )
+                for profile_class in self._profiles
+            ]
+
+        for profile in self._profile_instances:
+            profile.g = self.g
+            profile.reset()
+
+        return self._profile_instances
+
+
+_profiles_lock = threading.Lock()
+_profile_entry_points = None
+_loaded_profiles = {}
 
-        unknown_profiles = set(profile_names) - set(loaded_profiles_names)
+
+def _get_profile_entry_points():
+    global _profile_entry_points
+    if _profile_entry_points is None:
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=RDF_PROFILES_ENTRY_POINT_GROUP)
+        else:
+            # Python < 3.10
+            eps = eps.get(RDF_PROFILES_ENTRY_POINT_GROUP, [])
+        profile_entry_points = {}
+        for entry_point in eps:
+            # Keep the first one registered, as iter_entry_points did
+            profile_entry_points.setdefault(entry_point.name, entry_point)
+        _profile_entry_points = profile_entry_points
+    return _profile_entry_points
+
+
+def load_profiles(profile_names):
+    '''
+    Returns the profile classes for the provided list of profile names
+
+    Entry points are only scanned and loaded the first time a particular
+    combination of profiles is requested, subsequent calls return the same
+    classes from a process-wide registry. Use ``reload_profiles`` to force
+    entry points to be scanned again (eg after installing a new extension).
+
+    Raises ``RDFProfileException`` if any of the profiles is not registered.
+    '''
+    key = tuple(profile_names)
+    profiles = _loaded_profiles.get(key)
+    if profiles is not None:
+        return list(profiles)
+
+    with _profiles_lock:
+        registered = _get_profile_entry_points()
+
+        unknown_profiles = set(profile_names) - set(registered.keys())
         if unknown_profiles:
             raise RDFProfileException(
                 'Unknown RDF profiles: {0}'.format(
                     ', '.join(sorted(unknown_profiles))))
 
-        return profiles
+        profiles = []
+        for profile_name in profile_names:
+            profile_class = registered[profile_name].load()
+            # Set a reference to the profile name
+            profile_class.name = profile_name
+            profiles.append(profile_class)
+
+        _loaded_profiles[key] = profiles
+
+    return list(profiles)
+
+
+def reload_profiles():
+    '''
+    Clears the profiles registry, so entry points are scanned again the
+    next time profiles are loaded
+    '''
+    global _profile_entry_points
+    with _profiles_lock:
+        _profile_entry_points = None
+        _loaded_profiles.clear()
 
 
 class RDFParser(RDFProcessor):
@@ -106,6 +261,9 @@ class RDFParser(RDFProcessor):
     CKAN dicts from the RDF graph.
     '''
 
+    # Data and format of the document to read incrementally, set by parse()
+    _stream = None
+
     def _datasets(self):
         '''
         Generator that returns all DCAT datasets on the graph
@@ -130,7 +288,43 @@ class RDFParser(RDFProcessor):
                 return str(o)
         return None
 
-    def parse(self, data, _format=None):
+    def pagination(self):
+        '''
+        Returns the pagination info of the graph, if any
+
+        The returned dict can have the same keys supported by
+        ``RDFSerializer.serialize_catalog``: `next`, `previous`, `first` and
+        `last` (as strings) and `count` and `items_per_page` (as integers).
+        '''
+        items = [
+            ('next', [HYDRA.next, HYDRA.nextPage]),
+            ('previous', [HYDRA.previous, HYDRA.previousPage]),
+            ('first', [HYDRA.first, HYDRA.firstPage]),
+            ('last', [HYDRA.last, HYDRA.lastPage]),
+            ('count', [HYDRA.totalItems]),
+            ('items_per_page', [HYDRA.itemsPerPage]),
+        ]
+
+        paging_info = {}
+        for pagination_node in self.g.subjects(RDF.type, HYDRA.PagedCollection):
+            for key, predicates in items:
+                for predicate in predicates:
+                    value = self.g.value(pagination_node, predicate)
+                    if value is None:
+                        continue
+                    if key in ('count', 'items_per_page'):
+                        try:
+                            value = int(value)
+                        except ValueError:
+                            continue
+                    else:
+                        value = str(value)
+                    paging_info.setdefault(key, value)
+                    break
+            break
+        return paging_info
+
+    def parse(self, data, _format=None, streaming=False):
         '''
         Parses and RDF graph serialization and into the class graph
 
@@ -138,7 +332,23 @@ class RDFParser(RDFProcessor):
 
         Data is a string with the serialized RDF graph (eg RDF/XML, N3
         ... ). By default RF/XML is expected. The optional parameter _format
-        can be used to tell rdflib otherwise.
+        can be used to tell rdflib otherwise. Data can also be a binary
+        file-like object, which will be read by rdflib directly.
+
+        If ``streaming`` is True and the format is line based (N-Triples or
+        N-Quads), the data is not read here but incrementally when calling
+        ``datasets()``, which yields each dataset as soon as its description
+        has been read and then removes it from the graph (see
+        ``_datasets_stream``). A file-like object must not be closed until
+        then. Pagination info is only available once all datasets have been
+        read.
+
+        If ``streaming`` is True and the format is RDF/XML, only the
+        elements that don't describe datasets (eg the catalog or the
+        pagination info) are parsed here into the graph. Each dataset
+        element is parsed on its own when calling ``datasets()``, and
+        removed from the graph once the profiles have been run (see
+        ``_datasets_xml_stream``). Other formats are parsed normally.
 
         It raises a ``RDFParserException`` if there was some error during
         the parsing.
@@ -150,8 +360,23 @@ class RDFParser(RDFProcessor):
         if not _format or _format == 'pretty-xml':
             _format = 'xml'
 
+        if streaming and _format in LINE_BASED_FORMATS:
+            self._stream = (data, _format)
+            return
+
+        if streaming and _format in RDFXML_FORMATS:
+            self._stream = (self._read_xml_context(data), _format)
+            return
+
+        if hasattr(data, 'read'):
+            source = rdflib.parser.InputSource()
+            source.setByteStream(data)
+            parse_args = {'source': source}
+        else:
+            parse_args = {'data': data}
+
         try:
-            self.g.parse(data=data, format=_format)
+            self.g.parse(format=_format, **parse_args)
         # Apparently there is no single way of catching exceptions from all
         # rdflib parsers at once, so if you use a new one and the parsing
         # exceptions are not cached, add them here.
@@ -169,27 +394,654 @@ class RDFParser(RDFProcessor):
                        for plugin
                        in rdflib.plugin.plugins(kind=rdflib.parser.Parser)])
 
-    def datasets(self):
+    def datasets(self, processes=1, chunk_size=PARALLEL_PARSING_CHUNK_SIZE):
         '''
         Generator that returns CKAN datasets parsed from the RDF graph
 
         Each dataset is passed to all the loaded profiles before being
         yielded, so it can be further modified by each one of them.
 
+        Datasets of a document parsed in streaming mode (see ``parse``) are
+        always parsed serially.
+
+        If `processes` is greater than 1, datasets are split in chunks of
+        `chunk_size` and parsed in parallel by a pool of worker processes.
+        Workers are forked from the current process, so they share the
+        parsed graph and the loaded profiles without having to serialize
+        them. Datasets are still yielded in the same order as in serial
+        mode. Parallel parsing is not available on platforms that don't
+        support forking processes, where datasets are parsed serially.
+
         Returns a dataset dict that can be passed to eg `package_create`
         or `package_update`
         '''
+        if self._stream is not None:
+            if self._stream[1] in RDFXML_FORMATS:
+                dataset_dicts = self._datasets_xml_stream()
+            else:
+                dataset_dicts = self._datasets_stream()
+            for dataset_dict in dataset_dicts:
+                yield dataset_dict
+            return
+
+        if processes and processes > 1:
+            for dataset_dict in self._datasets_parallel(processes, chunk_size):
+                yield dataset_dict
+            return
+
         for dataset_ref in self._datasets():
-            dataset_dict = {}
-            for profile_class in self._profiles:
-                profile = profile_class(
-                    self.g,
-                    dataset_type=self.dataset_type,
-                    compatibility_mode=self.compatibility_mode
-                )
-                profile.parse_dataset(dataset_dict, dataset_ref)
+            yield self._parse_dataset(dataset_ref)
+
+    def _parse_dataset(self, dataset_ref):
+        dataset_dict = {}
+        for profile in self._get_profiles():
+            profile.parse_dataset(dataset_dict, dataset_ref)
+
+        return dataset_dict
+
+    def dataset_descriptions(self):
+        '''
+        Generator that returns the description of each DCAT dataset on the
+        graph, as a separate graph
+
+        The description of a dataset is its concise bounded description
+        (its triples and the ones of the blank nodes reachable from it),
+        extended with the descriptions of its distributions and the other
+        resources it links to (eg publishers identified by a URI), and the
+        ones of the catalogs linking to it. Other datasets, catalog records
+        and the distributions of other datasets are not followed, and only
+        the link to the dataset is included from the ``dcat:dataset`` and
+        ``dcat:record`` properties of the catalogs. It contains everything
+        the profiles need to parse the dataset, so it can be stored or sent
+        to another process and parsed there with
+        ``parse_dataset_description``.
+
+        The graph is read in a single pass, grouping the blank nodes linked
+        to each other with a union-find structure and indexing the catalog
+        links and distributions. The description of each catalog is built
+        once, so the size of each dataset description (and the time needed
+        to get it) doesn't grow with the number of datasets in the catalog.
+
+        Descriptions are not available for documents parsed in streaming
+        mode (see ``parse``).
+
+        Yields ``(dataset_ref, graph)`` tuples, with the datasets in the
+        same order as ``datasets()``.
+        '''
+        if self._stream is not None:
+            raise RDFParserException(
+                'Dataset descriptions are not available in streaming mode')
+
+        dataset_refs = list(self._datasets())
+        datasets = set(dataset_refs)
+        catalogs = set(self.g.subjects(RDF.type, DCAT.Catalog))
+
+        bnode_sets = _UnionFind()
+        bnode_subjects = set()
+        catalog_links = {}
+        distributions = {}
+        records = set()
+        for subject, predicate, _object in self.g:
+            if predicate == DCAT.dataset:
+                catalog_links.setdefault(_object, []).append(subject)
+                continue
+            if predicate == DCAT.record:
+                records.add(_object)
+                continue
+            if predicate == DCAT.distribution:
+                distributions.setdefault(_object, set()).add(subject)
+            if isinstance(subject, BNode):
+                bnode_subjects.add(subject)
+                # Datasets and catalogs are described on their own
+                if (isinstance(_object, BNode)
+                        and subject not in datasets
+                        and subject not in catalogs
+                        and _object not in datasets
+                        and _object not in catalogs):
+                    bnode_sets.union(subject, _object)
+
+        # Blank nodes with triples, grouped by the set they belong to
+        bnode_groups = {}
+        for bnode in bnode_subjects:
+            bnode_groups.setdefault(bnode_sets.find(bnode), []).append(bnode)
+        del bnode_subjects
+
+        def _describe(node, owner=None):
+            '''
+            Returns the triples describing the given node and the resources
+            it links to, following only the distributions of ``owner``
+            '''
+            triples = []
+            visited = set()
+            pending = [node]
+            while pending:
+                node = pending.pop()
+                if isinstance(node, BNode):
+                    key = bnode_sets.find(node)
+                    nodes = bnode_groups.get(key, [])
+                else:
+                    key = node
+                    nodes = [node]
+                if key in visited:
+                    continue
+                visited.add(key)
+
+                # Triples are read from the graph indexes, which keep the
+                # order in which they were added
+                for triple in itertools.chain.from_iterable(
+                        self.g.triples((n, None, None)) for n in nodes):
+                    predicate, _object = triple[1], triple[2]
+                    if predicate in (DCAT.dataset, DCAT.record):
+                        continue
+                    triples.append(triple)
+                    if (isinstance(_object, Literal) or _object in datasets
+                            or _object in catalogs or _object in records):
+                        continue
+                    if (_object in distributions
+                            and owner not in distributions[_object]):
+                        continue
+                    pending.append(_object)
+            return triples
+
+        catalog_descriptions = {}
+        for dataset_ref in dataset_refs:
+            graph = rdflib.Graph()
+            for catalog_ref in catalog_links.get(dataset_ref, []):
+                graph.add((catalog_ref, DCAT.dataset, dataset_ref))
+                if catalog_ref not in catalog_descriptions:
+                    catalog_descriptions[catalog_ref] = _describe(catalog_ref)
+                for triple in catalog_descriptions[catalog_ref]:
+                    graph.add(triple)
+
+            for triple in _describe(dataset_ref, owner=dataset_ref):
+                graph.add(triple)
+
+            yield dataset_ref, graph
+
+    def datasets_with_descriptions(self):
+        '''
+        Generator that returns CKAN datasets parsed from the description of
+        each DCAT dataset on the graph (see ``dataset_descriptions``)
+
+        Yields ``(dataset_dict, graph)`` tuples, where the dataset dict is
+        the same that ``parse_dataset_description`` returns for the graph.
+        '''
+        for dataset_ref, graph in self.dataset_descriptions():
+            yield self._parse_dataset_graph(graph, dataset_ref), graph
+
+    def parse_dataset_description(self, data, _format='nt'):
+        '''
+        Returns the CKAN dataset parsed from a dataset description, as
+        returned by ``dataset_descriptions``
+
+        ``data`` can be an rdflib graph or a serialization of it, in
+        N-Triples by default. The graph of the parser is not modified.
+
+        It raises a ``RDFParserException`` if the data can't be parsed or
+        it doesn't describe exactly one dataset.
+        '''
+        if isinstance(data, rdflib.Graph):
+            graph = data
+        else:
+            graph = rdflib.Graph()
+            try:
+                graph.parse(data=data, format=url_to_rdflib_format(_format))
+            except (SyntaxError, xml.sax.SAXParseException, ParserError,
+                    rdflib.plugin.PluginException, TypeError) as e:
+                raise RDFParserException(e)
+
+        dataset_refs = list(graph.subjects(RDF.type, DCAT.Dataset))
+        if len(dataset_refs) != 1:
+            raise RDFParserException(
+                'Expected one dataset in the description, found {0}'.format(
+                    len(dataset_refs)))
+
+        return self._parse_dataset_graph(graph, dataset_refs[0])
+
+    def _parse_dataset_graph(self, graph, dataset_ref):
+        # Use the same profile instances, with the description as graph
+        parser_graph = self.g
+        self.g = graph
+        try:
+            return self._parse_dataset(dataset_ref)
+        finally:
+            self.g = parser_graph
+
+    def _read_triples(self, data, _format):
+        '''
+        Generator that returns the triples of a N-Triples or N-Quads
+        document, reading it line by line
+
+        Named graphs are ignored. Blank node labels are mapped to the same
+        ids every time they appear, without keeping all of them in memory.
+        '''
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        if isinstance(data, str):
+            data = io.StringIO(data)
+        elif not isinstance(data, io.TextIOBase):
+            data = codecs.getreader('utf-8')(data)
+
+        sink = _TriplesSink()
+        parser = LINE_BASED_FORMATS[_format](sink=sink)
+        bnode_ids = _BNodeIds()
+        parser.file = data
+        parser.buffer = ''
+        while True:
+            try:
+                parser.line = line = parser.readline()
+                if line is None:
+                    break
+                parser.parseline(bnode_context=bnode_ids)
+            except (ParserError, UnicodeDecodeError) as e:
+                raise RDFParserException(e)
+            while sink.triples:
+                yield sink.triples.pop(0)
+
+    def _datasets_stream(self):
+        '''
+        Generator that returns CKAN datasets parsed incrementally from the
+        document passed to ``parse`` in streaming mode
+
+        Triples are read in groups with the same subject. A dataset is
+        parsed once the group of the following one has been read (or the
+        document has ended), so the triples of the dataset and the ones of
+        its distributions, blank nodes and other related resources must be
+        before the ones of the following dataset, as in the chunks generated
+        by ``RDFSerializer.serialize_catalog_stream``. After parsing a
+        dataset, its triples and the ones of its distributions and the blank
+        nodes reachable from them are removed from the graph.
+
+        The resources read when parsing each dataset are recorded, and a
+        ``RDFParserException`` is raised if the document doesn't have this
+        layout, ie if new triples about one of them are found afterwards or
+        a dataset links to resources already removed with a previous one.
+        '''
+        data, _format = self._stream
+        self._stream = None
+
+        parsed_datasets = set()
+        parsed_nodes = set()
+        removed_nodes = set()
+
+        def _parse_pending(dataset_ref):
+            # Previous datasets are no longer typed as such in the graph
+            nodes = self._dataset_nodes(dataset_ref) - parsed_datasets
+            if not nodes.isdisjoint(removed_nodes):
+                raise RDFParserException(
+                    'Dataset {0} links to resources described with a '
+                    'previous dataset, the document can not be parsed in '
+                    'streaming mode'.format(dataset_ref))
+            dataset_dict = self._parse_dataset(dataset_ref)
+            parsed_datasets.add(dataset_ref)
+            parsed_nodes.update(nodes)
+            removed_nodes.update(self._remove_dataset(dataset_ref))
+            return dataset_dict
+
+        pending_dataset = None
+        group_subject = None
+        group_is_dataset = False
+        group_is_new = False
+        for subject, predicate, _object in itertools.chain(
+                self._read_triples(data, _format), [(None, None, None)]):
+            if subject != group_subject:
+                if group_is_new and (not group_is_dataset
+                                     or group_subject in removed_nodes):
+                    raise RDFParserException(
+                        'Triples of {0} found after parsing the datasets '
+                        'linking to it, the document can not be parsed in '
+                        'streaming mode'.format(group_subject))
+                if group_is_dataset and group_subject != pending_dataset:
+                    # Other datasets are not followed when parsing one
+                    parsed_nodes.discard(group_subject)
+                    if pending_dataset is not None:
+                        yield _parse_pending(pending_dataset)
+                    pending_dataset = group_subject
+                group_subject = subject
+                group_is_dataset = False
+                group_is_new = False
+            if subject is None:
+                break
+
+            triple = (subject, predicate, _object)
+            if subject in parsed_nodes and triple not in self.g:
+                group_is_new = True
+            self.g.add(triple)
+            if predicate == RDF.type and _object == DCAT.Dataset:
+                group_is_dataset = True
+
+        if pending_dataset is not None:
+            yield _parse_pending(pending_dataset)
+
+    def _read_xml_context(self, data):
+        '''
+        Parses the elements of an RDF/XML document that are not datasets
+        into the graph
+
+        Returns a file with the document, positioned at its start, so it can
+        be read again by ``_datasets_xml_stream``.
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        try:
+            start = data.tell()
+            source = data
+        except (AttributeError, OSError):
+            # Not seekable, keep a copy to read it again
+            start = 0
+            source = tempfile.SpooledTemporaryFile(max_size=1024 * 1024 * 5)
+            for chunk in iter(lambda: data.read(1024 * 512), b''):
+                source.write(chunk)
+            source.seek(start)
+
+        chunk = []
+        try:
+            for kind, element, wrapper in _iter_rdfxml_elements(source):
+                if kind != 'context':
+                    continue
+                chunk.append(element)
+                if len(chunk) >= RDFXML_CONTEXT_CHUNK_SIZE:
+                    self._parse_xml_elements(self.g, wrapper, chunk)
+                    chunk = []
+        except SyntaxError as e:
+            raise RDFParserException(e)
+        if chunk:
+            self._parse_xml_elements(self.g, wrapper, chunk)
+
+        source.seek(start)
+        return source
+
+    def _parse_xml_elements(self, graph, wrapper, elements):
+        '''
+        Parses the given RDF/XML elements into the graph, inside a copy of
+        the document root element
+        '''
+        root = ElementTree.Element(wrapper.tag, wrapper.attrib)
+        root.extend(elements)
+        try:
+            graph.parse(data=ElementTree.tostring(root), format='xml',
+                        preserve_bnode_ids=True)
+        except (SyntaxError, xml.sax.SAXParseException, ParserError) as e:
+            raise RDFParserException(e)
+
+    def _datasets_xml_stream(self):
+        '''
+        Generator that returns CKAN datasets parsed one by one from the
+        RDF/XML document passed to ``parse`` in streaming mode
+
+        Dataset elements are the top level ones with the ``dcat:Dataset``
+        type and the ones nested in the ``dcat:dataset`` property of a top
+        level element. Each of them is parsed into a small graph, which is
+        added to the graph with the rest of the document while the profiles
+        are run. Blank nodes with a ``rdf:nodeID`` keep it as their id, so
+        they are shared between the dataset and the rest of the document.
+
+        Any other dataset found in the rest of the document is parsed at the
+        end.
+        '''
+        source, _format = self._stream
+        self._stream = None
+
+        parsed = set()
+        try:
+            for kind, element, wrapper in _iter_rdfxml_elements(source):
+                if kind != 'dataset':
+                    continue
+                dataset_graph = rdflib.Graph()
+                self._parse_xml_elements(dataset_graph, wrapper, [element])
+
+                added = [triple for triple in dataset_graph
+                         if triple not in self.g]
+                for triple in added:
+                    self.g.add(triple)
+                for dataset_ref in dataset_graph.subjects(
+                        RDF.type, DCAT.Dataset):
+                    if dataset_ref not in parsed:
+                        parsed.add(dataset_ref)
+                        yield self._parse_dataset(dataset_ref)
+                for triple in added:
+                    self.g.remove(triple)
+        except SyntaxError as e:
+            raise RDFParserException(e)
+
+        for dataset_ref in self._datasets():
+            if dataset_ref not in parsed:
+                yield self._parse_dataset(dataset_ref)
+
+    def _dataset_nodes(self, dataset_ref):
+        '''
+        Returns the set of resources the profiles may read when parsing the
+        given dataset: the dataset and all the resources reachable from it,
+        except other datasets and catalogs
+        '''
+        nodes = set([dataset_ref])
+        pending = [dataset_ref]
+        while pending:
+            node = pending.pop()
+            for _object in self.g.objects(node):
+                if isinstance(_object, Literal) or _object in nodes:
+                    continue
+                if ((_object, RDF.type, DCAT.Dataset) in self.g
+                        or (_object, RDF.type, DCAT.Catalog) in self.g):
+                    continue
+                nodes.add(_object)
+                pending.append(_object)
+        return nodes
+
+    def _remove_dataset(self, dataset_ref):
+        '''
+        Removes from the graph the triples of the given dataset, its
+        distributions and the blank nodes reachable from them, and the ones
+        pointing to the dataset
+
+        Returns the set of resources whose triples were removed
+        '''
+        nodes = set([dataset_ref])
+        pending = [dataset_ref]
+        while pending:
+            node = pending.pop()
+            for predicate, _object in self.g.predicate_objects(node):
+                if _object in nodes:
+                    continue
+                if isinstance(_object, BNode) or (
+                        node == dataset_ref and predicate == DCAT.distribution):
+                    nodes.add(_object)
+                    pending.append(_object)
+
+        for node in nodes:
+            self.g.remove((node, None, None))
+        self.g.remove((None, None, dataset_ref))
+        return nodes
+
+    def _datasets_parallel(self, processes, chunk_size):
+        dataset_refs = list(self._datasets())
+
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            log.warning('Parallel parsing is not supported on this platform, '
+                        'parsing datasets serially')
+            context = None
+
+        if not context or len(dataset_refs) <= chunk_size:
+            for dataset_ref in dataset_refs:
+                yield self._parse_dataset(dataset_ref)
+            return
+
+        chunks = [dataset_refs[i:i + chunk_size]
+                  for i in range(0, len(dataset_refs), chunk_size)]
+
+        # Instantiate the profiles before forking, so workers inherit them
+        self._get_profiles()
+        # Workers of a disk-backed graph read the triples from the database
+        self.g.commit()
+
+        # The parser is passed to the initializer so it is also set in the
+        # workers started to replace the ones that exit
+        pool = context.Pool(
+            min(processes, len(chunks)),
+            initializer=_init_parser_worker, initargs=(self,))
+
+        try:
+            for dataset_dicts in pool.imap(_parse_datasets_chunk, chunks):
+                for dataset_dict in dataset_dicts:
+                    yield dataset_dict
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+RDF_NS = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+XML_NS = '{http://www.w3.org/XML/1998/namespace}'
+DCAT_DATASET_TAG = '{http://www.w3.org/ns/dcat#}Dataset'
+DCAT_DATASET_PROPERTY_TAG = '{http://www.w3.org/ns/dcat#}dataset'
+
+
+def _is_rdfxml_dataset(element):
+    if element.tag == DCAT_DATASET_TAG:
+        return True
+    return any(child.tag == RDF_NS + 'type'
+               and child.get(RDF_NS + 'resource') == str(DCAT.Dataset)
+               for child in element)
+
+
+def _iter_rdfxml_elements(source):
+    '''
+    Generator that reads an RDF/XML document and returns its top level
+    elements as they are read
+
+    Yields ``(kind, element, wrapper)`` tuples, where ``kind`` is
+    ``dataset`` for dataset elements (top level ones with the
+    ``dcat:Dataset`` type or nested in a ``dcat:dataset`` property of a top
+    level element) and ``context`` for the rest of top level elements. The
+    dataset elements nested in another one are removed from it, and
+    returned as a copy of the parent element with just the ``dcat:dataset``
+    property, so the link to the parent is kept. ``wrapper`` is the root
+    element of the document, without children.
+
+    Elements are removed from the document once returned, so only the one
+    being read is kept in memory.
+    '''
+    stack = []
+    root = None
+    wrapper = None
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+                wrapper = ElementTree.Element(root.tag, root.attrib)
+            stack.append(element)
+            continue
+
+        stack.pop()
+        depth = len(stack)
+        if depth == 1:
+            root.remove(element)
+            if _is_rdfxml_dataset(element):
+                yield 'dataset', element, wrapper
+            else:
+                yield 'context', element, wrapper
+        elif (depth == 3 and stack[-1].tag == DCAT_DATASET_PROPERTY_TAG
+                and _is_rdfxml_dataset(element)):
+            parent, _property = stack[-2], stack[-1]
+            parent.remove(_property)
+            parent_copy = ElementTree.Element(parent.tag, parent.attrib)
+            ElementTree.SubElement(
+                parent_copy, _property.tag, _property.attrib).append(element)
+            yield 'dataset', parent_copy, wrapper
+
+
+class _UnionFind(object):
+    '''
+    Disjoint sets of nodes, used to group the blank nodes linked to each
+    other
+    '''
+
+    def __init__(self):
+        self.parents = {}
+
+    def find(self, node):
+        '''
+        Returns the node that represents the set of the given one
+        '''
+        root = node
+        while self.parents.get(root, root) != root:
+            root = self.parents[root]
+        # Point the nodes in the path straight to the root
+        while node != root:
+            self.parents[node], node = root, self.parents[node]
+        return root
+
+    def union(self, node1, node2):
+        root1, root2 = self.find(node1), self.find(node2)
+        if root1 != root2:
+            self.parents[root2] = root1
+
+
+class _TriplesSink(object):
+    '''
+    Collects the triples read by the rdflib N-Triples and N-Quads parsers
+    '''
+
+    identifier = None
+
+    def __init__(self):
+        self.triples = []
+
+    def triple(self, s, p, o):
+        self.triples.append((s, p, o))
+
+    def get_context(self, identifier):
+        return self
+
+    def add(self, triple):
+        self.triples.append(triple)
+
+
+class _BNodeIds(object):
+    '''
+    Maps the blank node labels of a document to blank node ids
+
+    Ids are derived from the labels rather than stored, so the same label
+    always gets the same id. They have the same form as the ones generated
+    by rdflib, and are different for each document.
+    '''
+
+    def __init__(self):
+        self._prefix = uuid.uuid4().hex
+
+    def get(self, label, default=None):
+        return 'N' + hashlib.md5(
+            (self._prefix + label).encode('utf-8')).hexdigest()
+
+    def __setitem__(self, label, value):
+        pass
 
-            yield dataset_dict
+
+# Parser used by the worker processes forked by RDFParser.datasets()
+_worker_parser = None
+
+
+def _init_parser_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+    # Don't share the database connections inherited from the parent
+    # process, new ones will be created if needed
+    engine = getattr(meta, 'engine', None)
+    if engine is not None:
+        try:
+            engine.dispose(close=False)
+        except TypeError:
+            # SQLAlchemy < 1.4.33
+            pass
+
+
+def _parse_datasets_chunk(dataset_refs):
+    return [_worker_parser._parse_dataset(dataset_ref)
+            for dataset_ref in dataset_refs]
 
 
 class RDFSerializer(RDFProcessor):
@@ -254,8 +1106,7 @@ class RDFSerializer(RDFProcessor):
 
         dataset_ref = URIRef(dataset_uri(dataset_dict))
 
-        for profile_class in self._profiles:
-            profile = profile_class(self.g, compatibility_mode=self.compatibility_mode)
+        for profile in self._get_profiles():
             profile.graph_from_dataset(dataset_dict, dataset_ref)
 
         return dataset_ref
@@ -272,8 +1123,7 @@ class RDFSerializer(RDFProcessor):
 
         catalog_ref = URIRef(catalog_uri())
 
-        for profile_class in self._profiles:
-            profile = profile_class(self.g, compatibility_mode=self.compatibility_mode)
+        for profile in self._get_profiles():
             profile.graph_from_catalog(catalog_dict, catalog_ref)
 
         return catalog_ref
@@ -359,7 +1209,131 @@ class RDFSerializer(RDFProcessor):
 
         return output
 
-    def _add_source_catalog(self, root_catalog_ref, dataset_dict, dataset_ref):
+    def serialize_catalog_stream(self, catalog_dict=None, dataset_dicts=None,
+                                 _format='xml', pagination_info=None):
+        '''
+        Returns an RDF serialization of the whole catalog in chunks
+
+        It takes the same parameters as `serialize_catalog()`, but instead of
+        adding all datasets to the class graph and serializing it at the end,
+        a new small graph is created for each dataset, serialized and
+        discarded. This keeps memory usage stable regardless of the number of
+        datasets, and allows to start sending the output before all datasets
+        have been processed.
+
+        The catalog and the first dataset are serialized before returning,
+        so errors in them are raised by this call, before any output is
+        sent. Errors in the rest of the datasets are raised while iterating
+        over the chunks, after the output has started, so they are logged
+        before being raised.
+
+        Only formats whose serializations can be concatenated are supported
+        (see `STREAMING_FORMATS`). For any other format the output of
+        `serialize_catalog()` is returned as a single chunk.
+
+        Returns an iterator of strings with the serialized chunks
+        '''
+        if not _format:
+            _format = 'xml'
+        _format = url_to_rdflib_format(_format)
+
+        if _format not in STREAMING_FORMATS:
+            return iter([self.serialize_catalog(
+                catalog_dict, dataset_dicts, _format=_format,
+                pagination_info=pagination_info)])
+
+        catalog_ref = self.graph_from_catalog(catalog_dict)
+        if pagination_info:
+            self._add_pagination_triples(pagination_info)
+
+        head = ['['] if _format == 'json-ld' else []
+        output = self._serialize_chunk(_format)
+        head.append(output)
+        first = not output
+
+        dataset_dicts = iter(dataset_dicts or [])
+        added_catalogs = set()
+        dataset_dict = next(dataset_dicts, None)
+        if dataset_dict is not None:
+            output = self._serialize_dataset_chunk(
+                catalog_ref, dataset_dict, _format, first, added_catalogs)
+            head.append(output)
+            first = first and not output
+
+        def chunks(first):
+            for chunk in head:
+                if chunk:
+                    yield chunk
+
+            for dataset_dict in dataset_dicts:
+                try:
+                    output = self._serialize_dataset_chunk(
+                        catalog_ref, dataset_dict, _format, first,
+                        added_catalogs)
+                except Exception:
+                    log.exception(
+                        'Error serializing dataset %s, the catalog output '
+                        'sent is incomplete', dataset_dict.get('id'))
+                    raise
+                if output:
+                    first = False
+                    yield output
+
+            if _format == 'json-ld':
+                yield ']'
+
+        return chunks(first)
+
+    def _serialize_dataset_chunk(self, catalog_ref, dataset_dict, _format,
+                                 first, added_catalogs):
+        '''
+        Serializes a dataset of the catalog in its own graph, as one of the
+        chunks returned by `serialize_catalog_stream()`
+
+        The class graph is left as it was.
+        '''
+        catalog_graph = self.g
+        self.g = rdflib.ConjunctiveGraph()
+        try:
+            dataset_ref = self.graph_from_dataset(dataset_dict)
+
+            cat_ref = self._add_source_catalog(
+                catalog_ref, dataset_dict, dataset_ref, added_catalogs)
+            if not cat_ref:
+                self.g.add((catalog_ref, DCAT.dataset, dataset_ref))
+
+            return self._serialize_chunk(_format, first)
+        finally:
+            self.g = catalog_graph
+
+    def _serialize_chunk(self, _format, first=True):
+        '''
+        Serializes the class graph as one of the chunks returned by
+        `serialize_catalog_stream()`
+
+        JSON-LD documents are turned into a comma separated list of nodes,
+        so they can be added to the top level array.
+        '''
+        output = self.g.serialize(format=_format)
+
+        if _format == 'nt':
+            # Keep the triples of each subject together, so the output can
+            # be parsed in streaming mode (see RDFParser.parse)
+            output = ''.join(
+                line + '\n' for line in sorted(output.splitlines()) if line)
+
+        if _format == 'json-ld':
+            nodes = json.loads(output)
+            if not nodes:
+                return ''
+            output = ',\n'.join(json.dumps(node) for node in nodes)
+            if not first:
+                output = ',\n' + output
+
+        return output
+
+    def _add_source_catalog(self, root_catalog_ref, dataset_dict, dataset_ref,
+                            added_catalogs=None):
         if not p.toolkit.asbool(config.get(DCAT_EXPOSE_SUBCATALOGS, False)):
             return
 
@@ -375,8 +1349,14 @@ class RDFSerializer(RDFProcessor):
         g = self.g
         catalog_ref = URIRef(source_uri)
 
-        # we may have multiple subcatalogs, let's check if this one has been already added
+        # we may have multiple subcatalogs, let's check if this one has been
+        # already added (to this graph, or to a previous one when streaming)
+        if added_catalogs is not None and catalog_ref in added_catalogs:
+            return catalog_ref
+
         if (root_catalog_ref, DCT.hasPart, catalog_ref) not in g:
+            if added_catalogs is not None:
+                added_catalogs.add(catalog_ref)
 
             g.add((root_catalog_ref, DCT.hasPart, catalog_ref))
             g.add((catalog_ref, RDF.type, DCAT.Catalog))
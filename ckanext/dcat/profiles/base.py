@@ -114,6 +114,100 @@ class CleanedURIRef(object):
         return URIRef(value)
 
 
+def get_dataset_schema(dataset_type="dataset"):
+    """
+    Returns the ckanext-scheming schema for the provided dataset type, or
+    None if ckanext-scheming is not enabled
+
+    Raises ObjectNotFound if the dataset type is not defined in scheming.
+    """
+    try:
+        schema_show = get_action("scheming_dataset_schema_show")
+    except KeyError:
+        return None
+
+    try:
+        return schema_show({}, {"type": dataset_type})
+    except ObjectNotFound:
+        raise ObjectNotFound(f"Unknown dataset schema: {dataset_type}")
+
+
+class SchemaIndex(object):
+    """
+    Dict based indexes of the fields of a ckanext-scheming dataset schema
+
+    Built once per schema (see `get_schema_index()`) so profiles can look up
+    fields by name without scanning the schema fields lists.
+    """
+
+    def __init__(self, dataset_schema):
+        self.dataset_fields = self._fields_by_name(
+            dataset_schema.get("dataset_fields", [])
+        )
+        self.resource_fields = self._fields_by_name(
+            dataset_schema.get("resource_fields", [])
+        )
+
+        # Names of the fields using the multiple text preset
+        self.dataset_multiple_text = self._multiple_text(self.dataset_fields)
+        self.resource_multiple_text = self._multiple_text(self.resource_fields)
+
+        # Field names of the subfields of each repeating subfields field
+        self.dataset_repeating_subfields = self._repeating_subfields(
+            self.dataset_fields
+        )
+        self.resource_repeating_subfields = self._repeating_subfields(
+            self.resource_fields
+        )
+
+    @staticmethod
+    def _fields_by_name(fields):
+        fields_by_name = {}
+        for field in fields:
+            # Keep the first one if a field is defined more than once
+            fields_by_name.setdefault(field["field_name"], field)
+        return fields_by_name
+
+    @staticmethod
+    def _multiple_text(fields_by_name):
+        return frozenset(
+            name
+            for name, field in fields_by_name.items()
+            if "scheming_multiple_text" in field.get("validators", "")
+        )
+
+    @staticmethod
+    def _repeating_subfields(fields_by_name):
+        return {
+            name: frozenset(f["field_name"] for f in field["repeating_subfields"])
+            for name, field in fields_by_name.items()
+            if "repeating_subfields" in field
+        }
+
+
+# Schema indexes, keyed by the id of the schema dict. The schema itself is
+# stored as well so its id can't be reused by another object
+_schema_indexes = {}
+
+
+def get_schema_index(dataset_schema):
+    """
+    Returns the `SchemaIndex` for the provided dataset schema dict
+
+    Indexes are created the first time a schema is seen and shared by all
+    profile instances afterwards. ckanext-scheming returns the same dict for
+    each dataset type, so only one index per dataset type is built.
+    """
+    cached = _schema_indexes.get(id(dataset_schema))
+    if cached is not None and cached[0] is dataset_schema:
+        return cached[1]
+
+    schema_index = SchemaIndex(dataset_schema)
+    _schema_indexes[id(dataset_schema)] = (dataset_schema, schema_index)
+
+    return schema_index
+
+
 class RDFProfile(object):
     """Base class with helper methods for implementing RDF parsing profiles
 
@@ -130,32 +224,43 @@ class RDFProfile(object):
     # Cache for organization_show details (used for publisher fallback)
     _org_cache: dict = {}
 
-    def __init__(self, graph, dataset_type="dataset", compatibility_mode=False):
+    def __init__(self, graph, dataset_type="dataset", compatibility_mode=False,
+                 dataset_schema=None):
         """Class constructor
         Graph is an rdflib.Graph instance.
         A scheming dataset type can be provided, in which case the scheming schema
-        will be loaded so it can be used by profiles.
+        will be loaded so it can be used by profiles. If the schema has already
+        been loaded (eg by the parser or serializer) it can be passed directly
+        via `dataset_schema`.
         In compatibility mode, some fields are modified to maintain
         compatibility with previous versions of the ckanext-dcat parsers
         (eg adding the `dcat_` prefix or storing comma separated lists instead
         of JSON dumps).
+
+        Profile instances are reused by the parsers and serializers for all
+        the datasets they process, see `reset()`.
         """
 
         self.g = graph
 
         self.compatibility_mode = compatibility_mode
 
-        try:
-            schema_show = get_action("scheming_dataset_schema_show")
-            try:
-                schema = schema_show({}, {"type": dataset_type})
-            except ObjectNotFound:
-                raise ObjectNotFound(f"Unknown dataset schema: {dataset_type}")
+        if dataset_schema is None:
+            dataset_schema = get_dataset_schema(dataset_type)
 
-            self._dataset_schema = schema
+        if dataset_schema is not None:
+            self._dataset_schema = dataset_schema
 
-        except KeyError:
-            pass
+    def reset(self):
+        """
+        Called by the parsers and serializers before each dataset is processed
+
+        Profile instances are reused across datasets, so profiles that store
+        state specific to a particular dataset on the instance should
+        override this method to clear it. Caches that are valid for all
+        datasets can be kept.
+        """
+        pass
 
     def _datasets(self):
         """
@@ -775,29 +880,37 @@ class RDFProfile(object):
                 }
             )
 
+    @property
+    def _schema_index(self):
+        """
+        Returns the `SchemaIndex` of the dataset schema, if one was provided
+        """
+        if not self._dataset_schema:
+            return None
+
+        return get_schema_index(self._dataset_schema)
+
     def _schema_field(self, key):
         """
         Returns the schema field information if the provided key exists as a field in
         the dataset schema (if one was provided)
         """
-        if not self._dataset_schema:
+        schema_index = self._schema_index
+        if not schema_index:
             return None
 
-        for field in self._dataset_schema["dataset_fields"]:
-            if field["field_name"] == key:
-                return field
+        return schema_index.dataset_fields.get(key)
 
     def _schema_resource_field(self, key):
         """
         Returns the schema field information if the provided key exists as a field in
         the resources fields of the dataset schema (if one was provided)
         """
-        if not self._dataset_schema:
+        schema_index = self._schema_index
+        if not schema_index:
             return None
 
-        for field in self._dataset_schema["resource_fields"]:
-            if field["field_name"] == key:
-                return field
+        return schema_index.resource_fields.get(key)
 
     def _set_dataset_value(self, dataset_dict, key, value):
         """
@@ -818,15 +931,15 @@ class RDFProfile(object):
         return dataset_dict
 
     def _set_list_dataset_value(self, dataset_dict, key, value):
-        schema_field = self._schema_field(key)
-        if schema_field and "scheming_multiple_text" in schema_field["validators"]:
+        schema_index = self._schema_index
+        if schema_index and key in schema_index.dataset_multiple_text:
             return self._set_dataset_value(dataset_dict, key, value)
         else:
             return self._set_dataset_value(dataset_dict, key, json.dumps(value))
 
     def _set_list_resource_value(self, resource_dict, key, value):
-        schema_field = self._schema_resource_field(key)
-        if schema_field and "scheming_multiple_text" in schema_field["validators"]:
+        schema_index = self._schema_index
+        if schema_index and key in schema_index.resource_multiple_text:
             resource_dict[key] = value
         else:
             resource_dict[key] = json.dumps(value)
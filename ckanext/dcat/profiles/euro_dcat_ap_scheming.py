@@ -32,7 +32,8 @@ class EuropeanDCATAPSchemingProfile(RDFProfile):
             * Turn namespaced extras into repeating subfields
         """
 
-        if not self._dataset_schema:
+        schema_index = self._schema_index
+        if not schema_index:
             # Not using scheming
             return dataset_dict
 
@@ -41,7 +42,7 @@ class EuropeanDCATAPSchemingProfile(RDFProfile):
         extras_to_remove = []
         extras = dataset_dict.get("extras", [])
         for extra in extras:
-            if self._schema_field(extra["key"]):
+            if extra["key"] in schema_index.dataset_fields:
                 # This is a field defined in the dataset schema
                 dataset_dict[extra["key"]] = extra["value"]
                 extras_to_remove.append(extra["key"])
@@ -49,14 +50,13 @@ class EuropeanDCATAPSchemingProfile(RDFProfile):
         dataset_dict["extras"] = [e for e in extras if e["key"] not in extras_to_remove]
 
         # Parse lists
-        def _parse_list_value(data_dict, field_name):
-            schema_field = self._schema_field(
-                field_name
-            ) or self._schema_resource_field(field_name)
+        def _is_multiple_text(field_name):
+            if field_name in schema_index.dataset_fields:
+                return field_name in schema_index.dataset_multiple_text
+            return field_name in schema_index.resource_multiple_text
 
-            if schema_field and "scheming_multiple_text" in schema_field.get(
-                "validators", []
-            ):
+        def _parse_list_value(data_dict, field_name):
+            if _is_multiple_text(field_name):
                 if isinstance(data_dict[field_name], str):
                     try:
                         data_dict[field_name] = json.loads(data_dict[field_name])
@@ -74,44 +74,38 @@ class EuropeanDCATAPSchemingProfile(RDFProfile):
         new_fields_mapping = {
             "temporal_coverage": "temporal"
         }
-        for schema_field in self._dataset_schema["dataset_fields"]:
-            if "repeating_subfields" in schema_field:
-                # Check if existing extras need to be migrated
-                field_name = schema_field["field_name"]
-                new_extras = []
-                new_dict = {}
-                check_name = new_fields_mapping.get(field_name, field_name)
-                for extra in dataset_dict.get("extras", []):
-                    if extra["key"].startswith(f"{check_name}_"):
-                        subfield = extra["key"][extra["key"].index("_") + 1 :]
-                        if subfield in [
-                            f["field_name"] for f in schema_field["repeating_subfields"]
-                        ]:
-                            new_dict[subfield] = extra["value"]
-                        else:
-                            new_extras.append(extra)
+        for field_name, subfields in schema_index.dataset_repeating_subfields.items():
+            # Check if existing extras need to be migrated
+            new_extras = []
+            new_dict = {}
+            check_name = new_fields_mapping.get(field_name, field_name)
+            for extra in dataset_dict.get("extras", []):
+                if extra["key"].startswith(f"{check_name}_"):
+                    subfield = extra["key"][extra["key"].index("_") + 1 :]
+                    if subfield in subfields:
+                        new_dict[subfield] = extra["value"]
                     else:
                         new_extras.append(extra)
-                if new_dict:
-                    dataset_dict[field_name] = [new_dict]
-                    dataset_dict["extras"] = new_extras
+                else:
+                    new_extras.append(extra)
+            if new_dict:
+                dataset_dict[field_name] = [new_dict]
+                dataset_dict["extras"] = new_extras
 
         # Repeating subfields: resources
-        for schema_field in self._dataset_schema["resource_fields"]:
-            if "repeating_subfields" in schema_field:
-                # Check if value needs to be load from JSON
-                field_name = schema_field["field_name"]
-                for resource_dict in dataset_dict.get("resources", []):
-                    if resource_dict.get(field_name) and isinstance(
-                        resource_dict[field_name], str
-                    ):
-                        try:
-                            # TODO: load only subfields in schema?
-                            resource_dict[field_name] = json.loads(
-                                resource_dict[field_name]
-                            )
-                        except ValueError:
-                            pass
+        for field_name in schema_index.resource_repeating_subfields:
+            # Check if value needs to be load from JSON
+            for resource_dict in dataset_dict.get("resources", []):
+                if resource_dict.get(field_name) and isinstance(
+                    resource_dict[field_name], str
+                ):
+                    try:
+                        # TODO: load only subfields in schema?
+                        resource_dict[field_name] = json.loads(
+                            resource_dict[field_name]
+                        )
+                    except ValueError:
+                        pass
 
         return dataset_dict
 
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import logging
+import tempfile
+import weakref
+
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.store import Store, VALID_STORE
+from rdflib.plugins.stores.memory import Memory
+
+log = logging.getLogger(__name__)
+
+DISK_STORE_THRESHOLD_CONFIG = 'ckanext.dcat.disk_store.threshold'
+DISK_STORE_PATH_CONFIG = 'ckanext.dcat.disk_store.path'
+
+# Number of rows read from the database at once when iterating over triples
+FETCH_SIZE = 1000
+
+# Number of term ids kept in memory to avoid looking them up again
+TERM_IDS_CACHE_SIZE = 100000
+
+SCHEMA = [
+    'CREATE TABLE terms (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE quads (s INTEGER NOT NULL, p INTEGER NOT NULL, '
+    'o INTEGER NOT NULL, c INTEGER NOT NULL, '
+    'PRIMARY KEY (s, p, o, c)) WITHOUT ROWID',
+    'CREATE INDEX quads_pos ON quads (p, o, s)',
+    'CREATE INDEX quads_osp ON quads (o, s, p)',
+    'CREATE INDEX quads_c ON quads (c)',
+]
+
+
+class SQLiteStore(Store):
+    '''
+    An rdflib store that keeps the triples in a SQLite database, so graphs
+    bigger than the available memory can be parsed
+
+    Triples are kept in memory until there are more than ``threshold`` of
+    them, and then moved to a temporary database created in ``directory``
+    (the system temporary directory by default). The database is removed
+    when the store is closed or garbage collected.
+
+    Terms are stored once in their own table, and triples as the ids of
+    their terms, indexed by subject, predicate and object. Namespace
+    bindings are always kept in memory.
+
+    It can be used as the store of an ``rdflib.ConjunctiveGraph``, eg::
+
+        graph = rdflib.ConjunctiveGraph(store=SQLiteStore(threshold=100000))
+
+    Processes forked after the triples have been committed (see
+    ``commit()``) open their own connection to the database, so they can
+    read them.
+    '''
+
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, threshold=0, directory=None):
+        super(SQLiteStore, self).__init__()
+        self.threshold = threshold
+        self.directory = directory
+        self.path = None
+
+        self._memory = Memory()
+        self._namespaces = Memory()
+        self._connection = None
+        self._pid = None
+        self._finalizer = None
+        self._term_ids = {}
+
+        if threshold <= 0:
+            self._move_to_disk()
+
+    @property
+    def on_disk(self):
+        '''
+        Whether the triples are stored in the database
+        '''
+        return self._memory is None
+
+    def open(self, configuration, create=False):
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        '''
+        Removes the database, if created
+        '''
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+            self._connection = None
+            self._memory = Memory()
+            self._term_ids = {}
+
+    def destroy(self, configuration=None):
+        self.close()
+
+    def commit(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.commit()
+
+    def rollback(self):
+        pass
+
+    def add(self, triple, context, quoted=False):
+        if self._memory is not None:
+            self._memory.add(triple, context, quoted)
+            if len(self._memory) > self.threshold:
+                self._move_to_disk()
+            return
+
+        self._db().execute(
+            'INSERT OR IGNORE INTO quads (s, p, o, c) VALUES (?, ?, ?, ?)',
+            [self._term_id(term, create=True)
+             for term in triple + (_context_id(context),)])
+
+    def addN(self, quads):
+        for s, p, o, c in quads:
+            self.add((s, p, o), c)
+
+    def remove(self, triple, context=None):
+        if self._memory is not None:
+            self._memory.remove(triple, context)
+            return
+
+        where, params = self._where(triple, context)
+        if where is None:
+            return
+        self._db().execute('DELETE FROM quads' + where, params)
+
+    def triples(self, triple_pattern, context=None):
+        if self._memory is not None:
+            for triple, contexts in self._memory.triples(
+                    triple_pattern, context):
+                yield triple, contexts
+            return
+
+        where, params = self._where(triple_pattern, context)
+        if where is None:
+            return
+
+        # Triples in more than one context are returned once
+        cursor = self._db().execute(
+            'SELECT q.s, q.p, q.o, ts.value, tp.value, tob.value '
+            'FROM (SELECT DISTINCT s, p, o FROM quads{0}) q '
+            'JOIN terms ts ON ts.id = q.s '
+            'JOIN terms tp ON tp.id = q.p '
+            'JOIN terms tob ON tob.id = q.o'.format(where), params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                triple = (_decode(row[3]), _decode(row[4]), _decode(row[5]))
+                if context is not None:
+                    contexts = iter([context])
+                else:
+                    contexts = self._triple_contexts(row[:3])
+                yield triple, contexts
+
+    def __len__(self, context=None):
+        if self._memory is not None:
+            return self._memory.__len__(context)
+
+        if context is None:
+            query = 'SELECT COUNT(*) FROM (SELECT DISTINCT s, p, o FROM quads)'
+            params = []
+        else:
+            context_id = self._term_id(_context_id(context))
+            if context_id is None:
+                return 0
+            query = 'SELECT COUNT(*) FROM quads WHERE c = ?'
+            params = [context_id]
+        return self._db().execute(query, params).fetchone()[0]
+
+    def contexts(self, triple=None):
+        if self._memory is not None:
+            for context in self._memory.contexts(triple):
+                yield context
+            return
+
+        if triple is None:
+            query = 'SELECT DISTINCT c FROM quads'
+            params = []
+        else:
+            ids = [self._term_id(term) for term in triple]
+            if None in ids:
+                return
+            query = 'SELECT c FROM quads WHERE s = ? AND p = ? AND o = ?'
+            params = ids
+        context_ids = [row[0] for row in self._db().execute(query, params)]
+        for context_id in context_ids:
+            yield self._context(context_id)
+
+    def bind(self, prefix, namespace, override=True):
+        self._namespaces.bind(prefix, namespace, override=override)
+
+    def namespace(self, prefix):
+        return self._namespaces.namespace(prefix)
+
+    def prefix(self, namespace):
+        return self._namespaces.prefix(namespace)
+
+    def namespaces(self):
+        for prefix, namespace in self._namespaces.namespaces():
+            yield prefix, namespace
+
+    def _move_to_disk(self):
+        '''
+        Creates the database and moves the triples kept in memory to it
+        '''
+        fd, self.path = tempfile.mkstemp(
+            prefix='ckanext-dcat-', suffix='.sqlite', dir=self.directory)
+        os.close(fd)
+
+        connection = self._connect()
+        for statement in SCHEMA:
+            connection.execute(statement)
+        self._finalizer = weakref.finalize(
+            self, _remove_database, connection, self.path, os.getpid())
+
+        memory, self._memory = self._memory, None
+        if memory is not None and len(memory):
+            log.debug('Moving %d triples to disk store %s',
+                      len(memory), self.path)
+            for triple, contexts in memory.triples((None, None, None)):
+                for context in contexts:
+                    self.add(triple, context)
+
+    def _connect(self):
+        self._connection = sqlite3.connect(self.path)
+        self._pid = os.getpid()
+        # The database is temporary, there's no need to recover it after a
+        # crash
+        self._connection.execute('PRAGMA journal_mode = OFF')
+        self._connection.execute('PRAGMA synchronous = OFF')
+        return self._connection
+
+    def _db(self):
+        '''
+        Returns the connection to the database, opening a new one if the
+        process was forked
+        '''
+        if self._pid != os.getpid():
+            self._term_ids = {}
+            return self._connect()
+        return self._connection
+
+    def _term_id(self, term, create=False):
+        '''
+        Returns the id of the given term, or None if it is not stored and
+        ``create`` is False
+        '''
+        value = _encode(term)
+        term_id = self._term_ids.get(value)
+        if term_id is not None:
+            return term_id
+
+        db = self._db()
+        row = db.execute(
+            'SELECT id FROM terms WHERE value = ?', (value,)).fetchone()
+        if row:
+            term_id = row[0]
+        elif create:
+            term_id = db.execute(
+                'INSERT INTO terms (value) VALUES (?)', (value,)).lastrowid
+        else:
+            return None
+
+        if len(self._term_ids) >= TERM_IDS_CACHE_SIZE:
+            self._term_ids = {}
+        self._term_ids[value] = term_id
+        return term_id
+
+    def _where(self, triple_pattern, context):
+        '''
+        Returns the WHERE clause and parameters to select the quads that
+        match the given pattern and context, or None if some of the terms
+        are not stored
+        '''
+        conditions = []
+        params = []
+        for column, term in zip('spo', triple_pattern):
+            if term is None:
+                continue
+            term_id = self._term_id(term)
+            if term_id is None:
+                return None, None
+            conditions.append('{0} = ?'.format(column))
+            params.append(term_id)
+
+        if context is not None:
+            context_id = self._term_id(_context_id(context))
+            if context_id is None:
+                return None, None
+            conditions.append('c = ?')
+            params.append(context_id)
+
+        if not conditions:
+            return '', params
+        return ' WHERE ' + ' AND '.join(conditions), params
+
+    def _triple_contexts(self, ids):
+        rows = self._db().execute(
+            'SELECT c FROM quads WHERE s = ? AND p = ? AND o = ?',
+            ids).fetchall()
+        for row in rows:
+            yield self._context(row[0])
+
+    def _context(self, context_id):
+        value = self._db().execute(
+            'SELECT value FROM terms WHERE id = ?', (context_id,)).fetchone()[0]
+        return Graph(store=self, identifier=_decode(value))
+
+
+def _context_id(context):
+    return getattr(context, 'identifier', context)
+
+
+def _encode(term):
+    if isinstance(term, Literal):
+        return u'L{0}\x1f{1}\x1f{2}'.format(
+            term.datatype or '', term.language or '', term)
+    if isinstance(term, BNode):
+        return u'B' + term
+    if isinstance(term, URIRef):
+        return u'U' + term
+    raise ValueError('Unsupported term: {0!r}'.format(term))
+
+
+def _decode(value):
+    kind, value = value[0], value[1:]
+    if kind == 'U':
+        return URIRef(value)
+    if kind == 'B':
+        return BNode(value)
+    datatype, language, lexical = value.split('\x1f', 2)
+    return Literal(lexical, lang=language or None, datatype=datatype or None)
+
+
+def _remove_database(connection, path, pid):
+    # Forked processes don't own the database
+    if os.getpid() != pid:
+        return
+    try:
+        connection.close()
+    except sqlite3.Error:
+        pass
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,73 @@
+'''
+Benchmark for the fixed cost of importing a harvest object
+
+Compares building the package schemas and resolving the
+``IDCATRDFHarvester`` implementations for every object (the previous
+behaviour of the RDF harvester import stage) with reusing the
+``ImportContext`` of the job. Run it with:
+
+    python -m ckanext.dcat.tests.benchmark_import
+
+'''
+import timeit
+
+import ckan.lib.plugins as lib_plugins
+from ckan import plugins as p
+from ckantoolkit import config
+
+from ckanext.dcat.harvesters import DCATRDFHarvester
+from ckanext.dcat.harvesters.base import ImportContext
+from ckanext.dcat.interfaces import IDCATRDFHarvester
+
+NUMBER = 1000
+
+
+def _per_object(action):
+    # How the schema was built for each object before the import context
+    package_plugin = lib_plugins.lookup_package_plugin(None)
+    if action == 'create':
+        schema = package_plugin.create_package_schema()
+        for harvester in p.PluginImplementations(IDCATRDFHarvester):
+            schema = harvester.update_package_schema_for_create(schema)
+    else:
+        schema = package_plugin.update_package_schema()
+        for harvester in p.PluginImplementations(IDCATRDFHarvester):
+            schema = harvester.update_package_schema_for_update(schema)
+    for harvester in p.PluginImplementations(IDCATRDFHarvester):
+        pass
+    return schema
+
+
+def _per_job(import_context, action):
+    schema = import_context.get_package_schema(None, action)
+    for harvester in import_context.harvester_plugins:
+        pass
+    return schema
+
+
+def _report(label, seconds, number=1):
+    print('{0:<50} {1:10.3f} ms'.format(label, seconds / number * 1000))
+
+
+def main():
+    # Avoid looking up the site user in the database
+    config['ckanext.harvest.user_name'] = 'harvest'
+    lib_plugins.register_package_plugins()
+
+    import_context = ImportContext(DCATRDFHarvester(), 'benchmark', None)
+
+    print('Per object (average of {0} objects)'.format(NUMBER))
+    for action in ('create', 'update'):
+        _report(
+            '{0} schema, per object (previous behaviour)'.format(action),
+            timeit.timeit(lambda: _per_object(action), number=NUMBER),
+            NUMBER)
+        _report(
+            '{0} schema, ImportContext'.format(action),
+            timeit.timeit(lambda: _per_job(import_context, action),
+                          number=NUMBER),
+            NUMBER)
+
+
+if __name__ == '__main__':
+    main()
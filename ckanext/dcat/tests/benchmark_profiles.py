@@ -0,0 +1,84 @@
+'''
+Benchmark for the loading of RDF profiles
+
+Compares the startup cost of importing ``pkg_resources`` vs
+``importlib.metadata`` and the per-request cost of resolving the profiles
+when creating a new parser or serializer. Run it with:
+
+    python -m ckanext.dcat.tests.benchmark_profiles
+
+'''
+import subprocess
+import sys
+import timeit
+
+from ckanext.dcat.processors import (
+    RDF_PROFILES_ENTRY_POINT_GROUP,
+    RDFSerializer,
+    load_profiles,
+    reload_profiles,
+)
+
+PROFILES = ['euro_dcat_ap_2', 'schemaorg']
+NUMBER = 200
+
+
+def _import_time(module):
+    code = (
+        'import time; s = time.perf_counter(); import {0}; '
+        'print(time.perf_counter() - s)'.format(module))
+    times = [
+        float(subprocess.check_output([sys.executable, '-c', code]))
+        for i in range(5)
+    ]
+    return min(times)
+
+
+def _scan_entry_points(profile_names):
+    # How profiles were loaded before the registry was introduced
+    from pkg_resources import iter_entry_points
+    profiles = []
+    for profile_name in profile_names:
+        for profile in iter_entry_points(
+                group=RDF_PROFILES_ENTRY_POINT_GROUP, name=profile_name):
+            profiles.append(profile.load())
+            break
+    return profiles
+
+
+def _cold_load():
+    reload_profiles()
+    load_profiles(PROFILES)
+
+
+def _report(label, seconds, number=1):
+    print('{0:<45} {1:10.3f} ms'.format(label, seconds / number * 1000))
+
+
+def main():
+    print('Startup')
+    _report('import pkg_resources', _import_time('pkg_resources'))
+    _report('import importlib.metadata', _import_time('importlib.metadata'))
+
+    print('\nPer call (average of {0} calls)'.format(NUMBER))
+    _report(
+        'iter_entry_points (previous behaviour)',
+        timeit.timeit(lambda: _scan_entry_points(PROFILES), number=NUMBER),
+        NUMBER)
+    _report(
+        'load_profiles, cold registry',
+        timeit.timeit(_cold_load, number=NUMBER),
+        NUMBER)
+    load_profiles(PROFILES)
+    _report(
+        'load_profiles, warm registry',
+        timeit.timeit(lambda: load_profiles(PROFILES), number=NUMBER),
+        NUMBER)
+    _report(
+        'RDFSerializer()',
+        timeit.timeit(lambda: RDFSerializer(profiles=PROFILES), number=NUMBER),
+        NUMBER)
+
+
+if __name__ == '__main__':
+    main()
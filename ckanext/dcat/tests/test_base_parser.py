@@ -1,25 +1,39 @@
 from builtins import str
 from builtins import object
+from unittest import mock
+import io
+import json
+import multiprocessing
+import os
+import re
 
 import pytest
 
 from ckantoolkit import config
 
-from rdflib import Graph, URIRef, Literal
-from rdflib.namespace import Namespace, RDF
+from rdflib import Graph, URIRef, Literal, BNode
+from rdflib.namespace import Namespace, RDF, FOAF
 
 from ckanext.dcat.processors import (
     RDFParser,
     RDFParserException,
+    RDFSerializer,
     RDFProfileException,
     DEFAULT_RDF_PROFILES,
-    RDF_PROFILES_CONFIG_OPTION
+    RDF_PROFILES_CONFIG_OPTION,
+    load_profiles,
+    reload_profiles,
 )
+from ckanext.dcat import processors
 
 from ckanext.dcat.profiles import RDFProfile
+from ckanext.dcat.utils import DCAT_EXPOSE_SUBCATALOGS
+from ckanext.dcat.store import SQLiteStore
 
 DCT = Namespace("http://purl.org/dc/terms/")
 DCAT = Namespace("http://www.w3.org/ns/dcat#")
+HYDRA = Namespace("http://www.w3.org/ns/hydra/core#")
+VCARD = Namespace("http://www.w3.org/2006/vcard/ns#")
 
 
 def _default_graph():
@@ -71,6 +85,28 @@ class MockRDFProfile2(RDFProfile):
         return dataset_dict
 
 
+class MockRDFProfileWithState(RDFProfile):
+
+    instances = 0
+
+    def __init__(self, *args, **kwargs):
+        super(MockRDFProfileWithState, self).__init__(*args, **kwargs)
+        MockRDFProfileWithState.instances += 1
+        self.dataset_ref = None
+
+    def reset(self):
+        self.dataset_ref = None
+
+    def parse_dataset(self, dataset_dict, dataset_ref):
+
+        assert self.dataset_ref is None
+        self.dataset_ref = dataset_ref
+
+        dataset_dict['profile_instance'] = id(self)
+
+        return dataset_dict
+
+
 class TestRDFParser(object):
 
     def test_default_profile(self):
@@ -108,6 +144,38 @@ class TestRDFParser(object):
 
             assert str(e) == 'Unknown RDF profiles: not_found'
 
+    def test_profiles_registry_scans_entry_points_once(self):
+
+        reload_profiles()
+
+        with mock.patch.object(
+                processors, 'entry_points',
+                wraps=processors.entry_points) as mock_entry_points:
+            p1 = RDFParser(profiles=['euro_dcat_ap', 'schemaorg'])
+            p2 = RDFParser(profiles=['euro_dcat_ap', 'schemaorg'])
+            p3 = RDFParser(profiles=['schemaorg'])
+
+        assert mock_entry_points.call_count == 1
+
+        assert [pr.name for pr in p1._profiles] == ['euro_dcat_ap', 'schemaorg']
+        assert p1._profiles == p2._profiles
+        assert p1._profiles is not p2._profiles
+        assert p3._profiles == [p1._profiles[1]]
+
+    def test_profiles_registry_reload(self):
+
+        load_profiles(['euro_dcat_ap'])
+
+        reload_profiles()
+
+        with mock.patch.object(
+                processors, 'entry_points',
+                wraps=processors.entry_points) as mock_entry_points:
+            profiles = load_profiles(['euro_dcat_ap'])
+
+        assert mock_entry_points.call_count == 1
+        assert profiles[0].name == 'euro_dcat_ap'
+
     def test_profiles_are_called_on_datasets(self):
 
         p = RDFParser()
@@ -120,6 +188,85 @@ class TestRDFParser(object):
             assert dataset['profile_1']
             assert dataset['profile_2']
 
+    def test_profiles_are_instantiated_once(self):
+
+        MockRDFProfileWithState.instances = 0
+
+        p = RDFParser()
+
+        p._profiles = [MockRDFProfileWithState]
+
+        p.g = _default_graph()
+
+        datasets = [d for d in p.datasets()]
+
+        assert len(datasets) == 3
+        assert MockRDFProfileWithState.instances == 1
+        assert len(set(d['profile_instance'] for d in datasets)) == 1
+
+    def test_profiles_use_current_graph(self):
+
+        p = RDFParser()
+
+        p.g = _default_graph()
+        assert len([d for d in p.datasets()]) == 3
+
+        # Graph replaced after the profiles were instantiated
+        g = Graph()
+        g.add((URIRef('http://example.org/datasets/4'), RDF.type, DCAT.Dataset))
+        g.add((URIRef('http://example.org/datasets/4'), DCT.title, Literal('Test Dataset 4')))
+        p.g = g
+
+        datasets = [d for d in p.datasets()]
+
+        assert len(datasets) == 1
+        assert datasets[0]['title'] == 'Test Dataset 4'
+
+    def test_datasets_parallel(self):
+
+        p = RDFParser(profiles=['euro_dcat_ap'])
+
+        p.g = _default_graph()
+
+        serial = [d for d in p.datasets()]
+        parallel = [d for d in p.datasets(processes=2, chunk_size=1)]
+
+        assert len(parallel) == 3
+        assert parallel == serial
+
+    def test_datasets_parallel_replaced_workers(self):
+
+        p = RDFParser(profiles=['euro_dcat_ap'])
+
+        p.g = _default_graph()
+
+        serial = [d for d in p.datasets()]
+
+        pool_method = multiprocessing.context.ForkContext.Pool
+
+        def pool(self, *args, **kwargs):
+            # Each worker exits after parsing a chunk, and is replaced
+            return pool_method(self, *args, maxtasksperchild=1, **kwargs)
+
+        with mock.patch('multiprocessing.context.ForkContext.Pool', pool):
+            parallel = [d for d in p.datasets(processes=2, chunk_size=1)]
+
+        assert parallel == serial
+        assert processors._worker_parser is None
+
+    def test_datasets_parallel_one_chunk(self):
+
+        p = RDFParser(profiles=['euro_dcat_ap'])
+
+        p.g = _default_graph()
+
+        with mock.patch('multiprocessing.context.ForkContext.Pool') as mock_pool:
+            datasets = [d for d in p.datasets(processes=2)]
+
+        # Not worth starting worker processes
+        mock_pool.assert_not_called()
+        assert len(datasets) == 3
+
     def test_parse_data(self):
 
         data = '''<?xml version="1.0" encoding="utf-8" ?>
@@ -163,6 +310,43 @@ class TestRDFParser(object):
 
         assert p.next_page() == 'http://example.com/catalog.xml?page=2'
 
+    def test_parse_pagination_info(self):
+
+        data = '''<?xml version="1.0" encoding="utf-8" ?>
+        <rdf:RDF
+         xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"
+         xmlns:hydra="http://www.w3.org/ns/hydra/core#">
+         <hydra:PagedCollection rdf:about="http://example.com/catalog.xml?page=1">
+            <hydra:totalItems rdf:datatype="http://www.w3.org/2001/XMLSchema#integer">245</hydra:totalItems>
+            <hydra:lastPage>http://example.com/catalog.xml?page=3</hydra:lastPage>
+            <hydra:itemsPerPage rdf:datatype="http://www.w3.org/2001/XMLSchema#integer">100</hydra:itemsPerPage>
+            <hydra:next>http://example.com/catalog.xml?page=2</hydra:next>
+            <hydra:firstPage>http://example.com/catalog.xml?page=1</hydra:firstPage>
+        </hydra:PagedCollection>
+        </rdf:RDF>
+        '''
+
+        p = RDFParser()
+
+        p.parse(data)
+
+        assert p.pagination() == {
+            'next': 'http://example.com/catalog.xml?page=2',
+            'first': 'http://example.com/catalog.xml?page=1',
+            'last': 'http://example.com/catalog.xml?page=3',
+            'count': 245,
+            'items_per_page': 100,
+        }
+
+    def test_parse_pagination_info_no_pagination(self):
+
+        p = RDFParser()
+
+        p.parse(_default_graph().serialize(format='xml'))
+
+        assert p.pagination() == {}
+
     def test_parse_pagination_next_page_updated_vocabulary_only(self):
 
         data = '''<?xml version="1.0" encoding="utf-8" ?>
@@ -248,6 +432,24 @@ class TestRDFParser(object):
 
         assert p.next_page() == None
 
+    def test_parse_file(self):
+
+        data = b'''<?xml version="1.0" encoding="utf-8" ?>
+        <rdf:RDF
+         xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#">
+        <rdfs:SomeClass rdf:about="http://example.org">
+            <rdfs:label>Some label</rdfs:label>
+        </rdfs:SomeClass>
+        </rdf:RDF>
+        '''
+
+        p = RDFParser()
+
+        p.parse(io.BytesIO(data))
+
+        assert len(p.g) == 2
+
     def test_parse_data_different_format(self):
 
         data = '''
@@ -319,3 +521,620 @@ class TestRDFParser(object):
         p.g = Graph()
 
         assert len([d for d in p.datasets()]) == 0
+
+
+def _nt_datasets(num_datasets, next_page=None):
+    lines = []
+    for i in range(1, num_datasets + 1):
+        dataset = '<http://example.org/datasets/{0}>'.format(i)
+        distribution = '<http://example.org/datasets/{0}/ds/1>'.format(i)
+        lines.extend([
+            '{0} <{1}> <{2}> .'.format(dataset, RDF.type, DCAT.Dataset),
+            '{0} <{1}> "Test Dataset {2}" .'.format(dataset, DCT.title, i),
+            '{0} <{1}> {2} .'.format(dataset, DCAT.distribution, distribution),
+            '{0} <{1}> _:contact{2} .'.format(dataset, DCAT.contactPoint, i),
+            '_:contact{0} <http://www.w3.org/2006/vcard/ns#fn> "Contact {0}" .'.format(i),
+            '{0} <{1}> <{2}> .'.format(distribution, RDF.type, DCAT.Distribution),
+            '{0} <{1}> "Distribution {2}" .'.format(distribution, DCT.title, i),
+        ])
+    if next_page:
+        lines.extend([
+            '<http://example.org/catalog?page=1> <{0}> <{1}PagedCollection> .'.format(
+                RDF.type, HYDRA),
+            '<http://example.org/catalog?page=1> <{0}next> "{1}" .'.format(
+                HYDRA, next_page),
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+class TestRDFParserStreaming(object):
+
+    def _sorted(self, datasets):
+        return sorted(datasets, key=lambda d: d['title'])
+
+    @pytest.mark.parametrize('_format', ['nt', 'application/n-triples'])
+    def test_datasets_same_as_full_parsing(self, _format):
+        data = _nt_datasets(3)
+
+        p = RDFParser()
+        p.parse(data, _format='nt')
+        expected = self._sorted(p.datasets())
+
+        p = RDFParser()
+        p.parse(data, _format=_format, streaming=True)
+        assert len(p.g) == 0
+        datasets = list(p.datasets())
+
+        assert [d['title'] for d in datasets] == [
+            'Test Dataset 1', 'Test Dataset 2', 'Test Dataset 3']
+        assert self._sorted(datasets) == expected
+        assert datasets[0]['resources'][0]['name'] == 'Distribution 1'
+        assert datasets[0]['extras']
+
+    @pytest.mark.parametrize('source', [None, 'catalog.rdf', 'dataset_sweden.rdf'])
+    def test_datasets_from_catalog_stream(self, source):
+        p = RDFParser()
+        if source:
+            p.parse(open(os.path.join(EXAMPLES_DIR, source)).read())
+        else:
+            p.g = _default_graph()
+        source_datasets = self._sorted(p.datasets())
+        for i, dataset_dict in enumerate(source_datasets):
+            dataset_dict['id'] = 'dataset-{0}'.format(i)
+            for j, resource_dict in enumerate(dataset_dict['resources']):
+                resource_dict['id'] = 'resource-{0}-{1}'.format(i, j)
+                resource_dict['package_id'] = dataset_dict['id']
+
+        data = ''.join(RDFSerializer().serialize_catalog_stream(
+            {}, source_datasets, _format='nt'))
+
+        p = RDFParser()
+        p.parse(data, _format='nt')
+        expected = self._sorted(p.datasets())
+
+        p = RDFParser()
+        p.parse(data, _format='nt', streaming=True)
+        datasets = self._sorted(p.datasets())
+
+        assert len(datasets) == len(source_datasets)
+        assert _normalize(datasets) == _normalize(expected)
+        if not source:
+            assert [len(d['resources']) for d in datasets] == [2, 1, 0]
+
+    def test_datasets_subject_not_contiguous(self):
+        lines = _nt_datasets(2).splitlines()
+        # A triple of the first dataset after the second one
+        lines.append(lines.pop(1))
+
+        p = RDFParser()
+        p.parse('\n'.join(lines), _format='nt', streaming=True)
+
+        with pytest.raises(RDFParserException):
+            list(p.datasets())
+
+    def test_datasets_related_resource_after_next_dataset(self):
+        lines = _nt_datasets(2).splitlines()
+        # The contact point of the first dataset after the second one
+        lines.append(lines.pop(4))
+
+        p = RDFParser()
+        p.parse('\n'.join(lines), _format='nt', streaming=True)
+
+        with pytest.raises(RDFParserException):
+            list(p.datasets())
+
+    def test_datasets_not_streamable_catalog(self):
+        # Full graph serializations don't keep the triples of each subject
+        # together
+        g = Graph()
+        g.parse(os.path.join(EXAMPLES_DIR, 'catalog.rdf'))
+        data = g.serialize(format='nt')
+
+        p = RDFParser()
+        p.parse(data, _format='nt')
+        expected = self._sorted(p.datasets())
+
+        p = RDFParser()
+        p.parse(data, _format='nt', streaming=True)
+        try:
+            datasets = self._sorted(p.datasets())
+        except RDFParserException:
+            pass
+        else:
+            # Parsed only if the layout happened to allow it
+            assert _normalize(datasets) == _normalize(expected)
+
+    def test_datasets_linking_to_previous_dataset(self):
+        lines = _nt_datasets(2).splitlines()
+        lines.append('<http://example.org/datasets/2> <{0}> '
+                     '<http://example.org/datasets/1> .'.format(DCT.relation))
+
+        p = RDFParser()
+        p.parse('\n'.join(lines), _format='nt', streaming=True)
+
+        assert [d['title'] for d in p.datasets()] == [
+            'Test Dataset 1', 'Test Dataset 2']
+
+    def test_datasets_nquads(self):
+        data = ''.join(
+            line[:-1] + '<http://example.org/graph> .\n'
+            for line in _nt_datasets(2).splitlines())
+
+        p = RDFParser()
+        p.parse(data, _format='nquads', streaming=True)
+
+        assert [d['title'] for d in p.datasets()] == [
+            'Test Dataset 1', 'Test Dataset 2']
+
+    def test_datasets_read_incrementally(self):
+        num_datasets = 200
+        data = io.BytesIO(_nt_datasets(num_datasets).encode('utf-8'))
+        size = len(data.getvalue())
+
+        p = RDFParser()
+        p.parse(data, _format='nt', streaming=True)
+        assert data.tell() == 0
+
+        datasets = p.datasets()
+        dataset = next(datasets)
+        assert dataset['title'] == 'Test Dataset 1'
+        assert data.tell() < size
+
+        max_triples = 0
+        for dataset in datasets:
+            max_triples = max(max_triples, len(p.g))
+        assert dataset['title'] == 'Test Dataset {0}'.format(num_datasets)
+
+        # Datasets are removed from the graph once parsed
+        assert max_triples < 20
+        assert len(p.g) == 0
+
+    def test_pagination_after_reading_datasets(self):
+        data = _nt_datasets(2, next_page='http://example.org/catalog?page=2')
+
+        p = RDFParser()
+        p.parse(data, _format='nt', streaming=True)
+        assert p.next_page() is None
+
+        assert len(list(p.datasets())) == 2
+        assert p.next_page() == 'http://example.org/catalog?page=2'
+
+    def test_datasets_raises_on_parse_error(self):
+        data = _nt_datasets(1) + 'Wrong data\n'
+
+        p = RDFParser()
+        p.parse(data, _format='nt', streaming=True)
+
+        with pytest.raises(RDFParserException):
+            list(p.datasets())
+
+    def test_other_formats_not_streamed(self):
+        p = RDFParser()
+        p.parse(_default_graph().serialize(format='turtle'), _format='turtle',
+                streaming=True)
+
+        assert len(p.g) > 0
+        assert len(list(p.datasets())) == 3
+
+
+# Ids generated by rdflib, and by its Turtle parser for labeled nodes
+BNODE_ID_RE = re.compile(r'^(N|n)[0-9a-f]{32}(b\d+)?$')
+
+EXAMPLES_DIR = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'examples', 'dcat')
+
+
+def _normalize(value):
+    # Blank node ids and the order of lists depend on the graph
+    if isinstance(value, dict):
+        return dict((k, _normalize(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return sorted((_normalize(v) for v in value),
+                      key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(value, str) and BNODE_ID_RE.match(value):
+        return 'bnode'
+    if isinstance(value, str) and value.startswith('['):
+        try:
+            return _normalize(json.loads(value))
+        except ValueError:
+            pass
+    return value
+
+
+def _rdfxml_datasets(num_datasets, next_page=None):
+    datasets = []
+    for i in range(1, num_datasets + 1):
+        datasets.append('''
+    <dcat:dataset>
+      <dcat:Dataset rdf:about="http://example.org/datasets/{0}">
+        <dct:title>Test Dataset {0}</dct:title>
+        <dcat:contactPoint>
+          <vcard:Organization>
+            <vcard:fn>Contact {0}</vcard:fn>
+          </vcard:Organization>
+        </dcat:contactPoint>
+        <dcat:distribution>
+          <dcat:Distribution rdf:about="http://example.org/datasets/{0}/ds/1">
+            <dct:title>Distribution {0}</dct:title>
+          </dcat:Distribution>
+        </dcat:distribution>
+      </dcat:Dataset>
+    </dcat:dataset>'''.format(i))
+    pagination = '''
+  <hydra:PagedCollection rdf:about="http://example.org/catalog?page=1">
+    <hydra:next>{0}</hydra:next>
+  </hydra:PagedCollection>'''.format(next_page) if next_page else ''
+    return '''<?xml version="1.0" encoding="utf-8"?>
+<rdf:RDF
+  xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+  xmlns:dct="http://purl.org/dc/terms/"
+  xmlns:dcat="http://www.w3.org/ns/dcat#"
+  xmlns:vcard="http://www.w3.org/2006/vcard/ns#"
+  xmlns:hydra="http://www.w3.org/ns/hydra/core#">
+  <dcat:Catalog rdf:about="http://example.org/catalog">
+    <dct:title>Test Catalog</dct:title>{0}
+  </dcat:Catalog>{1}
+</rdf:RDF>
+'''.format(''.join(datasets), pagination)
+
+
+class TestRDFParserStreamingXML(object):
+
+    @pytest.mark.parametrize('file_name', [
+        'catalog.rdf',
+        'catalog_datasets_list.rdf',
+        'dataset.rdf',
+        'dataset_gov_de.rdf',
+        'dataset_sweden.rdf',
+    ])
+    def test_datasets_same_as_full_parsing(self, file_name):
+        with open(os.path.join(EXAMPLES_DIR, file_name), 'rb') as f:
+            data = f.read()
+
+        p = RDFParser()
+        p.parse(data)
+        expected = _normalize(list(p.datasets()))
+
+        p = RDFParser()
+        p.parse(io.BytesIO(data), streaming=True)
+        datasets = _normalize(list(p.datasets()))
+
+        assert len(datasets) > 0
+        assert datasets == expected
+        assert len(list(p.g.subjects(RDF.type, DCAT.Dataset))) == 0
+
+    def test_datasets_read_incrementally(self):
+        num_datasets = 200
+        data = io.BytesIO(_rdfxml_datasets(num_datasets).encode('utf-8'))
+
+        p = RDFParser()
+        p.parse(data, _format='application/rdf+xml', streaming=True)
+
+        # Only the catalog is kept in the graph
+        assert len(p.g) == 2
+        assert data.tell() == 0
+
+        max_triples = 0
+        titles = []
+        for dataset in p.datasets():
+            titles.append(dataset['title'])
+            max_triples = max(max_triples, len(p.g))
+
+        assert titles == ['Test Dataset {0}'.format(i)
+                          for i in range(1, num_datasets + 1)]
+        assert max_triples < 20
+        assert len(p.g) == 2
+
+    def test_datasets_nested_keep_catalog_link(self):
+        p = RDFParser()
+        p.parse(_rdfxml_datasets(1), streaming=True)
+
+        datasets = p.datasets()
+        dataset = next(datasets)
+
+        assert dataset['resources'][0]['name'] == 'Distribution 1'
+        assert dataset['extras']
+        assert (URIRef('http://example.org/catalog'), DCAT.dataset,
+                URIRef('http://example.org/datasets/1')) in p.g
+        assert len(list(datasets)) == 0
+
+    def test_pagination_available_after_parsing(self):
+        data = _rdfxml_datasets(
+            2, next_page='http://example.org/catalog?page=2')
+
+        p = RDFParser()
+        p.parse(data, streaming=True)
+
+        assert p.next_page() == 'http://example.org/catalog?page=2'
+        assert len(list(p.datasets())) == 2
+
+    def test_not_seekable_file(self):
+        data = io.BufferedReader(
+            io.BytesIO(_rdfxml_datasets(3).encode('utf-8')))
+        data.seekable = lambda: False
+        data.tell = mock.Mock(side_effect=OSError)
+
+        p = RDFParser()
+        p.parse(data, streaming=True)
+
+        assert len(list(p.datasets())) == 3
+
+    def test_parse_error(self):
+        data = _rdfxml_datasets(2).replace('</dcat:Catalog>', '')
+
+        p = RDFParser()
+
+        with pytest.raises(RDFParserException):
+            p.parse(data, streaming=True)
+
+
+def _catalog_graph():
+
+    g = Graph()
+
+    catalog = URIRef('http://example.org/catalog')
+    g.add((catalog, RDF.type, DCAT.Catalog))
+    g.add((catalog, DCT.title, Literal('Test Catalog')))
+
+    publisher = URIRef('http://example.org/publisher')
+    g.add((publisher, FOAF.name, Literal('Test Publisher')))
+
+    dataset1 = URIRef('http://example.org/datasets/1')
+    g.add((catalog, DCAT.dataset, dataset1))
+    g.add((dataset1, RDF.type, DCAT.Dataset))
+    g.add((dataset1, DCT.title, Literal('Test Dataset 1')))
+    g.add((dataset1, DCT.publisher, publisher))
+    contact = BNode()
+    address = BNode()
+    g.add((dataset1, DCAT.contactPoint, contact))
+    g.add((contact, VCARD.fn, Literal('Contact 1')))
+    g.add((contact, VCARD.hasAddress, address))
+    g.add((address, VCARD['locality'], Literal('Some city')))
+    distribution = URIRef('http://example.org/datasets/1/ds/1')
+    g.add((dataset1, DCAT.distribution, distribution))
+    g.add((distribution, RDF.type, DCAT.Distribution))
+    g.add((distribution, DCT.title, Literal('Distribution 1')))
+
+    dataset2 = URIRef('http://example.org/datasets/2')
+    g.add((catalog, DCAT.dataset, dataset2))
+    g.add((dataset2, RDF.type, DCAT.Dataset))
+    g.add((dataset2, DCT.title, Literal('Test Dataset 2')))
+    g.add((dataset2, DCT.publisher, publisher))
+    g.add((dataset2, DCT.relation, dataset1))
+    spatial = BNode()
+    g.add((dataset2, DCT.spatial, spatial))
+    g.add((spatial, RDF.type, DCT.Location))
+
+    return g
+
+
+class TestRDFParserDatasetDescriptions(object):
+
+    def test_descriptions(self):
+        p = RDFParser()
+        p.g = _catalog_graph()
+
+        descriptions = dict(p.dataset_descriptions())
+
+        catalog = URIRef('http://example.org/catalog')
+        dataset1 = URIRef('http://example.org/datasets/1')
+        dataset2 = URIRef('http://example.org/datasets/2')
+        publisher = URIRef('http://example.org/publisher')
+        distribution = URIRef('http://example.org/datasets/1/ds/1')
+        assert set(descriptions.keys()) == set([dataset1, dataset2])
+
+        g = descriptions[dataset1]
+        assert len(g) == 14
+        assert (catalog, DCAT.dataset, dataset1) in g
+        assert (catalog, DCT.title, Literal('Test Catalog')) in g
+        assert (catalog, DCAT.dataset, dataset2) not in g
+        assert (publisher, FOAF.name, Literal('Test Publisher')) in g
+        assert (distribution, DCT.title, Literal('Distribution 1')) in g
+        assert len(list(g.triples((None, VCARD['locality'], None)))) == 1
+        assert (dataset2, None, None) not in g
+
+        g = descriptions[dataset2]
+        assert len(g) == 10
+        assert (publisher, FOAF.name, Literal('Test Publisher')) in g
+        assert (dataset2, DCT.relation, dataset1) in g
+        assert (dataset1, None, None) not in g
+        assert (None, DCT.title, Literal('Distribution 1')) not in g
+        assert (None, RDF.type, DCT.Location) in g
+
+    def test_descriptions_without_other_datasets_records(self):
+        g = _catalog_graph()
+        catalog = URIRef('http://example.org/catalog')
+        for num in (1, 2):
+            record = URIRef('http://example.org/records/{0}'.format(num))
+            g.add((catalog, DCAT.record, record))
+            g.add((record, RDF.type, DCAT.CatalogRecord))
+            g.add((record, FOAF.primaryTopic,
+                   URIRef('http://example.org/datasets/{0}'.format(num))))
+            g.add((record, DCT.modified, Literal('2024-01-0{0}'.format(num))))
+        p = RDFParser()
+        p.g = g
+
+        descriptions = dict(p.dataset_descriptions())
+
+        for num in (1, 2):
+            g = descriptions[URIRef('http://example.org/datasets/{0}'.format(
+                num))]
+            assert (None, DCAT.record, None) not in g
+            assert (None, RDF.type, DCAT.CatalogRecord) not in g
+            assert (catalog, DCT.title, Literal('Test Catalog')) in g
+        assert len(descriptions[URIRef('http://example.org/datasets/1')]) == 14
+        assert len(descriptions[URIRef('http://example.org/datasets/2')]) == 10
+
+    def test_descriptions_without_other_datasets_distributions(self):
+        g = _catalog_graph()
+        dataset2 = URIRef('http://example.org/datasets/2')
+        # A resource of the second dataset linking to a distribution of the
+        # first one
+        g.add((dataset2, DCT.source, URIRef(
+            'http://example.org/datasets/1/ds/1')))
+        p = RDFParser()
+        p.g = g
+
+        g = dict(p.dataset_descriptions())[dataset2]
+
+        assert (dataset2, DCT.source, None) in g
+        assert (None, DCT.title, Literal('Distribution 1')) not in g
+
+    def test_descriptions_same_order_as_datasets(self):
+        p = RDFParser()
+        p.g = _default_graph()
+
+        assert [str(g.value(ref, DCT.title))
+                for ref, g in p.dataset_descriptions()] == [
+            d['title'] for d in p.datasets()]
+
+    @pytest.mark.parametrize('file_name,_format', [
+        ('catalog.rdf', 'xml'),
+        ('catalog_datasets_list.rdf', 'xml'),
+        ('catalog_pod.jsonld', 'json-ld'),
+        ('dataset.rdf', 'xml'),
+        ('dataset_afs.ttl', 'turtle'),
+        ('dataset_deri.ttl', 'turtle'),
+        ('dataset_gob_es.ttl', 'turtle'),
+        ('dataset_gov_de.rdf', 'xml'),
+        ('dataset_sweden.rdf', 'xml'),
+    ])
+    def test_datasets_same_as_full_parsing(self, file_name, _format):
+        with open(os.path.join(EXAMPLES_DIR, file_name), 'rb') as f:
+            data = f.read()
+
+        p = RDFParser()
+        p.parse(data, _format=_format)
+        expected = _normalize(list(p.datasets()))
+
+        datasets = []
+        for dataset_dict, g in p.datasets_with_descriptions():
+            assert p.parse_dataset_description(g) == dataset_dict
+            datasets.append(dataset_dict)
+
+        assert len(datasets) > 0
+        assert _normalize(datasets) == expected
+
+    @pytest.mark.usefixtures('ckan_config')
+    @pytest.mark.ckan_config(DCAT_EXPOSE_SUBCATALOGS, 'true')
+    def test_datasets_same_as_full_parsing_subcatalogs(self):
+        g = _catalog_graph()
+        root = URIRef('http://example.org/root')
+        g.add((root, RDF.type, DCAT.Catalog))
+        g.add((root, DCT.hasPart, URIRef('http://example.org/catalog')))
+
+        p = RDFParser(profiles=['euro_dcat_ap'])
+        p.g = g
+        expected = _normalize(list(p.datasets()))
+        assert {'key': 'source_catalog_title', 'value': 'Test Catalog'} in \
+            expected[0]['extras']
+
+        datasets = [d for d, g in p.datasets_with_descriptions()]
+        assert _normalize(datasets) == expected
+
+    def test_parse_serialized_description(self):
+        p = RDFParser()
+        p.g = _catalog_graph()
+
+        for dataset_dict, g in p.datasets_with_descriptions():
+            data = g.serialize(format='nt')
+
+            assert _normalize(p.parse_dataset_description(data)) == \
+                _normalize(dataset_dict)
+
+        # The graph of the parser is not modified
+        assert len(p.g) == len(_catalog_graph())
+
+    def test_parse_description_errors(self):
+        p = RDFParser()
+
+        with pytest.raises(RDFParserException):
+            p.parse_dataset_description('Wrong data')
+
+        with pytest.raises(RDFParserException):
+            p.parse_dataset_description(_default_graph())
+
+    def test_descriptions_not_available_when_streaming(self):
+        p = RDFParser()
+        p.parse(_nt_datasets(1), _format='nt', streaming=True)
+
+        with pytest.raises(RDFParserException):
+            list(p.dataset_descriptions())
+
+
+class TestRDFParserDiskStore(object):
+
+    @pytest.mark.parametrize('file_name,_format', [
+        ('catalog.rdf', 'xml'),
+        ('catalog_pod.jsonld', 'json-ld'),
+        ('dataset.rdf', 'xml'),
+        ('dataset_afs.ttl', 'turtle'),
+        ('dataset_deri.ttl', 'turtle'),
+        ('dataset_gob_es.ttl', 'turtle'),
+        ('dataset_gov_de.rdf', 'xml'),
+        ('dataset_sweden.rdf', 'xml'),
+    ])
+    @pytest.mark.parametrize('threshold', [0, 10])
+    def test_datasets_same_as_in_memory(self, file_name, _format, threshold):
+        with open(os.path.join(EXAMPLES_DIR, file_name), 'rb') as f:
+            data = f.read()
+
+        p = RDFParser()
+        p.parse(data, _format=_format)
+        expected = _normalize(list(p.datasets()))
+
+        p = RDFParser(disk_store_threshold=threshold)
+        p.parse(data, _format=_format)
+
+        assert p.g.store.on_disk
+        assert _normalize(list(p.datasets())) == expected
+
+        p.close()
+
+    def test_datasets_parallel(self):
+        data = _rdfxml_datasets(
+            5, next_page='http://example.org/catalog?page=2')
+
+        p = RDFParser(disk_store_threshold=0)
+        p.parse(data)
+
+        datasets = list(p.datasets(processes=2, chunk_size=2))
+
+        assert [d['title'] for d in datasets] == [
+            'Test Dataset {0}'.format(i) for i in range(1, 6)]
+        assert p.next_page() == 'http://example.org/catalog?page=2'
+
+    def test_memory_below_threshold(self):
+        p = RDFParser(disk_store_threshold=1000)
+        p.parse(_default_graph().serialize(format='xml'))
+
+        assert not p.g.store.on_disk
+        assert len(list(p.datasets())) == 3
+
+    @pytest.mark.usefixtures('ckan_config')
+    @pytest.mark.ckan_config('ckanext.dcat.disk_store.threshold', '0')
+    def test_threshold_from_config(self, tmp_path):
+        with mock.patch.dict(
+                config, {'ckanext.dcat.disk_store.path': str(tmp_path)}):
+            p = RDFParser()
+
+        assert isinstance(p.g.store, SQLiteStore)
+        assert p.g.store.on_disk
+        assert os.path.dirname(p.g.store.path) == str(tmp_path)
+
+        p = RDFParser(disk_store_threshold=100)
+        assert not p.g.store.on_disk
+
+    def test_in_memory_by_default(self):
+        p = RDFParser()
+
+        assert not isinstance(p.g.store, SQLiteStore)
+
+    def test_close_removes_database(self):
+        p = RDFParser(disk_store_threshold=0)
+        p.parse(_default_graph().serialize(format='xml'))
+        path = p.g.store.path
+
+        p.close()
+
+        assert not os.path.exists(path)
@@ -7,6 +7,7 @@ from rdflib import Graph, URIRef, Literal
 from rdflib.namespace import Namespace
 
 from ckanext.dcat.profiles import RDFProfile, CleanedURIRef
+from ckanext.dcat.profiles.base import get_schema_index
 
 from ckanext.dcat.tests.test_base_parser import _default_graph
 
@@ -721,3 +722,93 @@ class TestBaseRDFProfile(object):
         assert contact['name'] == 'Point of Contact'
         # mailto gets removed for storage and is added again on output
         assert contact['email'] == 'contact@some.org'
+
+
+def _test_schema():
+    return {
+        "dataset_type": "dataset",
+        "dataset_fields": [
+            {"field_name": "title", "validators": "not_empty unicode_safe"},
+            {
+                "field_name": "conforms_to",
+                "validators": "ignore_missing scheming_multiple_text",
+            },
+            {
+                "field_name": "contact",
+                "repeating_subfields": [
+                    {"field_name": "name"},
+                    {"field_name": "email"},
+                ],
+            },
+        ],
+        "resource_fields": [
+            {"field_name": "url"},
+            {
+                "field_name": "language",
+                "validators": "ignore_missing scheming_multiple_text",
+            },
+            {
+                "field_name": "checksum",
+                "repeating_subfields": [{"field_name": "algorithm"}],
+            },
+        ],
+    }
+
+
+class TestSchemaIndex(object):
+
+    def test_schema_index(self):
+
+        schema = _test_schema()
+
+        schema_index = get_schema_index(schema)
+
+        assert sorted(schema_index.dataset_fields.keys()) == [
+            "conforms_to", "contact", "title"]
+        assert sorted(schema_index.resource_fields.keys()) == [
+            "checksum", "language", "url"]
+        assert schema_index.dataset_multiple_text == {"conforms_to"}
+        assert schema_index.resource_multiple_text == {"language"}
+        assert schema_index.dataset_repeating_subfields == {
+            "contact": {"name", "email"}}
+        assert schema_index.resource_repeating_subfields == {
+            "checksum": {"algorithm"}}
+
+    def test_schema_index_is_shared(self):
+
+        schema = _test_schema()
+
+        p1 = RDFProfile(Graph(), dataset_schema=schema)
+        p2 = RDFProfile(Graph(), dataset_schema=schema)
+
+        assert p1._schema_index is p2._schema_index
+        assert get_schema_index(_test_schema()) is not p1._schema_index
+
+    def test_schema_field_lookups(self):
+
+        p = RDFProfile(Graph(), dataset_schema=_test_schema())
+
+        assert p._schema_field("title")["field_name"] == "title"
+        assert p._schema_field("url") is None
+        assert p._schema_resource_field("url")["field_name"] == "url"
+        assert p._schema_resource_field("title") is None
+
+        dataset_dict = {}
+        p._set_list_dataset_value(dataset_dict, "conforms_to", ["a", "b"])
+        p._set_list_dataset_value(dataset_dict, "other", ["a", "b"])
+
+        assert dataset_dict["conforms_to"] == ["a", "b"]
+        assert dataset_dict["extras"] == [{"key": "other", "value": '["a", "b"]'}]
+
+        resource_dict = {}
+        p._set_list_resource_value(resource_dict, "language", ["en"])
+        p._set_list_resource_value(resource_dict, "other", ["en"])
+
+        assert resource_dict == {"language": ["en"], "other": '["en"]'}
+
+    def test_no_schema(self):
+
+        p = RDFProfile(Graph())
+
+        assert p._schema_index is None
+        assert p._schema_field("title") is None
@@ -1,8 +1,13 @@
 from builtins import str
+import logging
+from unittest import mock
+
+import pytest
 
 from ckantoolkit import config
 
-from rdflib import URIRef, Literal
+from rdflib import Graph, URIRef, Literal
+from rdflib.compare import isomorphic
 from rdflib.namespace import Namespace, RDF
 
 from ckanext.dcat.processors import (
@@ -116,3 +121,90 @@ class TestRDFSerializer(BaseSerializeTest):
 
         assert self._triples(s.g, None, DCT.description, Literal('Lorem ipsum'))
         assert len(self._triples(s.g, None, DCAT.distribution, None)) == 1
+
+    def test_serialize_catalog_stream(self):
+
+        s = RDFSerializer()
+
+        dataset_dicts = [_default_dict(), _default_dict()]
+        dataset_dicts[1]['id'] = 'd4ea0ff0-e4a3-4f3c-9a3b-43a6a6a8c3f1'
+
+        chunks = list(s.serialize_catalog_stream(
+            {}, dataset_dicts, _format='ttl'))
+
+        # One chunk for the catalog and one for each dataset
+        assert len(chunks) == 3
+
+        g = Graph()
+        g.parse(data=''.join(chunks), format='turtle')
+
+        assert len(self._triples(g, None, RDF.type, DCAT.Dataset)) == 2
+        assert len(self._triples(g, None, DCAT.dataset, None)) == 2
+
+        # The class graph only contains the catalog
+        assert not self._triples(s.g, None, RDF.type, DCAT.Dataset)
+
+    def test_serialize_catalog_stream_same_graph_as_serialize_catalog(self):
+
+        dataset_dicts = [_default_dict()]
+
+        streamed = ''.join(RDFSerializer().serialize_catalog_stream(
+            {}, dataset_dicts, _format='jsonld'))
+        g_streamed = Graph().parse(data=streamed, format='json-ld')
+
+        output = RDFSerializer().serialize_catalog(
+            {}, dataset_dicts, _format='jsonld')
+        g = Graph().parse(data=output, format='json-ld')
+
+        assert isomorphic(g, g_streamed)
+
+    def test_serialize_catalog_stream_error_first_dataset(self):
+
+        s = RDFSerializer()
+
+        with mock.patch.object(RDFSerializer, 'graph_from_dataset',
+                               side_effect=ValueError('Wrong dataset')):
+            # Raised before any output is returned
+            with pytest.raises(ValueError):
+                s.serialize_catalog_stream(
+                    {}, [_default_dict()], _format='ttl')
+
+        assert not self._triples(s.g, None, RDF.type, DCAT.Dataset)
+
+    def test_serialize_catalog_stream_error_logged(self, caplog):
+
+        s = RDFSerializer()
+
+        dataset_dicts = [_default_dict(), _default_dict()]
+        dataset_dicts[1]['id'] = 'd4ea0ff0-e4a3-4f3c-9a3b-43a6a6a8c3f1'
+
+        graph_from_dataset = RDFSerializer.graph_from_dataset
+
+        def side_effect(serializer, dataset_dict):
+            if dataset_dict['id'] == dataset_dicts[1]['id']:
+                raise ValueError('Wrong dataset')
+            return graph_from_dataset(serializer, dataset_dict)
+
+        with mock.patch.object(RDFSerializer, 'graph_from_dataset',
+                               side_effect=side_effect, autospec=True):
+            chunks = s.serialize_catalog_stream(
+                {}, dataset_dicts, _format='ttl')
+
+            assert len([next(chunks), next(chunks)]) == 2
+
+            with caplog.at_level(logging.ERROR):
+                with pytest.raises(ValueError):
+                    next(chunks)
+
+        assert 'Error serializing dataset {0}'.format(
+            dataset_dicts[1]['id']) in caplog.text
+
+    def test_serialize_catalog_stream_not_streamable_format(self):
+
+        s = RDFSerializer()
+
+        chunks = list(s.serialize_catalog_stream(
+            {}, [_default_dict()], _format='xml'))
+
+        assert len(chunks) == 1
+        assert '<dcat:Dataset' in chunks[0]
@@ -2,6 +2,7 @@
 from builtins import str
 from builtins import range
 import time
+from unittest import mock
 
 from collections import OrderedDict
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
@@ -14,7 +15,7 @@ from rdflib import Graph
 from ckantoolkit import url_for
 from ckantoolkit.tests import factories
 
-from ckanext.dcat.processors import RDFParser
+from ckanext.dcat.processors import RDFParser, RDFSerializer, RDFProfileException
 from ckanext.dcat.profiles import RDF, DCAT
 from ckanext.dcat.processors import HYDRA
 
@@ -269,6 +270,60 @@ class TestEndpoints():
 
         assert len(dcat_datasets) == 4
 
+    @pytest.mark.ckan_config('ckanext.dcat.enable_catalog_streaming', 'true')
+    def test_catalog_ttl_streaming(self, app):
+
+        for i in range(4):
+            factories.Dataset()
+
+        url = url_for('dcat.read_catalog', _format='ttl')
+
+        response = app.get(url)
+
+        assert response.headers['Content-Type'] == 'text/turtle'
+
+        content = response.body
+
+        p = RDFParser()
+
+        p.parse(content, _format='turtle')
+
+        dcat_datasets = [d for d in p.datasets()]
+
+        assert len(dcat_datasets) == 4
+
+    @pytest.mark.ckan_config('ckanext.dcat.enable_catalog_streaming', 'true')
+    def test_catalog_jsonld_streaming(self, app):
+
+        for i in range(4):
+            factories.Dataset()
+
+        url = url_for('dcat.read_catalog', _format='jsonld')
+
+        response = app.get(url)
+
+        assert response.headers['Content-Type'] == 'application/ld+json'
+
+        p = RDFParser()
+
+        p.parse(response.body, _format='json-ld')
+
+        dcat_datasets = [d for d in p.datasets()]
+
+        assert len(dcat_datasets) == 4
+
+    @pytest.mark.ckan_config('ckanext.dcat.enable_catalog_streaming', 'true')
+    def test_catalog_streaming_error(self, app):
+
+        factories.Dataset()
+
+        url = url_for('dcat.read_catalog', _format='ttl')
+
+        with mock.patch.object(RDFSerializer, 'graph_from_dataset',
+                               side_effect=RDFProfileException('Wrong')):
+            # The error is returned instead of starting the response
+            app.get(url, status=409)
+
     def test_catalog_modified_date(self, app):
 
         dataset1 = factories.Dataset(title='First dataset')
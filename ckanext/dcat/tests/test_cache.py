@@ -0,0 +1,123 @@
+import os
+
+from ckanext.dcat.cache import (
+    MemorySerializationCache,
+    DiskSerializationCache,
+)
+
+
+def _key(dataset_id, _format='turtle'):
+    return (dataset_id, '2024-05-01T10:00:00', ('euro_dcat_ap_2',), _format)
+
+
+class TestMemorySerializationCache(object):
+
+    def test_get_set(self):
+        cache = MemorySerializationCache()
+
+        assert cache.get(_key('id1')) is None
+
+        cache.set(_key('id1'), 'output 1')
+
+        assert cache.get(_key('id1')) == 'output 1'
+        assert cache.get(_key('id1', 'xml')) is None
+
+    def test_max_items_evicts_least_recently_used(self):
+        cache = MemorySerializationCache(max_items=2)
+
+        cache.set(_key('id1'), 'output 1')
+        cache.set(_key('id2'), 'output 2')
+
+        # Access the first one so the second one is the least recently used
+        cache.get(_key('id1'))
+
+        cache.set(_key('id3'), 'output 3')
+
+        assert cache.get(_key('id1')) == 'output 1'
+        assert cache.get(_key('id2')) is None
+        assert cache.get(_key('id3')) == 'output 3'
+
+    def test_max_size(self):
+        cache = MemorySerializationCache(max_size=10)
+
+        cache.set(_key('id1'), 'a' * 6)
+        cache.set(_key('id2'), 'b' * 6)
+
+        assert cache.get(_key('id1')) is None
+        assert cache.get(_key('id2')) == 'b' * 6
+
+        # Values bigger than the limit are not stored
+        cache.set(_key('id3'), 'c' * 11)
+
+        assert cache.get(_key('id3')) is None
+        assert cache.get(_key('id2')) == 'b' * 6
+
+    def test_invalidate(self):
+        cache = MemorySerializationCache()
+
+        cache.set(_key('id1'), 'output 1')
+        cache.set(_key('id1', 'xml'), 'output 1 xml')
+        cache.set(_key('id2'), 'output 2')
+
+        cache.invalidate('id1')
+
+        assert cache.get(_key('id1')) is None
+        assert cache.get(_key('id1', 'xml')) is None
+        assert cache.get(_key('id2')) == 'output 2'
+
+
+class TestDiskSerializationCache(object):
+
+    def test_get_set(self, tmpdir):
+        cache = DiskSerializationCache(str(tmpdir))
+
+        assert cache.get(_key('id1')) is None
+
+        cache.set(_key('id1'), u'output 1 é')
+
+        assert cache.get(_key('id1')) == u'output 1 é'
+        assert cache.get(_key('id1', 'xml')) is None
+
+        # Entries can be read by other instances
+        assert DiskSerializationCache(str(tmpdir)).get(_key('id1')) == \
+            u'output 1 é'
+
+    def test_max_size_evicts_least_recently_used(self, tmpdir):
+        cache = DiskSerializationCache(str(tmpdir), max_size=10)
+
+        cache.set(_key('id1'), 'a' * 4)
+        cache.set(_key('id2'), 'b' * 4)
+
+        path = cache._entry_path(_key('id2'))
+        os.utime(path, (1, 1))
+
+        cache.set(_key('id3'), 'c' * 4)
+
+        assert cache.get(_key('id1')) == 'a' * 4
+        assert cache.get(_key('id2')) is None
+        assert cache.get(_key('id3')) == 'c' * 4
+
+    def test_invalidate(self, tmpdir):
+        cache = DiskSerializationCache(str(tmpdir))
+
+        cache.set(_key('id1'), 'output 1')
+        cache.set(_key('id1', 'xml'), 'output 1 xml')
+        cache.set(_key('id2'), 'output 2')
+
+        cache.invalidate('id1')
+
+        assert cache.get(_key('id1')) is None
+        assert cache.get(_key('id1', 'xml')) is None
+        assert cache.get(_key('id2')) == 'output 2'
+
+    def test_clear(self, tmpdir):
+        cache = DiskSerializationCache(str(tmpdir))
+
+        cache.set(_key('id1'), 'output 1')
+        cache.set(_key('id2'), 'output 2')
+
+        cache.clear()
+
+        assert cache.get(_key('id1')) is None
+        assert cache.get(_key('id2')) is None
+        assert os.listdir(str(tmpdir)) == []
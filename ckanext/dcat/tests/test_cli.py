@@ -22,6 +22,53 @@ def test_consume(cli):
     assert json.loads(result.stdout)[0]["title"] == "A test dataset on your catalogue"
 
 
+def test_consume_parallel(cli):
+
+    path = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "..",
+        "examples",
+        "dcat",
+        "catalog.rdf",
+    )
+
+    result = cli.invoke(dcat_cli, ["consume", path])
+    assert result.exit_code == 0
+
+    result_parallel = cli.invoke(dcat_cli, ["consume", "-j", "2", path])
+    assert result_parallel.exit_code == 0
+
+    assert [d["title"] for d in json.loads(result_parallel.stdout)] == [
+        d["title"] for d in json.loads(result.stdout)
+    ]
+
+
+def test_consume_disk_store(cli):
+
+    path = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "..",
+        "examples",
+        "dcat",
+        "catalog.rdf",
+    )
+
+    result = cli.invoke(dcat_cli, ["consume", path])
+    assert result.exit_code == 0
+
+    result_disk = cli.invoke(
+        dcat_cli, ["consume", "--disk-store-threshold", "0", path])
+    assert result_disk.exit_code == 0
+
+    assert sorted(d["title"] for d in json.loads(result_disk.stdout)) == sorted(
+        d["title"] for d in json.loads(result.stdout)
+    )
+
+
 def test_produce(cli):
 
     path = os.path.join(
@@ -38,3 +85,11 @@ def test_produce(cli):
     assert result.exit_code == 0
 
     assert json.loads(result.stdout)["@context"]["dcat"] == "http://www.w3.org/ns/dcat#"
+
+
+def test_purge_payloads_store_path_not_set(cli):
+
+    result = cli.invoke(dcat_cli, ["purge-payloads"])
+    assert result.exit_code != 0
+
+    assert "ckanext.dcat.payload_store_path is not set" in result.output
@@ -4,24 +4,37 @@ from builtins import str
 from builtins import range
 from builtins import object
 from collections import defaultdict
+import os
+import json
 import re
+import time
+import threading
 
+import pysolr
+import rdflib
 import pytest
 import responses
+from sqlalchemy import event
 try:
     from unittest.mock import patch
 except ImportError:
     from mock import patch
 
 import ckan.plugins as p
+from ckan import model
+from ckan.lib import search
 from ckantoolkit import config
-from ckantoolkit.tests import helpers
+from ckantoolkit.tests import helpers, factories
 
 import ckanext.harvest.model as harvest_model
 from ckanext.harvest import queue
 
 from ckanext.dcat.harvesters import DCATRDFHarvester
+from ckanext.dcat.harvesters.base import (
+    GatherCheckpoint, PagePrefetcher, purge_payload_blobs)
 from ckanext.dcat.interfaces import IDCATRDFHarvester
+from ckanext.dcat.processors import RDFParser
+from ckanext.dcat.profiles import DCAT, DCT
 import ckanext.dcat.harvesters.rdf
 
 
@@ -269,6 +282,273 @@ class TestDCATHarvestUnit(object):
         assert guid == None
 
 
+    def test_get_unique_name(self):
+
+        harvester = DCATRDFHarvester()
+        harvester._names_taken = set()
+        harvester._names_prefix_counts = {}
+
+        names = [
+            harvester._get_unique_name(name) for name in
+            ['test', 'test', 'test-dataset', 'test', 'other', 'test-dataset']
+        ]
+
+        assert names == [
+            'test', 'test-1', 'test-dataset', 'test-3', 'other',
+            'test-dataset-1']
+
+    def test_get_dataset_fingerprint(self):
+
+        harvester = DCATRDFHarvester()
+        dataset = {
+            'title': 'Test dataset',
+            'tags': [{'name': 'a'}, {'name': 'b'}],
+            'resources': [
+                {'url': 'http://example.com/data.csv',
+                 'distribution_ref': 'N0123456789abcdef0123456789abcdef'},
+            ],
+        }
+        same_dataset = {
+            'resources': [
+                {'distribution_ref': 'n00000000000000000000000000000000b12',
+                 'url': 'http://example.com/data.csv'},
+            ],
+            'tags': [{'name': 'a'}, {'name': 'b'}],
+            'title': 'Test dataset',
+        }
+
+        fingerprint = harvester._get_dataset_fingerprint(dataset)
+
+        assert fingerprint == harvester._get_dataset_fingerprint(same_dataset)
+        assert fingerprint != harvester._get_dataset_fingerprint(
+            dict(dataset, title='Test dataset (updated)'))
+
+    def test_predict_page_urls(self):
+
+        harvester = DCATRDFHarvester()
+        next_url = 'http://example.com/catalog?format=rdf&page=2'
+
+        assert harvester._predict_page_urls(
+            next_url, {'last': 'http://example.com/catalog?format=rdf&page=5'},
+            10) == [
+            'http://example.com/catalog?format=rdf&page=3',
+            'http://example.com/catalog?format=rdf&page=4',
+            'http://example.com/catalog?format=rdf&page=5',
+        ]
+        assert harvester._predict_page_urls(
+            next_url, {'count': 95, 'items_per_page': 10}, 2) == [
+            'http://example.com/catalog?format=rdf&page=3',
+            'http://example.com/catalog?format=rdf&page=4',
+        ]
+        assert harvester._predict_page_urls(
+            next_url, {'count': 30, 'items_per_page': 10,
+                       'first': 'http://example.com/catalog?format=rdf&page=0'},
+            10) == []
+
+    def test_predict_page_urls_not_predictable(self):
+
+        harvester = DCATRDFHarvester()
+
+        # No last page
+        assert harvester._predict_page_urls(
+            'http://example.com/catalog?page=2', {}, 10) == []
+        # Not a numeric page parameter
+        assert harvester._predict_page_urls(
+            'http://example.com/catalog/page/2',
+            {'last': 'http://example.com/catalog/page/5'}, 10) == []
+        # Last page with a different url
+        assert harvester._predict_page_urls(
+            'http://example.com/catalog?page=2',
+            {'last': 'http://example.com/other?page=5'}, 10) == []
+
+    def test_payload_not_encoded_by_default(self):
+        harvester = DCATRDFHarvester()
+        content = '{"title": "Test"}'
+
+        assert harvester._encode_payload(content) == content
+        assert harvester._decode_payload(content) == content
+        assert harvester._decode_payload(None) is None
+
+    @pytest.mark.usefixtures('ckan_config')
+    @pytest.mark.parametrize('encoding', ['zlib', 'lzma'])
+    def test_payload_compressed(self, encoding):
+        harvester = DCATRDFHarvester()
+        content = json.dumps({'title': u'Caf\u00e9', 'description': 'x' * 1000})
+
+        with patch.dict(config, {'ckanext.dcat.payload_encoding': encoding}):
+            encoded = harvester._encode_payload(content)
+
+        assert encoded.startswith('dcat-{0}:'.format(encoding))
+        assert len(encoded) < len(content)
+        # Decoding does not depend on the current settings
+        assert harvester._decode_payload(encoded) == content
+
+    @pytest.mark.usefixtures('ckan_config')
+    @pytest.mark.parametrize('encoding', ['none', 'zlib'])
+    def test_payload_blob_store(self, encoding, tmp_path):
+        harvester = DCATRDFHarvester()
+        content = json.dumps({'title': 'Test blob'})
+
+        with patch.dict(config, {
+                'ckanext.dcat.payload_encoding': encoding,
+                'ckanext.dcat.payload_store_path': str(tmp_path)}):
+            encoded = harvester._encode_payload(content)
+            # Identical contents are stored once
+            assert harvester._encode_payload(content) == encoded
+            assert len(list(tmp_path.glob('*/*'))) == 1
+
+            assert encoded.startswith('dcat-blob:{0}:'.format(encoding))
+            assert harvester._decode_payload(encoded) == content
+
+            for blob in tmp_path.glob('*/*'):
+                blob.unlink()
+            with pytest.raises(ValueError):
+                harvester._decode_payload(encoded)
+
+    def test_gather_checkpoint(self, tmp_path):
+        path = str(tmp_path / 'checkpoints' / 'job.jsonl')
+
+        checkpoint = GatherCheckpoint(path)
+        assert not checkpoint
+        assert checkpoint.next_page_url is None
+
+        checkpoint.add_page('http://example.com/1', 'http://example.com/2',
+                            {'guid1', 'guid2'}, ['name1', 'name2'],
+                            ['id1', 'id2'], 'hash1')
+        checkpoint.add_page('http://example.com/2', 'http://example.com/3',
+                            {'guid3'}, ['name3'], ['id3'], 'hash2')
+        # Simulate a process killed while writing a page
+        with open(path, 'a') as f:
+            f.write('{"url": "http://example.com/3", "next_')
+
+        checkpoint = GatherCheckpoint(path)
+        assert len(checkpoint.pages) == 2
+        assert checkpoint.next_page_url == 'http://example.com/3'
+        assert checkpoint.first_page_hash == 'hash1'
+        assert checkpoint.guids == {'guid1', 'guid2', 'guid3'}
+        assert checkpoint.names == ['name1', 'name2', 'name3']
+        assert checkpoint.object_ids == ['id1', 'id2', 'id3']
+
+        # The incomplete line was removed
+        checkpoint.add_page('http://example.com/3', None, set(), [], [])
+        assert len(GatherCheckpoint(path).pages) == 3
+
+        checkpoint.remove()
+        assert not checkpoint
+        assert not GatherCheckpoint(path)
+
+    def test_get_session_no_retries_by_default(self):
+
+        harvester = DCATRDFHarvester()
+        session = harvester._get_session(
+            harvest_model.HarvestJob(id='job-no-retries'))
+
+        assert session.get_adapter('http://example.com').max_retries.total == 0
+
+    @pytest.mark.usefixtures('ckan_config')
+    @pytest.mark.ckan_config('ckanext.dcat.http_retries', '3')
+    @pytest.mark.ckan_config('ckanext.dcat.http_backoff_factor', '2')
+    def test_get_session_retries(self):
+
+        harvester = DCATRDFHarvester()
+        session = harvester._get_session(
+            harvest_model.HarvestJob(id='job-retries'))
+
+        for url in ('http://example.com', 'https://example.com'):
+            retry = session.get_adapter(url).max_retries
+            assert retry.total == 3
+            assert retry.backoff_factor == 2
+            assert 503 in retry.status_forcelist
+
+    def test_get_session_reused_for_the_same_job(self):
+
+        harvester = DCATRDFHarvester()
+        job_1 = harvest_model.HarvestJob(id='job-reused-1')
+        job_2 = harvest_model.HarvestJob(id='job-reused-2')
+
+        session = harvester._get_session(job_1)
+
+        assert harvester._get_session(job_1) is session
+        assert harvester._get_session(job_2) is not session
+
+    def test_page_prefetcher_sessions_per_thread(self):
+
+        harvester = DCATRDFHarvester()
+        harvest_job = harvest_model.HarvestJob(id='job-prefetch')
+        barrier = threading.Barrier(2, timeout=5)
+        sessions = []
+
+        def download_content(url, harvest_job, page, content_type,
+                             page_state, session=None):
+            # Both pages are downloaded at the same time
+            sessions.append(session)
+            barrier.wait()
+            return None, None, None
+
+        with patch.object(harvester, '_download_content',
+                          side_effect=download_content):
+            prefetcher = PagePrefetcher(harvester, harvest_job, 2)
+            try:
+                prefetcher.schedule(1, 'http://example.com/1')
+                prefetcher.schedule(2, 'http://example.com/2')
+                prefetcher.get(1)
+                prefetcher.get(2)
+            finally:
+                prefetcher.close()
+
+        job_session = harvester._get_session(harvest_job)
+        assert len(sessions) == 2
+        assert sessions[0] is not sessions[1]
+        assert job_session not in sessions
+
+    @pytest.mark.ckan_config('ckan.search.solr_commit', False)
+    @pytest.mark.ckan_config('ckanext.dcat.search_commit_batch_size', 2)
+    def test_pending_search_commits_committed_per_batch(self):
+
+        class ImportContext(object):
+            def __init__(self, harvest_job_id):
+                self.harvest_job_id = harvest_job_id
+                self.pending_search_ids = set()
+
+        harvester = DCATRDFHarvester()
+        import_context = ImportContext('job-id')
+        no_job_import_context = ImportContext(None)
+
+        with patch.object(search, 'commit') as mock_commit:
+            harvester._add_pending_search_commit(import_context, 'id-1')
+            assert import_context.pending_search_ids == {'id-1'}
+            assert mock_commit.call_count == 0
+
+            harvester._add_pending_search_commit(import_context, 'id-2')
+            assert import_context.pending_search_ids == set()
+            assert mock_commit.call_count == 1
+
+            # Contexts of objects without a job are not kept, so they are
+            # committed straight away
+            harvester._add_pending_search_commit(no_job_import_context, 'id-3')
+            assert no_job_import_context.pending_search_ids == set()
+            assert mock_commit.call_count == 2
+
+        assert config['ckan.search.solr_commit'] is False
+
+    @pytest.mark.ckan_config('ckan.search.solr_commit', True)
+    @pytest.mark.ckan_config('ckanext.dcat.search_commit_batch_size', 2)
+    def test_pending_search_commits_ignored_with_solr_commit(self):
+
+        class ImportContext(object):
+            harvest_job_id = 'job-id'
+            pending_search_ids = set()
+
+        harvester = DCATRDFHarvester()
+        import_context = ImportContext()
+
+        with patch.object(search, 'commit') as mock_commit:
+            harvester._add_pending_search_commit(import_context, 'id-1')
+
+        assert import_context.pending_search_ids == set()
+        assert mock_commit.call_count == 0
+
+
 class FunctionalHarvestTest(object):
 
     @classmethod
@@ -644,6 +924,82 @@ class TestDCATHarvestFunctional(FunctionalHarvestTest):
                                   'text/plain',
                                   config='{"rdf_format":"text/turtle"}')
 
+    def test_harvest_create_nt_streaming(self):
+
+        # Sorting the triples keeps the ones of each subject together
+        graph = rdflib.Graph().parse(data=self.ttl_content, format='turtle')
+        content = '\n'.join(sorted(
+            graph.serialize(format='nt').strip().splitlines())) + '\n'
+
+        self._test_harvest_create('http://some.dcat.file.nt',
+                                  content,
+                                  'application/n-triples',
+                                  config='{"streaming": true}')
+
+    def test_harvest_create_rdf_streaming(self):
+
+        self._test_harvest_create(self.rdf_mock_url,
+                                  self.rdf_content,
+                                  self.rdf_content_type,
+                                  config='{"streaming": true}')
+
+    def test_harvest_create_store_descriptions(self):
+
+        self._test_harvest_create(self.rdf_mock_url,
+                                  self.rdf_content,
+                                  self.rdf_content_type,
+                                  config='{"store_descriptions": true}')
+
+        harvest_objects = model.Session.query(harvest_model.HarvestObject).all()
+        assert len(harvest_objects) == 2
+        for harvest_object in harvest_objects:
+            description = [e.value for e in harvest_object.extras
+                           if e.key == 'rdf_description']
+            assert len(description) == 1
+
+            g = rdflib.Graph().parse(data=description[0], format='nt')
+            dataset = json.loads(harvest_object.content)
+            assert len(list(g.subjects(rdflib.RDF.type, DCAT.Dataset))) == 1
+            assert (None, DCT.title, rdflib.Literal(dataset['title'])) in g
+
+    def test_harvest_import_parses_stored_description(self):
+
+        self._test_harvest_create(self.rdf_mock_url,
+                                  self.rdf_content,
+                                  self.rdf_content_type,
+                                  config='{"store_descriptions": true}')
+
+        harvest_object = model.Session.query(harvest_model.HarvestObject).filter(
+            harvest_model.HarvestObject.guid ==
+            'https://data.some.org/catalog/datasets/1').one()
+        dataset = helpers.call_action(
+            'package_show', id=harvest_object.package_id)
+
+        # Import the object again with a changed description, as if the
+        # profiles had changed
+        for extra in harvest_object.extras:
+            if extra.key == 'rdf_description':
+                extra.value = extra.value.replace(
+                    'Example dataset 1', 'Example dataset 1 (updated)')
+        model.Session.commit()
+
+        assert DCATRDFHarvester().import_stage(harvest_object)
+
+        updated_dataset = helpers.call_action(
+            'package_show', id=harvest_object.package_id)
+        assert updated_dataset['title'] == 'Example dataset 1 (updated)'
+        assert updated_dataset['name'] == dataset['name']
+        assert updated_dataset['owner_org'] == dataset['owner_org']
+        assert {'key': 'guid', 'value': harvest_object.guid} in \
+            updated_dataset['extras']
+
+    def test_harvest_create_disk_store(self):
+
+        self._test_harvest_create(self.rdf_mock_url,
+                                  self.rdf_content,
+                                  self.rdf_content_type,
+                                  config='{"disk_store_threshold": 0}')
+
     def test_harvest_create_unicode_keywords(self):
 
         self._test_harvest_create(self.ttl_mock_url,
@@ -711,6 +1067,57 @@ class TestDCATHarvestFunctional(FunctionalHarvestTest):
                     allowed=allowed_file_size, actual=actual_file_size)
         mock_save_gather_error.assert_called_once_with(msg, harvest_job)
 
+    @patch('ckanext.dcat.harvesters.DCATRDFHarvester._save_gather_error')
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.max_file_size', 1)
+    def test_harvest_file_size_without_content_length(self, mock_save_gather_error):
+        self._add_responses_solr_passthru()
+        harvester = DCATRDFHarvester()
+
+        responses.add(responses.HEAD, self.ttl_mock_url, status=405)
+        responses.add(responses.GET, self.ttl_mock_url,
+                      body=b'#' * (1024 * 1024 + 1),
+                      content_type=self.ttl_content_type)
+
+        harvest_source = self._create_harvest_source(self.ttl_mock_url)
+        harvest_job = self._create_harvest_job(harvest_source['id'])
+
+        content, content_type = harvester._get_content_file_and_type(
+            self.ttl_mock_url, harvest_job, 1)
+
+        assert content is None
+        mock_save_gather_error.assert_called_once_with(
+            'Remote file is too big.', harvest_job)
+
+    @responses.activate
+    def test_harvest_content_file(self):
+        self._add_responses_solr_passthru()
+        harvester = DCATRDFHarvester()
+        harvester.SPOOL_MAX_SIZE = 10
+
+        responses.add(responses.HEAD, self.ttl_mock_url, status=405)
+        responses.add(responses.GET, self.ttl_mock_url,
+                      body=self.ttl_content,
+                      content_type=self.ttl_content_type)
+
+        harvest_source = self._create_harvest_source(self.ttl_mock_url)
+        harvest_job = self._create_harvest_job(harvest_source['id'])
+
+        content, content_type = harvester._get_content_file_and_type(
+            self.ttl_mock_url, harvest_job, 1)
+
+        with content:
+            # Bigger than SPOOL_MAX_SIZE, so stored on disk
+            assert content._rolled
+            assert content.read() == self.ttl_content.encode('utf-8')
+        assert content_type == self.ttl_content_type
+
+        content, content_type = harvester._get_content_and_type(
+            self.ttl_mock_url, harvest_job, 1)
+
+        assert content == self.ttl_content
+        assert content_type == self.ttl_content_type
+
     @patch('ckanext.dcat.harvesters.DCATRDFHarvester._save_gather_error')
     @responses.activate
     @pytest.mark.ckan_config('ckanext.dcat.max_file_size', 100)
@@ -778,6 +1185,418 @@ class TestDCATHarvestFunctional(FunctionalHarvestTest):
             ['Example dataset 1', 'Example dataset 2',
              'Example dataset 3', 'Example dataset 4'])
 
+    @pytest.mark.ckan_config('ckanext.dcat.payload_encoding', 'zlib')
+    def test_harvest_update_compressed_payloads(self):
+
+        self._test_harvest_update(self.rdf_mock_url,
+                                  self.rdf_content,
+                                  self.rdf_content_type)
+
+        harvest_objects = model.Session.query(harvest_model.HarvestObject).all()
+        assert len(harvest_objects) == 4
+        for harvest_object in harvest_objects:
+            assert harvest_object.content.startswith('dcat-zlib:')
+
+    def test_harvest_update_purge_payload_blobs(self, tmp_path):
+
+        with patch.dict(config, {
+                'ckanext.dcat.payload_store_path': str(tmp_path)}):
+            self._test_harvest_update(self.rdf_mock_url,
+                                      self.rdf_content,
+                                      self.rdf_content_type)
+
+            # The blobs of the previous job are kept
+            num_blobs = len(list(tmp_path.glob('*/*')))
+            assert num_blobs > 2
+
+            # Blobs used by unfinished jobs are kept, unless modified before
+            # they started
+            old_time = time.time() - 3600
+            for blob in tmp_path.glob('*/*'):
+                os.utime(str(blob), (old_time, old_time))
+            old_object = model.Session.query(
+                harvest_model.HarvestObject) \
+                .filter(harvest_model.HarvestObject.current == False).first()  # noqa: E712
+            old_object.job.status = 'Running'
+            model.Session.commit()
+
+            assert purge_payload_blobs() == []
+
+            old_object.job.status = 'Finished'
+            model.Session.commit()
+
+            assert len(purge_payload_blobs(dry_run=True)) == num_blobs - 2
+            assert len(list(tmp_path.glob('*/*'))) == num_blobs
+
+            removed = purge_payload_blobs()
+            assert len(removed) == num_blobs - 2
+            assert len(list(tmp_path.glob('*/*'))) == 2
+
+            harvester = DCATRDFHarvester()
+            current_objects = model.Session.query(
+                harvest_model.HarvestObject) \
+                .filter(harvest_model.HarvestObject.current == True).all()  # noqa: E712
+            assert len(current_objects) == 2
+            titles = sorted(
+                json.loads(harvester._get_object_content(obj))['title']
+                for obj in current_objects)
+            assert titles == [
+                'Example dataset 1 (updated)', 'Example dataset 2']
+
+    @responses.activate
+    def test_harvest_create_rdf_pagination_skips_head(self):
+
+        self._add_responses_solr_passthru()
+
+        # The first GET response includes the size of the file, so there is
+        # no need to do a HEAD request for the following pages
+        responses.add(responses.GET, self.rdf_mock_url_pagination_1,
+                               body=self.rdf_content_pagination_1,
+                               content_type=self.rdf_content_type,
+                               adding_headers={'content-length': str(
+                                   len(self.rdf_content_pagination_1))})
+
+        responses.add(responses.GET, self.rdf_mock_url_pagination_2,
+                               body=self.rdf_content_pagination_2,
+                               content_type=self.rdf_content_type)
+
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_1,
+                               status=405,
+                               content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(
+            self.rdf_mock_url_pagination_1)
+
+        self._run_full_job(harvest_source['id'], num_objects=4)
+
+        calls = [
+            (call.request.method, call.request.url)
+            for call in responses.calls
+            if 'dcat.file' in call.request.url
+        ]
+        assert [method for method, url in calls] == ['HEAD', 'GET', 'GET']
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+
+        assert results['count'] == 4
+
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.conditional_requests', True)
+    def test_harvest_conditional_requests(self):
+
+        self._add_responses_solr_passthru()
+
+        page_2_updated = self.rdf_content_pagination_2.replace(
+            'Example dataset 3', 'Example dataset 3 (updated)')
+        requests_headers = []
+
+        def page_callback(etag, content, new_etag=None, new_content=None):
+            def callback(request):
+                requests_headers.append(request.headers.get('If-None-Match'))
+                if request.headers.get('If-None-Match') == etag:
+                    if new_content is None:
+                        return (304, {}, '')
+                    return (200, {'ETag': new_etag}, new_content)
+                return (200, {'ETag': etag}, content)
+            return callback
+
+        responses.add_callback(
+            responses.GET, self.rdf_mock_url_pagination_1,
+            callback=page_callback('"page-1"', self.rdf_content_pagination_1),
+            content_type=self.rdf_content_type)
+        responses.add_callback(
+            responses.GET, self.rdf_mock_url_pagination_2,
+            callback=page_callback('"page-2"', self.rdf_content_pagination_2,
+                                   '"page-2b"', page_2_updated),
+            content_type=self.rdf_content_type)
+
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_1,
+                               status=405,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_2,
+                               status=405,
+                               content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(
+            self.rdf_mock_url_pagination_1)
+
+        self._run_full_job(harvest_source['id'], num_objects=4)
+
+        # Run the jobs to mark the previous one as Finished
+        self._run_jobs()
+
+        # The first page is not modified, only the datasets in the second
+        # one are gathered
+        self._run_full_job(harvest_source['id'], num_objects=2)
+
+        assert requests_headers == [None, None, '"page-1"', '"page-2"']
+
+        # No datasets were marked for deletion
+        harvest_objects = model.Session.query(harvest_model.HarvestObject) \
+            .filter_by(harvest_source_id=harvest_source['id']).all()
+        assert len(harvest_objects) == 6
+        assert not [
+            obj for obj in harvest_objects
+            if any(e.key == 'status' and e.value == 'delete'
+                   for e in obj.extras)]
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+
+        assert results['count'] == 4
+        assert (sorted([d['title'] for d in results['results']]) ==
+            ['Example dataset 1', 'Example dataset 2',
+             'Example dataset 3 (updated)', 'Example dataset 4'])
+
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.conditional_requests', False)
+    def test_harvest_conditional_requests_disabled(self):
+
+        self._add_responses_solr_passthru()
+
+        responses.add(responses.GET, self.rdf_mock_url,
+                               body=self.rdf_content,
+                               content_type=self.rdf_content_type,
+                               adding_headers={'ETag': '"rdf"'})
+        responses.add(responses.HEAD, self.rdf_mock_url,
+                               status=405,
+                               content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(self.rdf_mock_url)
+
+        self._run_full_job(harvest_source['id'], num_objects=2)
+        self._run_jobs()
+        self._run_full_job(harvest_source['id'], num_objects=2)
+
+        for call in responses.calls:
+            assert 'If-None-Match' not in call.request.headers
+
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.skip_unchanged_pages', True)
+    def test_harvest_skip_unchanged_pages(self):
+
+        self._add_responses_solr_passthru()
+
+        page_2_updated = self.rdf_content_pagination_2.replace(
+            'Example dataset 3', 'Example dataset 3 (updated)')
+
+        # The server does not return any validators
+        responses.add(responses.GET, self.rdf_mock_url_pagination_1,
+                      body=self.rdf_content_pagination_1,
+                      content_type=self.rdf_content_type)
+        responses.add(responses.GET, self.rdf_mock_url_pagination_2,
+                      body=self.rdf_content_pagination_2,
+                      content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_1,
+                      status=405, content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_2,
+                      status=405, content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(
+            self.rdf_mock_url_pagination_1)
+
+        self._run_full_job(harvest_source['id'], num_objects=4)
+        self._run_jobs()
+
+        responses.replace(responses.GET, self.rdf_mock_url_pagination_2,
+                          body=page_2_updated,
+                          content_type=self.rdf_content_type)
+
+        # Only the second page is parsed, and only its datasets gathered
+        with patch.object(ckanext.dcat.harvesters.rdf.RDFParser, 'parse',
+                          autospec=True,
+                          side_effect=ckanext.dcat.harvesters.rdf.RDFParser.parse) as mock_parse:
+            self._run_full_job(harvest_source['id'], num_objects=2)
+
+        assert mock_parse.call_count == 1
+
+        harvest_objects = model.Session.query(harvest_model.HarvestObject) \
+            .filter_by(harvest_source_id=harvest_source['id']).all()
+        assert len(harvest_objects) == 6
+        assert not [
+            obj for obj in harvest_objects
+            if any(e.key == 'status' and e.value == 'delete'
+                   for e in obj.extras)]
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+
+        assert (sorted([d['title'] for d in results['results']]) ==
+            ['Example dataset 1', 'Example dataset 2',
+             'Example dataset 3 (updated)', 'Example dataset 4'])
+
+    @responses.activate
+    def test_harvest_create_rdf_pagination_concurrent(self):
+
+        self._add_responses_solr_passthru()
+
+        responses.add(responses.GET, self.rdf_mock_url_pagination_1,
+                               body=self.rdf_content_pagination_1,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.GET, self.rdf_mock_url_pagination_2,
+                               body=self.rdf_content_pagination_2,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_1,
+                               status=405,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_2,
+                               status=405,
+                               content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(
+            self.rdf_mock_url_pagination_1,
+            config='{"gather_concurrency": 2}')
+
+        self._run_full_job(harvest_source['id'], num_objects=4)
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+
+        assert results['count'] == 4
+        assert (sorted([d['title'] for d in results['results']]) ==
+            ['Example dataset 1', 'Example dataset 2',
+             'Example dataset 3', 'Example dataset 4'])
+
+    @responses.activate
+    def test_harvest_rdf_pagination_resume_from_checkpoint(self, tmp_path):
+
+        self._add_responses_solr_passthru()
+
+        for url, content in (
+                (self.rdf_mock_url_pagination_1, self.rdf_content_pagination_1),
+                (self.rdf_mock_url_pagination_2, self.rdf_content_pagination_2)):
+            responses.add(responses.GET, url, body=content,
+                          content_type=self.rdf_content_type)
+            responses.add(responses.HEAD, url, status=405,
+                          content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(
+            self.rdf_mock_url_pagination_1)
+
+        self._run_full_job(harvest_source['id'], num_objects=4)
+        self._run_jobs()
+
+        harvest_job = harvest_model.HarvestJob.get(
+            self._create_harvest_job(harvest_source['id'])['id'])
+        harvester = DCATRDFHarvester()
+
+        def before_download(url, harvest_job):
+            if url == self.rdf_mock_url_pagination_2:
+                raise RuntimeError('Worker stopped')
+            return url
+
+        with patch.dict(config, {
+                'ckanext.dcat.gather_checkpoint_path': str(tmp_path)}):
+            # The gather stage is interrupted after the first page
+            with patch.object(DCATRDFHarvester, '_before_download',
+                              side_effect=before_download):
+                with pytest.raises(RuntimeError):
+                    harvester.gather_stage(harvest_job)
+            assert (tmp_path / '{0}.jsonl'.format(harvest_job.id)).exists()
+
+            responses.calls.reset()
+            object_ids = harvester.gather_stage(harvest_job)
+
+        # Only the second page was downloaded again
+        requested = [call.request.url for call in responses.calls
+                     if call.request.method == 'GET'
+                     and 'pagination' in call.request.url]
+        assert requested == [self.rdf_mock_url_pagination_2]
+        assert not list(tmp_path.iterdir())
+
+        # The datasets of the first page are not flagged for deletion
+        harvest_objects = model.Session.query(harvest_model.HarvestObject) \
+            .filter(harvest_model.HarvestObject.harvest_job_id == harvest_job.id) \
+            .all()
+        assert sorted(obj.id for obj in harvest_objects) == sorted(object_ids)
+        assert sorted(obj.guid for obj in harvest_objects) == [
+            'https://data.some.org/catalog/datasets/{0}'.format(i)
+            for i in range(1, 5)]
+        assert not any(extra.key == 'status' for obj in harvest_objects
+                       for extra in obj.extras)
+
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.gather_concurrency', 3)
+    @pytest.mark.parametrize('parser_processes', [1, 2])
+    def test_harvest_create_rdf_pagination_predicted_pages(self, parser_processes):
+
+        self._add_responses_solr_passthru()
+
+        url = 'http://some.dcat.file.pages.rdf?page={0}'
+        num_pages = 4
+
+        def page_content(page):
+            datasets = ''.join(
+                """<dcat:dataset>
+                <dcat:Dataset rdf:about="https://data.some.org/catalog/datasets/{0}">
+                  <dct:title>Example dataset {0}</dct:title>
+                </dcat:Dataset>
+                </dcat:dataset>""".format(i)
+                for i in (page * 2 - 1, page * 2))
+            next_page = ''
+            if page < num_pages:
+                next_page = '<hydra:next>{0}</hydra:next>'.format(
+                    url.format(page + 1))
+            return """<?xml version="1.0" encoding="utf-8" ?>
+            <rdf:RDF
+             xmlns:dct="http://purl.org/dc/terms/"
+             xmlns:dcat="http://www.w3.org/ns/dcat#"
+             xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+             xmlns:hydra="http://www.w3.org/ns/hydra/core#">
+            <dcat:Catalog rdf:about="https://data.some.org/catalog">
+            {datasets}
+            </dcat:Catalog>
+            <hydra:PagedCollection rdf:about="{current}">
+                <hydra:last>{last}</hydra:last>
+                {next_page}
+            </hydra:PagedCollection>
+            </rdf:RDF>""".format(
+                datasets=datasets, current=url.format(page),
+                last=url.format(num_pages), next_page=next_page)
+
+        for page in range(1, num_pages + 1):
+            responses.add(responses.GET, url.format(page),
+                          body=page_content(page),
+                          content_type=self.rdf_content_type)
+            responses.add(responses.HEAD, url.format(page), status=405)
+
+        harvest_source = self._create_harvest_source(
+            url.format(1),
+            config=json.dumps({'parser_processes': parser_processes}))
+
+        datasets_parallel = RDFParser._datasets_parallel
+        prefetch_threads = []
+
+        def parse_in_parallel(parser, processes, chunk_size):
+            prefetch_threads.extend(
+                thread for thread in threading.enumerate()
+                if thread.name.startswith('dcat-page-prefetch'))
+            return datasets_parallel(parser, processes, 1)
+
+        with patch.object(RDFParser, '_datasets_parallel', autospec=True,
+                          side_effect=parse_in_parallel) as mock_parallel:
+            self._run_full_job(harvest_source['id'], num_objects=num_pages * 2)
+
+        if parser_processes > 1:
+            # Pages are not downloaded in other threads while forking the
+            # parser processes
+            assert mock_parallel.call_count == num_pages
+            assert not prefetch_threads
+
+        # Each page was only requested once
+        requested = [
+            call.request.url for call in responses.calls
+            if call.request.method == 'GET' and 'pages.rdf' in call.request.url
+        ]
+        assert sorted(requested) == sorted(set(requested))
+        assert len(requested) == num_pages
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq, rows=100)
+
+        assert results['count'] == num_pages * 2
+
     @responses.activate
     def test_harvest_create_rdf_pagination_same_content(self):
 
@@ -883,6 +1702,55 @@ class TestDCATHarvestFunctional(FunctionalHarvestTest):
             assert result['title'] in ('Example dataset 1 (updated)',
                                        'Example dataset 2')
 
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.skip_unchanged_datasets', True)
+    def test_harvest_update_skip_unchanged_datasets(self):
+
+        self._add_responses_solr_passthru()
+
+        # The first dataset has a blank node distribution, with a different
+        # id every time the file is parsed
+        content = self.rdf_content.replace(
+            '</dcat:Dataset>',
+            '<dcat:distribution><dcat:Distribution>'
+            '<dct:title>Blank node distribution</dct:title>'
+            '</dcat:Distribution></dcat:distribution>'
+            '</dcat:Dataset>', 1)
+        responses.add(responses.GET, self.rdf_mock_url,
+                               body=content,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.GET, self.rdf_mock_url,
+                               body=content.replace(
+                                   'Example dataset 2',
+                                   'Example dataset 2 (updated)'),
+                               content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url,
+                               status=405,
+                               content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(self.rdf_mock_url)
+
+        self._run_full_job(harvest_source['id'], num_objects=2)
+        self._run_jobs()
+
+        # Only the updated dataset is gathered
+        self._run_full_job(harvest_source['id'], num_objects=1)
+
+        harvest_objects = model.Session.query(harvest_model.HarvestObject) \
+            .filter_by(harvest_source_id=harvest_source['id']).all()
+        assert len(harvest_objects) == 3
+        assert not [
+            obj for obj in harvest_objects
+            if any(e.key == 'status' and e.value == 'delete'
+                   for e in obj.extras)]
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+
+        assert results['count'] == 2
+        assert (sorted([d['title'] for d in results['results']]) ==
+            ['Example dataset 1', 'Example dataset 2 (updated)'])
+
     def test_harvest_update_existing_resources(self):
 
         existing, new = self._test_harvest_update_resources(self.rdf_mock_url,
@@ -901,6 +1769,79 @@ class TestDCATHarvestFunctional(FunctionalHarvestTest):
         assert new['uri'] == ''
         assert new['id'] != existing['id']
 
+    def test_harvest_update_existing_resources_import_index(self):
+
+        with patch.object(DCATRDFHarvester, '_read_datasets_from_db',
+                          wraps=DCATRDFHarvester()._read_datasets_from_db
+                          ) as mock_read:
+            existing, new = self._test_harvest_update_resources(
+                self.rdf_mock_url,
+                self.rdf_content_with_distribution_uri,
+                self.rdf_content_type)
+
+        # Existing datasets were looked up in the job's import index
+        assert not mock_read.called
+        assert new['id'] == existing['id']
+
+    @pytest.mark.ckan_config('ckanext.dcat.import_index', False)
+    def test_harvest_update_existing_resources_no_import_index(self):
+
+        with patch.object(DCATRDFHarvester, '_read_datasets_from_db',
+                          wraps=DCATRDFHarvester()._read_datasets_from_db
+                          ) as mock_read:
+            existing, new = self._test_harvest_update_resources(
+                self.rdf_mock_url,
+                self.rdf_content_with_distribution_uri,
+                self.rdf_content_type)
+
+        assert mock_read.call_count == 2
+        assert new['id'] == existing['id']
+
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.search_commit_batch_size', 5)
+    @pytest.mark.ckan_config('ckan.search.solr_commit', False)
+    def test_harvest_create_deferred_search_commit(self):
+
+        self._add_responses_solr_passthru()
+        responses.add(responses.GET, self.rdf_mock_url,
+                               body=self.rdf_content,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url,
+                               status=405,
+                               content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(self.rdf_mock_url)
+
+        with patch.object(pysolr.Solr, 'add', autospec=True,
+                          side_effect=pysolr.Solr.add) as mock_add, \
+                patch.object(search, 'commit',
+                             wraps=search.commit) as mock_commit:
+            self._run_full_job(harvest_source['id'], num_objects=2)
+
+        # The datasets were indexed without committing, and the index was
+        # committed once for both of them after the last object of the job,
+        # before the batch was complete
+        dataset_commits = [
+            call[1].get('commit') for call in mock_add.call_args_list
+            if call[1]['docs'][0].get('dataset_type') == 'dataset']
+        assert len(dataset_commits) >= 2
+        assert not any(dataset_commits)
+        assert mock_commit.call_count == 1
+        assert config['ckan.search.solr_commit'] is False
+
+        # The import context and index of the job were dropped
+        harvester = p.get_plugin('dcat_rdf_harvester')
+        job = harvest_model.HarvestJob.filter(
+            source_id=harvest_source['id']).one()
+        assert job.id not in (harvester._import_contexts or {})
+        assert job.id not in (harvester._import_indexes or {})
+
+        self._run_jobs()
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+        assert results['count'] == 2
+
     @responses.activate
     def _test_harvest_update_resources(self, url, content, content_type):
 
@@ -1111,6 +2052,85 @@ class TestDCATHarvestFunctional(FunctionalHarvestTest):
                                       'example-dataset-1')
 
 
+    @pytest.mark.ckan_config('ckanext.dcat.gather_batch_size', '1')
+    @responses.activate
+    def test_harvest_create_gather_batches(self):
+
+        with patch.object(DCATRDFHarvester, '_save_harvest_objects',
+                          autospec=True,
+                          side_effect=DCATRDFHarvester._save_harvest_objects) as mock_save:
+            self._test_harvest_create(self.rdf_mock_url,
+                                      self.rdf_content,
+                                      self.rdf_content_type)
+
+        assert mock_save.call_count == 2
+        for call in mock_save.call_args_list:
+            assert len(call[0][1]) == 1
+
+    @responses.activate
+    def test_harvest_create_gather_single_batch(self):
+
+        with patch.object(DCATRDFHarvester, '_save_harvest_objects',
+                          autospec=True,
+                          side_effect=DCATRDFHarvester._save_harvest_objects) as mock_save:
+            self._test_harvest_create(self.rdf_mock_url,
+                                      self.rdf_content,
+                                      self.rdf_content_type)
+
+        assert mock_save.call_count == 1
+        assert len(mock_save.call_args[0][1]) == 2
+
+
+    @pytest.mark.ckan_config('ckanext.dcat.gather_batch_size', '2')
+    def test_mark_datasets_for_deletion_bulk_queries(self):
+
+        harvest_source = self._create_harvest_source(self.rdf_mock_url)
+        harvest_job = self._create_harvest_job(harvest_source['id'])
+        harvest_job = harvest_model.HarvestJob.get(harvest_job['id'])
+
+        guids = ['guid-{}'.format(i) for i in range(5)]
+        package_ids = {}
+        for guid in guids:
+            package_ids[guid] = factories.Dataset()['id']
+            harvest_model.HarvestObject(
+                guid=guid, job=harvest_job, current=True,
+                package_id=package_ids[guid]).save()
+
+        statements = []
+
+        def _count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(model.meta.engine, 'before_cursor_execute', _count_statement)
+        try:
+            harvester = DCATRDFHarvester()
+            object_ids = harvester._mark_datasets_for_deletion(
+                ['guid-0'], harvest_job)
+        finally:
+            event.remove(model.meta.engine, 'before_cursor_execute', _count_statement)
+
+        assert len(object_ids) == 4
+
+        # 4 guids to delete in batches of 2
+        updates = [s for s in statements if s.startswith('UPDATE harvest_object ')]
+        inserts = [s for s in statements if s.startswith('INSERT INTO harvest_object ')]
+        extra_inserts = [s for s in statements if s.startswith('INSERT INTO harvest_object_extra ')]
+        assert len(updates) == 2
+        assert len(inserts) == 2
+        assert len(extra_inserts) == 2
+
+        objects = model.Session.query(harvest_model.HarvestObject) \
+            .filter(harvest_model.HarvestObject.id.in_(object_ids)).all()
+        assert sorted(o.guid for o in objects) == guids[1:]
+        for obj in objects:
+            assert obj.package_id == package_ids[obj.guid]
+            assert [(e.key, e.value) for e in obj.extras] == [('status', 'delete')]
+
+        current = model.Session.query(harvest_model.HarvestObject.guid) \
+            .filter(harvest_model.HarvestObject.current == True)
+        assert [guid for guid, in current] == ['guid-0']
+
+
 @pytest.mark.usefixtures(
     'with_plugins',
     'clean_db',
@@ -1255,6 +2275,40 @@ class TestDCATHarvestFunctionalExtensionPoints(FunctionalHarvestTest):
         assert ('true'
                 in responses.calls[-1].request.headers['x-test'])
 
+    @responses.activate
+    def test_harvest_update_session_called_once_per_job(self, reset_calls_counter):
+
+        self._add_responses_solr_passthru()
+        reset_calls_counter('test_rdf_harvester')
+        plugin = p.get_plugin('test_rdf_harvester')
+
+        responses.add(responses.GET, self.rdf_mock_url_pagination_1,
+                               body=self.rdf_content_pagination_1,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.GET, self.rdf_mock_url_pagination_2,
+                               body=self.rdf_content_pagination_2,
+                               content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_1,
+                               status=405)
+        responses.add(responses.HEAD, self.rdf_mock_url_pagination_2,
+                               status=405)
+
+        harvest_source = self._create_harvest_source(
+            self.rdf_mock_url_pagination_1)
+        self._create_harvest_job(harvest_source['id'])
+        self._run_jobs(harvest_source['id'])
+        self._gather_queue(1)
+
+        assert plugin.calls['update_session'] == 1
+
+        # All requests were made with the session returned by the plugin
+        for call in responses.calls:
+            if 'dcat.file' in call.request.url:
+                assert call.request.headers['x-test'] == 'true'
+
+        # Run the jobs to mark the previous one as Finished
+        self._run_jobs()
+
     @responses.activate
     def test_harvest_after_download_extension_point_gets_called(self, reset_calls_counter):
 
@@ -1514,7 +2568,8 @@ class TestDCATHarvestFunctionalExtensionPoints(FunctionalHarvestTest):
         last_job_status = harvest_source['status']['last_job']
         assert last_job_status['status'] == 'Finished'
 
-        assert plugin.calls['update_package_schema_for_create'] == 2
+        # The schema is built once per job
+        assert plugin.calls['update_package_schema_for_create'] == 1
         assert plugin.calls['before_create'] == 2
         assert plugin.calls['after_create'] == 2
         assert plugin.calls['update_package_schema_for_update'] == 0
@@ -1530,13 +2585,107 @@ class TestDCATHarvestFunctionalExtensionPoints(FunctionalHarvestTest):
         # Run a second job
         self._run_full_job(harvest_source['id'], num_objects=2)
 
-        assert plugin.calls['update_package_schema_for_create'] == 2
+        assert plugin.calls['update_package_schema_for_create'] == 1
         assert plugin.calls['before_create'] == 2
         assert plugin.calls['after_create'] == 2
-        assert plugin.calls['update_package_schema_for_update'] == 2
+        assert plugin.calls['update_package_schema_for_update'] == 1
         assert plugin.calls['before_update'] == 2
         assert plugin.calls['after_update'] == 2
 
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.skip_unchanged_datasets', True)
+    def test_harvest_skip_unchanged_datasets_failed_import(self, reset_calls_counter):
+
+        self._add_responses_solr_passthru()
+        reset_calls_counter('test_rdf_harvester')
+
+        for i in range(2):
+            responses.add(responses.GET, self.rdf_mock_url,
+                                   body=self.rdf_content,
+                                   content_type=self.rdf_content_type)
+        responses.add(responses.HEAD, self.rdf_mock_url,
+                               status=405,
+                               content_type=self.rdf_content_type)
+
+        harvest_source = self._create_harvest_source(self.rdf_mock_url)
+
+        # The datasets are created, but the import fails afterwards
+        with patch.object(TestRDFHarvester, 'after_create',
+                          return_value='Test error'):
+            self._run_full_job(harvest_source['id'], num_objects=2)
+        self._run_jobs()
+
+        harvest_objects = model.Session.query(harvest_model.HarvestObject) \
+            .filter_by(harvest_source_id=harvest_source['id']).all()
+        assert [obj.state for obj in harvest_objects] == ['ERROR', 'ERROR']
+
+        # The same datasets are gathered and imported again
+        self._run_full_job(harvest_source['id'], num_objects=2)
+        self._run_jobs()
+
+        harvest_source = helpers.call_action('harvest_source_show',
+                                       id=harvest_source['id'])
+        last_job_status = harvest_source['status']['last_job']
+        assert last_job_status['stats']['updated'] == 2
+        assert last_job_status['stats']['errored'] == 0
+
+    def test_import_context_reused_for_the_same_job(self, reset_calls_counter):
+
+        reset_calls_counter('test_rdf_harvester')
+        plugin = p.get_plugin('test_rdf_harvester')
+
+        harvester = DCATRDFHarvester()
+        object_1 = harvest_model.HarvestObject(
+            harvest_job_id='job-context-1', harvest_source_id='source-id')
+        object_2 = harvest_model.HarvestObject(
+            harvest_job_id='job-context-1', harvest_source_id='source-id')
+        object_3 = harvest_model.HarvestObject(
+            harvest_job_id='job-context-2', harvest_source_id='source-id')
+
+        import_context = harvester._get_import_context(object_1)
+        assert harvester._get_import_context(object_2) is import_context
+
+        schema = import_context.get_package_schema(None, 'create')
+        schema['id'] = ['test']
+        # Callers get a copy of the cached schema
+        assert import_context.get_package_schema(None, 'create') != schema
+        assert plugin.calls['update_package_schema_for_create'] == 1
+
+        new_import_context = harvester._get_import_context(object_3)
+        assert new_import_context is not import_context
+        new_import_context.get_package_schema(None, 'create')
+        assert plugin.calls['update_package_schema_for_create'] == 2
+
+        # Interleaved jobs keep their own context
+        assert harvester._get_import_context(object_1) is import_context
+        assert harvester._get_import_context(object_3) is new_import_context
+        assert plugin.calls['update_package_schema_for_create'] == 2
+
+    def test_import_cache_bounded(self):
+
+        harvester = DCATRDFHarvester()
+        import_contexts = []
+        with patch.object(search, 'commit') as mock_commit:
+            for i in range(harvester.IMPORT_CACHE_SIZE + 1):
+                harvest_object = harvest_model.HarvestObject(
+                    harvest_job_id='job-cache-{0}'.format(i),
+                    harvest_source_id='source-id')
+                import_context = harvester._get_import_context(harvest_object)
+                import_context.pending_search_ids.add('dataset-{0}'.format(i))
+                import_contexts.append(import_context)
+                harvester._get_import_index(harvest_object)
+
+        assert len(harvester._import_contexts) == harvester.IMPORT_CACHE_SIZE
+        assert len(harvester._import_indexes) == harvester.IMPORT_CACHE_SIZE
+        assert 'job-cache-0' not in harvester._import_contexts
+        assert 'job-cache-0' not in harvester._import_indexes
+
+        # The datasets of the evicted context were committed
+        assert mock_commit.call_count == 1
+        assert import_contexts[0].pending_search_ids == set()
+        assert import_contexts[-1].pending_search_ids == {
+            'dataset-{0}'.format(harvester.IMPORT_CACHE_SIZE)}
+
 
 @pytest.mark.usefixtures(
     'with_plugins',
@@ -1590,7 +2739,7 @@ class TestDCATHarvestFunctionalSetNull(FunctionalHarvestTest):
             }
         )
 
-        assert plugin.calls['update_package_schema_for_create'] == 2
+        assert plugin.calls['update_package_schema_for_create'] == 1
         assert plugin.calls['before_create'] == 2
         assert plugin.calls['after_create'] == 0
         assert plugin.calls['update_package_schema_for_update'] == 0
@@ -1653,7 +2802,7 @@ class TestDCATHarvestFunctionalRaiseExcpetion(FunctionalHarvestTest):
                 'errored': 1
             }
         )
-        assert plugin.calls['update_package_schema_for_create'] == 2
+        assert plugin.calls['update_package_schema_for_create'] == 1
         assert plugin.calls['before_create'] == 2
         assert plugin.calls['after_create'] == 1
         assert plugin.calls['update_package_schema_for_update'] == 0
@@ -1666,13 +2815,24 @@ class TestDCATRDFHarvester(object):
     def test_validates_correct_config(self):
         harvester = DCATRDFHarvester()
 
-        for config in ['{}', '{"rdf_format":"text/turtle"}']:
+        for config in ['{}', '{"rdf_format":"text/turtle"}',
+                       '{"parser_processes": 4}', '{"gather_concurrency": 4}',
+                       '{"streaming": true}', '{"store_descriptions": true}',
+                       '{"disk_store_threshold": 0}']:
             assert config == harvester.validate_config(config)
 
     def test_does_not_validate_incorrect_config(self):
         harvester = DCATRDFHarvester()
 
-        for config in ['invalid', '{invalid}', '{rdf_format:invalid}']:
+        for config in ['invalid', '{invalid}', '{rdf_format:invalid}',
+                       '{"parser_processes": 0}', '{"parser_processes": "4"}',
+                       '{"gather_concurrency": 0}',
+                       '{"gather_concurrency": true}',
+                       '{"streaming": "yes"}',
+                       '{"store_descriptions": 1}',
+                       '{"store_descriptions": true, "streaming": true}',
+                       '{"disk_store_threshold": -1}',
+                       '{"disk_store_threshold": "1000"}']:
             try:
                 harvester.validate_config(config)
                 assert False
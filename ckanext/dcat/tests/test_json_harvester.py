@@ -1,5 +1,8 @@
 from __future__ import absolute_import
 from builtins import object
+import io
+import json
+import re
 
 import responses
 import pytest
@@ -10,9 +13,13 @@ except ImportError:
 
 from ckantoolkit.tests import helpers
 
+from ckan import model
+
 import ckan.tests.factories as factories
 
-from ckanext.dcat.harvesters._json import copy_across_resource_ids, DCATJSONHarvester
+from ckanext.harvest.model import HarvestObject
+from ckanext.dcat.harvesters._json import (
+    copy_across_resource_ids, DCATJSONHarvester, JSONDatasetsReader)
 
 from .test_harvester import FunctionalHarvestTest, clean_queues
 
@@ -215,6 +222,207 @@ class TestDCATJSONHarvestFunctional(FunctionalHarvestTest):
 
         return (existing_resources, new_resources)
 
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.conditional_requests', True)
+    def test_harvest_conditional_requests(self):
+
+        self._add_responses_solr_passthru()
+
+        url = self.json_mock_url
+        content = self.json_content.replace(
+            '"identifier": "http://example.com/datasets/example1",\n'
+            '     "title": "Example dataset 2"',
+            '"identifier": "http://example.com/datasets/example2",\n'
+            '     "title": "Example dataset 2"')
+
+        def callback(request):
+            if request.headers.get('If-None-Match') == '"v1"':
+                return (304, {}, '')
+            return (200, {'ETag': '"v1"'}, content)
+
+        responses.add_callback(responses.GET, url, callback=callback,
+                               content_type=self.json_content_type)
+        responses.add(responses.HEAD, url,
+                               status=405, content_type=self.json_content_type)
+
+        harvest_source = self._create_harvest_source(
+            url, source_type='dcat_json')
+
+        self._run_full_job(harvest_source['id'], num_objects=2)
+        self._run_jobs()
+
+        # The first page is not modified. The second one returns the same
+        # datasets so it didn't create any objects and needs to be
+        # requested again, but nothing is gathered
+        self._run_full_job(harvest_source['id'], num_objects=0)
+
+        assert [
+            call.request.headers.get('If-None-Match')
+            for call in responses.calls if call.request.method == 'GET'
+            and 'dcat.file' in call.request.url
+        ] == [None, None, '"v1"', None]
+
+        harvest_objects = model.Session.query(HarvestObject) \
+            .filter_by(harvest_source_id=harvest_source['id']).all()
+        assert len(harvest_objects) == 2
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+        assert results['count'] == 2
+
+    @responses.activate
+    @pytest.mark.ckan_config('ckanext.dcat.skip_unchanged_datasets', True)
+    def test_harvest_skip_unchanged_datasets(self):
+
+        self._add_responses_solr_passthru()
+
+        url = self.json_mock_url
+        responses.add(responses.GET, url,
+                               body=self.json_content_with_distribution,
+                               content_type=self.json_content_type)
+        responses.add(responses.HEAD, url,
+                               status=405, content_type=self.json_content_type)
+
+        harvest_source = self._create_harvest_source(
+            url, source_type='dcat_json')
+
+        self._run_full_job(harvest_source['id'], num_objects=1)
+        self._run_jobs()
+
+        # The dataset has not changed, so nothing is gathered
+        self._run_full_job(harvest_source['id'], num_objects=0)
+
+        harvest_objects = model.Session.query(HarvestObject) \
+            .filter_by(harvest_source_id=harvest_source['id']).all()
+        assert len(harvest_objects) == 1
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+        assert results['count'] == 1
+
+    @responses.activate
+    def test_harvest_concurrent_pages(self):
+
+        self._add_responses_solr_passthru()
+
+        url = self.json_mock_url
+        pages = {
+            '1': {'dataset': [
+                {'identifier': 'http://example.com/datasets/1',
+                 'title': 'Example dataset 1'}]},
+            '2': {'dataset': [
+                {'identifier': 'http://example.com/datasets/2',
+                 'title': 'Example dataset 2'}]},
+            '3': {'dataset': []},
+        }
+
+        def callback(request):
+            page = re.search(r'page=(\d+)', request.url)
+            page = page.group(1) if page else '1'
+            if page not in pages:
+                return (404, {}, '')
+            return (200, {}, json.dumps(pages[page]))
+
+        responses.add_callback(responses.GET, re.compile(re.escape(url)),
+                               callback=callback,
+                               content_type=self.json_content_type)
+        responses.add(responses.HEAD, re.compile(re.escape(url)),
+                               status=405, content_type=self.json_content_type)
+
+        harvest_source = self._create_harvest_source(
+            url, source_type='dcat_json', config='{"gather_concurrency": 4}')
+
+        self._run_full_job(harvest_source['id'], num_objects=2)
+
+        fq = "+type:dataset harvest_source_id:{0}".format(harvest_source['id'])
+        results = helpers.call_action('package_search', {}, fq=fq)
+        assert results['count'] == 2
+        assert (sorted([d['title'] for d in results['results']]) ==
+            ['Example dataset 1', 'Example dataset 2'])
+
+    @responses.activate
+    def test_harvest_concurrent_pages_not_paginated(self):
+
+        self._add_responses_solr_passthru()
+
+        url = self.json_mock_url
+        content = json.dumps({'dataset': [
+            {'identifier': 'http://example.com/datasets/1',
+             'title': 'Example dataset 1'}]})
+
+        responses.add(responses.GET, re.compile(re.escape(url)),
+                      body=content, content_type=self.json_content_type)
+        responses.add(responses.HEAD, re.compile(re.escape(url)),
+                               status=405, content_type=self.json_content_type)
+
+        harvest_source = self._create_harvest_source(
+            url, source_type='dcat_json', config='{"gather_concurrency": 4}')
+
+        self._run_full_job(harvest_source['id'], num_objects=1)
+
+        # The source ignores the page parameter, so no pages are requested
+        # in advance after finding the same datasets in the second one
+        get_urls = [call.request.url for call in responses.calls
+                    if call.request.method == 'GET'
+                    and call.request.url.startswith(url)]
+        assert get_urls == [url + '/', url + '/?page=2']
+
+    @responses.activate
+    def test_harvest_parse_error_removes_gathered_objects(self):
+
+        self._add_responses_solr_passthru()
+
+        url = self.json_mock_url
+        pages = {
+            '1': json.dumps({'dataset': [
+                {'identifier': 'http://example.com/datasets/1',
+                 'title': 'Example dataset 1'}]}),
+            # The first dataset of the page is read before the error
+            '2': '{"dataset": [{"identifier": "http://example.com/datasets/2",'
+                 ' "title": "Example dataset 2"}, {"identifier": ',
+        }
+
+        def callback(request):
+            page = re.search(r'page=(\d+)', request.url)
+            page = page.group(1) if page else '1'
+            return (200, {}, pages[page])
+
+        responses.add_callback(responses.GET, re.compile(re.escape(url)),
+                               callback=callback,
+                               content_type=self.json_content_type)
+        responses.add(responses.HEAD, re.compile(re.escape(url)),
+                               status=405, content_type=self.json_content_type)
+
+        harvest_source = self._create_harvest_source(
+            url, source_type='dcat_json')
+        harvest_job = self._create_harvest_job(harvest_source['id'])
+        self._run_jobs(harvest_source['id'])
+        self._gather_queue(1)
+
+        assert model.Session.query(HarvestObject).filter_by(
+            harvest_source_id=harvest_source['id']).count() == 0
+
+        job = helpers.call_action('harvest_job_show', {}, id=harvest_job['id'])
+        assert any('Error parsing file' in error['message']
+                   for error in job['gather_error_summary'])
+
+    def test_harvest_create_payload_store(self, tmp_path):
+
+        with patch.dict('ckantoolkit.config', {
+                'ckanext.dcat.payload_encoding': 'lzma',
+                'ckanext.dcat.payload_store_path': str(tmp_path)}):
+            self._test_harvest_create(
+                self.json_mock_url,
+                self.json_content_with_distribution,
+                self.json_content_type,
+                num_datasets=1,
+                exp_num_datasets=1,
+                exp_titles=['Example dataset 1'])
+
+        harvest_object = model.Session.query(HarvestObject).one()
+        assert harvest_object.content.startswith('dcat-blob:lzma:')
+        assert len(list(tmp_path.glob('*/*.lzma'))) == 1
+
     def test_harvest_does_not_create_with_invalid_tags(self):
         self._test_harvest_create(
             'http://some.dcat.file.invalid.json',
@@ -224,6 +432,62 @@ class TestDCATJSONHarvestFunctional(FunctionalHarvestTest):
             exp_num_datasets=0)
 
 
+class TestJSONDatasetsReader(object):
+
+    def test_top_level_list(self):
+        content = '[{"identifier": "a"}, {"identifier": "b"}]'
+
+        assert list(JSONDatasetsReader(content)) == [
+            '{"identifier": "a"}', '{"identifier": "b"}']
+
+    def test_dataset_list_in_object(self):
+        content = '''{
+            "@context": "https://project-open-data.cio.gov/v1.1/schema/catalog.jsonld",
+            "describedBy": {"nested": ["[", "{", "\\"]"]},
+            "dataset": [
+                {"identifier": "a", "title": "Brackets ] } and \\" quotes"},
+                {"identifier": "b", "keyword": ["x", "y"]}
+            ],
+            "conformsTo": "https://project-open-data.cio.gov/v1.1/schema"
+        }'''
+
+        datasets = list(JSONDatasetsReader(content))
+
+        assert datasets == [
+            '{"identifier": "a", "title": "Brackets ] } and \\" quotes"}',
+            '{"identifier": "b", "keyword": ["x", "y"]}']
+        assert json.loads(datasets[0])['title'] == 'Brackets ] } and " quotes'
+
+    def test_no_datasets(self):
+        assert list(JSONDatasetsReader('[]')) == []
+        assert list(JSONDatasetsReader('{}')) == []
+        assert list(JSONDatasetsReader('{"title": "No datasets"}')) == []
+
+    def test_small_chunks(self):
+        datasets = [
+            {'identifier': 'a', 'title': 'Caf\u00e9 \u2603', 'keyword': ['1']},
+            {'identifier': 'b', 'title': 'Escaped \\ and "quotes"'},
+        ]
+        content = json.dumps({'title': 'x' * 50, 'dataset': datasets},
+                             ensure_ascii=False).encode('utf-8')
+
+        for chunk_size in (1, 2, 3, 7):
+            result = JSONDatasetsReader(io.BytesIO(content), chunk_size)
+            assert [json.loads(d) for d in result] == datasets
+
+    @pytest.mark.parametrize('content', [
+        '"dataset"',
+        '{"dataset": {}}',
+        '[{"identifier": "a"}',
+        '[{"identifier": "a"} {"identifier": "b"}]',
+        '[{"identifier": "a"}] []',
+        '',
+    ])
+    def test_invalid_documents(self, content):
+        with pytest.raises(ValueError):
+            list(JSONDatasetsReader(content))
+
+
 class TestCopyAcrossResourceIds(object):
     def test_copied_because_same_uri(self):
         harvested_dataset = {'resources': [
@@ -67,6 +67,54 @@ def test_dataset_show_without_format():
     assert dcat_dataset['notes'] == dataset['notes']
 
 
+@pytest.mark.usefixtures('with_plugins', 'clean_db')
+@pytest.mark.ckan_config('ckanext.dcat.serialization_cache', 'memory')
+def test_dataset_show_cached():
+    dataset = factories.Dataset(
+        notes='Test dataset'
+    )
+
+    content = helpers.call_action(
+        'dcat_dataset_show', id=dataset['id'], format='ttl')
+
+    with mock.patch('ckanext.dcat.logic.RDFSerializer') as mock_serializer:
+        cached_content = helpers.call_action(
+            'dcat_dataset_show', id=dataset['id'], format='ttl')
+
+        assert cached_content == content
+        mock_serializer.assert_not_called()
+
+        # A different format is not cached yet
+        helpers.call_action(
+            'dcat_dataset_show', id=dataset['id'], format='jsonld')
+
+        mock_serializer.assert_called_once()
+
+
+@pytest.mark.usefixtures('with_plugins', 'clean_db')
+@pytest.mark.ckan_config('ckanext.dcat.serialization_cache', 'memory')
+def test_dataset_show_cache_invalidated_on_update():
+    dataset = factories.Dataset(
+        notes='Test dataset'
+    )
+
+    helpers.call_action('dcat_dataset_show', id=dataset['id'], format='ttl')
+
+    helpers.call_action(
+        'package_patch', id=dataset['id'], notes='Updated dataset')
+
+    content = helpers.call_action(
+        'dcat_dataset_show', id=dataset['id'], format='ttl')
+
+    p = RDFParser()
+
+    p.parse(content, _format='ttl')
+
+    dcat_datasets = [d for d in p.datasets()]
+
+    assert dcat_datasets[0]['notes'] == 'Updated dataset'
+
+
 # Pagination
 
 @pytest.mark.usefixtures("with_request_context")
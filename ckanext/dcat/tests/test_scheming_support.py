@@ -27,6 +27,7 @@ from ckanext.dcat.profiles import (
     GEOJSON_IMT,
     SPDX,
 )
+from ckanext.dcat.profiles.base import get_dataset_schema
 from ckanext.dcat.tests.utils import BaseSerializeTest, BaseParseTest
 
 
@@ -716,6 +717,22 @@ class TestSchemingValidators:
     "ckanext.dcat.rdf.profiles", "euro_dcat_ap_2 euro_dcat_ap_scheming"
 )
 class TestSchemingParseSupport(BaseParseTest):
+    def test_schema_loaded_once(self):
+        contents = self._get_file_contents("dcat/catalog.rdf")
+
+        p = RDFParser()
+
+        p.parse(contents)
+
+        with mock.patch(
+            "ckanext.dcat.processors.get_dataset_schema",
+            wraps=get_dataset_schema,
+        ) as mock_get_schema:
+            datasets = [d for d in p.datasets()]
+
+        assert len(datasets) == 2
+        mock_get_schema.assert_called_once_with("dataset")
+
     def test_e2e_dcat_to_ckan(self):
         """
         Parse a DCAT RDF graph into a CKAN dataset dict, create a dataset with package_create
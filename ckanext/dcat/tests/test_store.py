@@ -0,0 +1,189 @@
+import os
+import multiprocessing
+
+import pytest
+
+from rdflib import ConjunctiveGraph, Graph, URIRef, BNode, Literal
+from rdflib.namespace import Namespace, RDF, XSD
+
+from ckanext.dcat.store import SQLiteStore
+
+DCT = Namespace("http://purl.org/dc/terms/")
+DCAT = Namespace("http://www.w3.org/ns/dcat#")
+
+
+def _graph(threshold=0, **kwargs):
+    return ConjunctiveGraph(store=SQLiteStore(threshold=threshold, **kwargs))
+
+
+def _add_dataset(g, num):
+    dataset = URIRef('http://example.org/datasets/{0}'.format(num))
+    g.add((dataset, RDF.type, DCAT.Dataset))
+    g.add((dataset, DCT.title, Literal('Test Dataset {0}'.format(num))))
+    return dataset
+
+
+class TestSQLiteStore(object):
+
+    def test_add_and_query(self):
+        g = _graph()
+        dataset1 = _add_dataset(g, 1)
+        dataset2 = _add_dataset(g, 2)
+
+        assert g.store.on_disk
+        assert len(g) == 4
+        assert sorted(g.subjects(RDF.type, DCAT.Dataset)) == [
+            dataset1, dataset2]
+        assert g.value(dataset1, DCT.title) == Literal('Test Dataset 1')
+        assert (dataset2, DCT.title, Literal('Test Dataset 2')) in g
+        assert (dataset2, DCT.title, Literal('Test Dataset 1')) not in g
+        assert len(list(g.triples((None, DCT.title, None)))) == 2
+        assert list(g.triples((None, DCT.description, None))) == []
+
+    def test_add_existing_triple(self):
+        g = _graph()
+        _add_dataset(g, 1)
+        _add_dataset(g, 1)
+
+        assert len(g) == 2
+
+    @pytest.mark.parametrize('term', [
+        Literal('Some text'),
+        Literal('Some text\nwith "quotes", \\backslashes and ünicode'),
+        Literal('Texto', lang='es'),
+        Literal('2012-05-10', datatype=XSD.date),
+        Literal(3),
+        Literal(''),
+        URIRef('http://example.org/some#resource'),
+        BNode(),
+    ])
+    def test_terms(self, term):
+        g = _graph()
+        subject = URIRef('http://example.org/datasets/1')
+        g.add((subject, DCT.description, term))
+
+        value = g.value(subject, DCT.description)
+        assert value == term
+        assert type(value) == type(term)
+        if isinstance(term, Literal):
+            assert value.language == term.language
+            assert value.datatype == term.datatype
+        assert list(g.subjects(DCT.description, term)) == [subject]
+
+    def test_remove(self):
+        g = _graph()
+        dataset1 = _add_dataset(g, 1)
+        dataset2 = _add_dataset(g, 2)
+
+        g.remove((dataset1, None, None))
+        assert len(g) == 2
+        assert list(g.subjects(RDF.type, DCAT.Dataset)) == [dataset2]
+
+        g.remove((None, DCT.title, None))
+        assert len(g) == 1
+
+        # Terms not in the store
+        g.remove((URIRef('http://example.org/other'), None, None))
+        assert len(g) == 1
+
+    def test_contexts(self):
+        g = _graph()
+        dataset = _add_dataset(g, 1)
+        context = g.get_context(URIRef('http://example.org/graph'))
+        context.add((dataset, DCT.title, Literal('Test Dataset 1')))
+        context.add((dataset, DCT.description, Literal('Description')))
+
+        # Triples are returned once, even if in more than one context
+        assert len(g) == 3
+        assert len(list(g.triples((dataset, None, None)))) == 3
+        assert len(context) == 2
+        assert sorted(c.identifier for c in g.contexts()) == sorted(
+            [g.default_context.identifier, context.identifier])
+        assert [c.identifier for c in g.contexts(
+            (dataset, DCT.description, Literal('Description')))] == [
+            context.identifier]
+
+        g.remove((dataset, DCT.title, None, context))
+        assert len(context) == 1
+        assert (dataset, DCT.title, Literal('Test Dataset 1')) in g
+
+    def test_namespaces(self):
+        g = _graph()
+        g.bind('dcat', DCAT)
+        _add_dataset(g, 1)
+
+        assert g.store.namespace('dcat') == URIRef(DCAT)
+        assert 'dcat:Dataset' in g.serialize(format='turtle')
+
+    def test_parse_and_serialize(self):
+        source = Graph()
+        for num in range(1, 4):
+            _add_dataset(source, num)
+
+        g = _graph()
+        g.parse(data=source.serialize(format='xml'), format='xml')
+
+        assert len(g) == 6
+        assert Graph().parse(
+            data=g.serialize(format='nt'), format='nt').isomorphic(source)
+
+    def test_threshold(self):
+        g = _graph(threshold=4)
+        _add_dataset(g, 1)
+        _add_dataset(g, 2)
+
+        assert not g.store.on_disk
+        assert g.store.path is None
+
+        dataset3 = _add_dataset(g, 3)
+
+        assert g.store.on_disk
+        assert os.path.exists(g.store.path)
+        assert len(g) == 6
+        assert len(list(g.subjects(RDF.type, DCAT.Dataset))) == 3
+        assert g.value(dataset3, DCT.title) == Literal('Test Dataset 3')
+
+    def test_database_in_directory(self, tmp_path):
+        g = _graph(directory=str(tmp_path))
+        _add_dataset(g, 1)
+
+        assert os.path.dirname(g.store.path) == str(tmp_path)
+
+    def test_close_removes_database(self):
+        g = _graph()
+        _add_dataset(g, 1)
+        path = g.store.path
+
+        g.close()
+
+        assert not os.path.exists(path)
+
+    def test_database_removed_when_collected(self):
+        store = SQLiteStore()
+        path = store.path
+        assert os.path.exists(path)
+
+        del store
+
+        assert not os.path.exists(path)
+
+    def test_read_from_forked_process(self):
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            pytest.skip('Forking processes is not supported')
+
+        g = _graph()
+        _add_dataset(g, 1)
+        g.commit()
+
+        queue = context.Queue()
+        process = context.Process(target=lambda: queue.put(
+            str(g.value(URIRef('http://example.org/datasets/1'), DCT.title))))
+        process.start()
+        value = queue.get(timeout=10)
+        process.join()
+
+        assert value == 'Test Dataset 1'
+        # The forked process doesn't remove the database
+        assert os.path.exists(g.store.path)
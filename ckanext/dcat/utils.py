@@ -39,6 +39,7 @@ DCAT_CLEAN_TAGS = 'ckanext.dcat.clean_tags'
 DEFAULT_CATALOG_ENDPOINT = '/catalog.{_format}'
 ENABLE_RDF_ENDPOINTS_CONFIG = 'ckanext.dcat.enable_rdf_endpoints'
 ENABLE_CONTENT_NEGOTIATION_CONFIG = 'ckanext.dcat.enable_content_negotiation'
+ENABLE_CATALOG_STREAMING_CONFIG = 'ckanext.dcat.enable_catalog_streaming'
 
 
 def _get_package_type(id):
@@ -442,13 +443,20 @@ def read_catalog_page(_format):
         'profiles': _profiles,
     }
 
+    context = {}
+    if catalog_streaming_enabled():
+        context['stream'] = True
+
     try:
-        response = toolkit.get_action('dcat_catalog_show')({}, data_dict)
+        response = toolkit.get_action('dcat_catalog_show')(context, data_dict)
     except (toolkit.ValidationError, RDFProfileException) as e:
         toolkit.abort(409, str(e))
 
-    from flask import make_response
-    response = make_response(response)
+    from flask import make_response, stream_with_context, Response
+    if context.get('stream'):
+        response = Response(stream_with_context(response))
+    else:
+        response = make_response(response)
     response.headers['Content-type'] = CONTENT_TYPES[_format]
 
     return response
@@ -458,5 +466,9 @@ def endpoints_enabled():
     return toolkit.asbool(config.get(ENABLE_RDF_ENDPOINTS_CONFIG, True))
 
 
+def catalog_streaming_enabled():
+    return toolkit.asbool(config.get(ENABLE_CATALOG_STREAMING_CONFIG, False))
+
+
 def get_endpoint(_type='dataset'):
     return 'dcat.read_dataset' if _type == 'dataset' else 'dcat.read_catalog'